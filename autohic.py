@@ -12,20 +12,28 @@
 import os
 import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 import torch
 import typer
 
 from src.assembly.adjust_all_error import adjust_all_error
+from src.common.cascade_detect import cascade_detect
+from src.common.cpu_infer import configure_cpu_threads
 from src.common.error_pd import infer_error
 from src.common.get_chr_fa import get_auto_hic_genome
-from src.common.mul_gen_png import mul_process
+from src.common.hic_cache import configure_matrix_cache
+from src.common.model_registry import DetectorRegistry
+from src.common.mul_gen_png import mul_process, mul_stream
+from src.common.res_plan import plan_hic_resolutions
+from src.common.tile_cache import CACHE_FILE, TileCache
 from src.report.gen_report import gen_report_cfg
 from src.utils import get_cfg
 from src.utils.check_genome import split_genome, check_genome
 from src.utils.get_chr_data import split_chr
 from src.utils.logger import logger
 from src.utils.plot_chr import plot_chr_inter, plot_chr
+from src.utils.stage_runner import StageRunner
 
 
 def whole(cfg_dir: str = typer.Option(..., "--config", "-c", help="autohic config file path")):
@@ -40,10 +48,41 @@ def whole(cfg_dir: str = typer.Option(..., "--config", "-c", help="autohic confi
     error_min_len = int(cfg_data["ERROR_MIN_LEN"])
     error_max_len = int(cfg_data["ERROR_MAX_LEN"])
     iou_score = float(cfg_data["ERROR_FILTER_IOU_SCORE"])
+    # stream tiles to detector without writing images (optional config item)
+    stream_tiles = cfg_data.get("STREAM_TILES", "False") == "True"
+    # coarse-to-fine detection, tiles are streamed too (optional config item)
+    cascade_detection = cfg_data.get("CASCADE_DETECTION", "False") == "True"
+    stream_tiles = stream_tiles or cascade_detection
+    # only generate tiles of planned resolutions (optional config item)
+    plan_resolution = cfg_data.get("PLAN_RESOLUTIONS", "False") == "True"
+    # tiles of each detector forward pass (optional config item)
+    batch_size = int(cfg_data.get("BATCH_SIZE", "4"))
+    # fp32, bf16 or int8 detector on CPU (optional config item)
+    cpu_precision = cfg_data.get("CPU_PRECISION", "fp32")
+    # channels-last detector on CPU, enable it after cpu_infer.accuracy_regression matches (optional config item)
+    cpu_channels_last = cfg_data.get("CPU_CHANNELS_LAST", "False") == "True"
+    # TorchScript error detector from export_model.py (optional config item)
+    runtime_model = cfg_data.get("ERROR_RUNTIME_MODEL") or None
+    # reuse detections of tiles unchanged since the previous adjust epoch (optional config item)
+    incremental = cfg_data.get("INCREMENTAL_DETECTION", "False") == "True"
+    # 3d-dna rounds whose tiles are generated at the same time, ahead of detection (optional config item)
+    prefetch_rounds = int(cfg_data.get("TILE_PREFETCH_ROUNDS", "1"))
+    if prefetch_rounds < 1:
+        logger.error("TILE_PREFETCH_ROUNDS must be at least 1.")
+        sys.exit(1)
+    if prefetch_rounds > 1 and stream_tiles:
+        # streamed tiles only live in memory of the detection stage, there are no tile files to generate ahead
+        logger.error("TILE_PREFETCH_ROUNDS > 1 needs tile files, set STREAM_TILES and CASCADE_DETECTION to False "
+                     "or TILE_PREFETCH_ROUNDS to 1.")
+        sys.exit(1)
     genome_name_without_extension, _ = os.path.splitext(os.path.basename(cfg_data["REFERENCE_GENOME"]))
 
     top_output_dir = os.path.join(cfg_data["RESULT_DIR"], cfg_data["JOB_NAME"])
 
+    # contact matrix caches of every epoch share one folder and size budget (optional config item)
+    configure_matrix_cache(os.path.join(top_output_dir, ".matrix_cache"),
+                           float(cfg_data.get("MATRIX_CACHE_GB", "4")) * 1024 ** 3)
+
     model_cfg = os.path.join(cfg_data["AutoHiC_DIR"], "src/models/cfgs/error_model.py")
     pretrained_model = cfg_data["ERROR_PRETRAINED_MODEL"]
 
@@ -56,6 +95,7 @@ def whole(cfg_dir: str = typer.Option(..., "--config", "-c", help="autohic confi
     device = ('cuda:0' if torch.cuda.is_available() else 'cpu')
     if device == 'cpu':
         logger.info("GPU is not available, AutoHiC will run on CPU\n")
+        configure_cpu_threads(int(cfg_data["N_CPU"]))
     else:
         logger.info("GPU is available, AutoHiC will run on GPU\n")
 
@@ -101,15 +141,125 @@ def whole(cfg_dir: str = typer.Option(..., "--config", "-c", help="autohic confi
     else:
         logger.info("Genome len < 80 base\n")
 
+    # stages run in order, a rerun skips the completed ones (optional config item)
+    runner = StageRunner(top_output_dir, resume=cfg_data.get("RESUME", "True") == "True")
+    n_cpu = int(cfg_data["N_CPU"])
+
+    # detectors are loaded on first use and shared by every epoch, or served by serve_model.py (optional config item)
+    registry = DetectorRegistry(device, cpu_precision, batch_size, n_cpu, server=cfg_data.get("DETECTOR_SERVER"),
+                                cpu_channels_last=cpu_channels_last)
+    registry.register("error", model_cfg, pretrained_model, runtime_model)
+    registry.register("chromosome", os.path.join(cfg_data["AutoHiC_DIR"], "src/models/cfgs/chr_model.py"),
+                      cfg_data["CHR_PRETRAINED_MODEL"], cfg_data.get("CHR_RUNTIME_MODEL"))
+    # release each detector after its last use (optional config item, for memory-constrained nodes)
+    resident_models = cfg_data.get("RESIDENT_MODELS", "True") == "True"
+    detect_params = {"score": score, "error_min_len": error_min_len, "error_max_len": error_max_len,
+                     "iou_score": iou_score, "stream_tiles": stream_tiles, "plan_resolution": plan_resolution,
+                     "cascade_detection": cascade_detection,
+                     "cpu_precision": cpu_precision if device == "cpu" else None,
+                     "cpu_channels_last": cpu_channels_last if device == "cpu" else None,
+                     "runtime_model": runtime_model}
+
+    def detect_stages(adjust_name, hic_file_path, adjust_path, previous_path=None, n_process=None, tiles_only=False,
+                      tiles_future=None):
+        """
+            tile generation and detection stages of one hic file
+        Args:
+            adjust_name: epoch name
+            hic_file_path: hic file path
+            adjust_path: epoch output path
+            previous_path: output path of the epoch hic file was adjusted from (incremental detection)
+            n_process: tile generation processes (default: N_CPU)
+            tiles_only: only run the tile stage (in a thread, ahead of detection)
+            tiles_future: future of the tiles_only call, the tile stage is not run again
+
+        Returns:
+            True when no error is detected
+        """
+        asy_file = hic_file_path.replace(".hic", ".assembly")
+        hic_img_dir = os.path.join(adjust_path, "png")
+        infer_result_dir = os.path.join(adjust_path, "infer_result")
+        tile_cache_file = os.path.join(adjust_path, CACHE_FILE)
+        previous_cache = os.path.join(previous_path, CACHE_FILE) if incremental and previous_path else None
+
+        def get_tile_cache():
+            if incremental:
+                return TileCache(hic_file_path, asy_file, previous_cache, score=score)
+            return None
+
+        def get_resolutions():
+            if plan_resolution:
+                return plan_hic_resolutions(hic_file_path, asy_file, error_min_len, error_max_len)
+            return None
+
+        def gen_tiles():
+            os.makedirs(adjust_path, exist_ok=True)
+            # tiles_only runs in a thread next to detection threads, fork is not safe there
+            mul_process(hic_file_path, "png", adjust_path, "dia", n_process or n_cpu, _resolutions=get_resolutions(),
+                        cached_tile=get_tile_cache().lookup if previous_cache else None,
+                        start_method="spawn" if tiles_only else None)
+
+        def detect():
+            os.makedirs(adjust_path, exist_ok=True)
+            tiles, cascade = None, None
+            tile_cache = get_tile_cache()
+            if cascade_detection:
+                cascade = cascade_detect(registry.get("error"), hic_file_path, adjust_path, n_cpu,
+                                         resolutions=get_resolutions(), score=score)
+            elif stream_tiles:
+                tiles = mul_stream(hic_file_path, "png", adjust_path, "dia", n_cpu, _resolutions=get_resolutions(),
+                                   cached_tile=tile_cache.lookup if previous_cache else None)
+
+            # get real chr len
+            hic_real_len = get_cfg.get_hic_real_len(hic_file_path, asy_file)
+
+            # detect hic img
+            logger.info(f"Detect the {adjust_name} file")
+            infer_return = infer_error(model_cfg, pretrained_model, hic_img_dir, adjust_path, device=device,
+                                       score=score,
+                                       error_min_len=error_min_len,
+                                       error_max_len=error_max_len, iou_score=iou_score, chr_len=hic_real_len,
+                                       tiles=tiles, batch_size=batch_size, workers=n_cpu,
+                                       detector=registry.get("error"), tile_cache=tile_cache, cascade=cascade)
+            logger.info(f"Detect the {adjust_name} file finished\n")
+
+            if infer_return:  # no detect error
+                get_cfg.write_no_error_json(os.path.join(adjust_path, "error_summary.json"))
+                os.makedirs(infer_result_dir, exist_ok=True)
+                get_cfg.write_no_error_infer_json(os.path.join(infer_result_dir, "infer_result.json"))
+                logger.info("No error detected")
+            return bool(infer_return)
+
+        tile_inputs = [hic_file_path, asy_file] + ([previous_cache] if previous_cache else [])
+        detect_inputs = tile_inputs + [runtime_model or pretrained_model]
+        detect_outputs = [os.path.join(adjust_path, "error_summary.json"), infer_result_dir]
+        detect_clean = [infer_result_dir]
+        if incremental:
+            detect_outputs.append(tile_cache_file)
+            detect_clean.append(tile_cache_file)
+        if stream_tiles:  # tiles only live in memory, generate them in the detection stage
+            detect_clean.append(hic_img_dir)
+        else:
+            if tiles_future is not None:
+                tiles_future.result()
+            else:
+                runner.run("tiles_" + adjust_name, gen_tiles, inputs=tile_inputs, outputs=[hic_img_dir],
+                           params={"plan_resolution": plan_resolution, "incremental": incremental},
+                           clean=[hic_img_dir], invalidate=not tiles_only)
+            detect_inputs.append(hic_img_dir)
+        if tiles_only:
+            return None
+
+        return runner.run("detect_" + adjust_name, detect, inputs=detect_inputs, outputs=detect_outputs,
+                          params=dict(detect_params, incremental=incremental), clean=detect_clean)
+
     # Stage 1: run Juicer + 3d-dna
     logger.info("Stage 1: Run Juicer and  3d-dna")
-    run_sh_dir = os.path.join(cfg_data["AutoHiC_DIR"], "src/common/run.sh")
-    run_sh = "bash " + run_sh_dir + " " + cfg_dir
-    get_cfg.subprocess_popen(run_sh)
-    logger.info("Run Juicer and  3d-dna finished\n")
 
-    # Stage 2: select the min error num hic file
-    logger.info("Stage 2: Select the min error number of  hic file\n")
+    def run_juicer_3d_dna():
+        run_sh_dir = os.path.join(cfg_data["AutoHiC_DIR"], "src/common/run.sh")
+        run_sh = "bash " + run_sh_dir + " " + cfg_dir
+        get_cfg.subprocess_popen(run_sh)
 
     # get hic file
     hic_file_dir = os.path.join(top_output_dir, "hic_results", "3d-dna")
@@ -118,42 +268,54 @@ def whole(cfg_dir: str = typer.Option(..., "--config", "-c", help="autohic confi
         filename = genome_name_without_extension + "." + str(epoch) + ".hic"
         hic_files.append(filename)
 
+    juicer_path = os.path.join(top_output_dir, "hic_results", "juicer", genome_name_without_extension)
+    merged_nodups_path = os.path.join(juicer_path, "aligned", "merged_nodups.txt")
+    runner.run("juicer_3d-dna", run_juicer_3d_dna, inputs=[original_genome, fastq_folder_path],
+               outputs=[merged_nodups_path] + [os.path.join(hic_file_dir, hic_file) for hic_file in hic_files] +
+                       [os.path.join(hic_file_dir, hic_file.replace(".hic", ".assembly")) for hic_file in hic_files],
+               params={key: cfg_data[key] for key in ("ENZYME", "NUMBER_OF_EDIT_ROUNDS")},
+               clean=[os.path.join(juicer_path, "aligned"), os.path.join(juicer_path, "splits"), hic_file_dir])
+    logger.info("Run Juicer and  3d-dna finished\n")
+
+    # Stage 2: select the min error num hic file
+    logger.info("Stage 2: Select the min error number of  hic file\n")
+
     # run autohic
     autohic_results = os.path.join(top_output_dir, "autohic_results")
     adjust_epoch = 0
     error_count_dict = {}
-    for hic_file in hic_files:
+
+    # tiles of the next rounds are generated in threads while the current round is detected by the shared detector,
+    # at most TILE_PREFETCH_ROUNDS rounds (the current one included) are in flight, so tile folders ahead are bounded
+    tiles_executor = None
+    tiles_futures = {}
+    if prefetch_rounds > 1:
+        tiles_executor = ThreadPoolExecutor(max_workers=prefetch_rounds)
+        n_process = max(n_cpu // prefetch_rounds, 1)
+        logger.info(f"Generate tiles of {prefetch_rounds} rounds at the same time, {n_process} processes each\n")
+
+    def prefetch_tiles(end):
+        for hic_file in hic_files[:end]:
+            adjust_name = hic_file.split(".")[1]
+            if adjust_name not in tiles_futures:
+                tiles_futures[adjust_name] = tiles_executor.submit(
+                    detect_stages, adjust_name, os.path.join(hic_file_dir, hic_file),
+                    os.path.join(autohic_results, adjust_name), n_process=n_process, tiles_only=True)
+
+    for round_index, hic_file in enumerate(hic_files):
+        if tiles_executor is not None:
+            prefetch_tiles(round_index + prefetch_rounds)
         adjust_name = hic_file.split(".")[1]
         logger.info(f"Check the {adjust_name} file")
         adjust_path = os.path.join(autohic_results, adjust_name)
-        os.mkdir(adjust_path)
 
-        # gen hic img
         hic_file_path = os.path.join(hic_file_dir, hic_file)
-        mul_process(hic_file_path, "png", adjust_path, "dia", int(cfg_data["N_CPU"]))
-
-        # get real chr len
         asy_file = hic_file_path.replace(".hic", ".assembly")
-        hic_real_len = get_cfg.get_hic_real_len(hic_file_path, asy_file)
-
-        # detect hic img
-        hic_img_dir = os.path.join(adjust_path, "png")
-        logger.info(f"Detect the {adjust_name} file")
-        infer_error_result = infer_error(model_cfg, pretrained_model, hic_img_dir, adjust_path, device=device,
-                                         score=score,
-                                         error_min_len=error_min_len,
-                                         error_max_len=error_max_len, iou_score=iou_score, chr_len=hic_real_len)
-        logger.info(f"Detect the {adjust_name} file finished\n")
+        detect_stages(adjust_name, hic_file_path, adjust_path, tiles_future=tiles_futures.get(adjust_name))
 
         # get error sum and error records dict
         error_summary_json = os.path.join(adjust_path, "error_summary.json")
 
-        if infer_error_result:  # no detect error
-            get_cfg.write_no_error_json(error_summary_json)
-            os.mkdir(os.path.join(adjust_path, "infer_result"))
-            get_cfg.write_no_error_infer_json(os.path.join(adjust_path, "infer_result", "infer_result.json"))
-            logger.info("No error detected")
-
         error_count_dict[adjust_name] = {
             "error_sum": get_cfg.get_error_sum(error_summary_json),
             "hic_file": hic_file_path,
@@ -164,6 +326,9 @@ def whole(cfg_dir: str = typer.Option(..., "--config", "-c", help="autohic confi
         logger.info(f"The {adjust_name} file done\n")
         adjust_epoch += 1
 
+    if tiles_executor is not None:
+        tiles_executor.shutdown()
+
     # select the min error num of hic file( default: according to the dict key)
     min_hic = min(error_count_dict, key=lambda k: error_count_dict[k]["error_sum"])
     final_adjust_path = error_count_dict[min_hic]["adjust_path"]
@@ -172,8 +337,6 @@ def whole(cfg_dir: str = typer.Option(..., "--config", "-c", help="autohic confi
     hic_error_records[hic_error_records_epoch].insert(0, os.path.join(final_adjust_path, "error_summary.xlsx"))
     hic_error_records_epoch += 1
 
-    merged_nodups_path = os.path.join(top_output_dir, "hic_results", "juicer", genome_name_without_extension, "aligned",
-                                      "merged_nodups.txt")
     adjust_hic_file = error_count_dict[min_hic]["hic_file"]
     adjust_asy_file = error_count_dict[min_hic]["assembly_file"]
     error_sum = error_count_dict[min_hic]["error_sum"]
@@ -188,16 +351,16 @@ def whole(cfg_dir: str = typer.Option(..., "--config", "-c", help="autohic confi
 
     # generate before adjust whole hic map png
     logger.info("Generate before adjust whole hic map png\n")
-    plot_chr(adjust_hic_file, genome_name="", chr_len_file=None, out_path=final_adjust_path,
-             fig_format="png")
     ctg_hic_map = os.path.join(final_adjust_path, "chromosome.png")
+    runner.run("ctg_map", lambda: plot_chr(adjust_hic_file, genome_name="", chr_len_file=None,
+                                           out_path=os.path.dirname(ctg_hic_map), fig_format="png"),
+               inputs=[adjust_hic_file], outputs=[ctg_hic_map])
 
     logger.info("Start iterating to adjust errors\n")
     first_flag = True
     while error_sum > 0:
         adjust_name = str(adjust_epoch)
         final_adjust_path = os.path.join(autohic_results, adjust_name)
-        os.mkdir(final_adjust_path)
 
         if first_flag:
             hic_file_path = error_count_dict[min_hic]["hic_file"]
@@ -213,45 +376,46 @@ def whole(cfg_dir: str = typer.Option(..., "--config", "-c", help="autohic confi
         inversion_flag = cfg_data["INVERSION_ADJUST"]
         debris_flag = cfg_data["DEBRIS_ADJUST"]
 
-        black_list_path = os.path.join(autohic_results, str(int(adjust_epoch) - 1), "black_list.txt")
-        if first_flag:
-            black_num_list = adjust_all_error(hic_file_path, asy_file_path, divided_error, mdy_asy_file,
-                                              black_list=None,
-                                              tran_flag=translocation_flag, inv_flag=inversion_flag,
-                                              deb_flag=debris_flag)
-            first_flag = False
-        else:
-            black_num_list = adjust_all_error(hic_file_path, asy_file_path, divided_error, mdy_asy_file,
-                                              black_list=black_list_path,
-                                              tran_flag=translocation_flag, inv_flag=inversion_flag,
-                                              deb_flag=debris_flag)
-
-        # run 3d-dna
-        adjust_log = os.path.join(top_output_dir, "logs", "epoch_" + adjust_name + ".log")
-        run_sh = "bash " + os.path.join(cfg_data["TD_DNA_DIR"],
-                                        "run-asm-pipeline-post-review.sh") + " -r " + mdy_asy_file + " " + \
-                 original_genome + " " + merged_nodups_path + " > " + adjust_log + " 2>&1"
-        get_cfg.subprocess_popen(run_sh, cwd=final_adjust_path)
-        # print(run_sh)
-
-        # generate hic img
-        hic_img_dir = os.path.join(final_adjust_path, "png")
+        black_list_path = None
+        if not first_flag:
+            black_list_path = os.path.join(autohic_results, str(int(adjust_epoch) - 1), "black_list.txt")
+        first_flag = False
+
+        def adjust(hic_file_path=hic_file_path, asy_file_path=asy_file_path, divided_error=divided_error,
+                   mdy_asy_file=mdy_asy_file, black_list_path=black_list_path, adjust_name=adjust_name,
+                   final_adjust_path=final_adjust_path):
+            os.makedirs(final_adjust_path)
+            black_num = adjust_all_error(hic_file_path, asy_file_path, divided_error, mdy_asy_file,
+                                         black_list=black_list_path,
+                                         tran_flag=translocation_flag, inv_flag=inversion_flag,
+                                         deb_flag=debris_flag)
+
+            # run 3d-dna
+            adjust_log = os.path.join(top_output_dir, "logs", "epoch_" + adjust_name + ".log")
+            run_sh = "bash " + os.path.join(cfg_data["TD_DNA_DIR"],
+                                            "run-asm-pipeline-post-review.sh") + " -r " + mdy_asy_file + " " + \
+                     original_genome + " " + merged_nodups_path + " > " + adjust_log + " 2>&1"
+            get_cfg.subprocess_popen(run_sh, cwd=final_adjust_path)
+            return black_num
+
+        adjust_inputs = [hic_file_path, asy_file_path, os.path.join(divided_error, "error_summary.json")]
+        if black_list_path is not None:
+            adjust_inputs.append(black_list_path)
         hic_file_path = os.path.join(final_adjust_path, genome_name_without_extension + ".final.hic")
         asy_file = hic_file_path.replace(".hic", ".assembly")
-        mul_process(hic_file_path, "png", final_adjust_path, "dia", int(cfg_data["N_CPU"]))
-
-        # infer error
-        hic_real_len = get_cfg.get_hic_real_len(hic_file_path, asy_file)
-        logger.info(f"Detect the {adjust_name} file")
-        infer_return = infer_error(model_cfg, pretrained_model, hic_img_dir, final_adjust_path, device=device,
-                                   score=score,
-                                   error_min_len=error_min_len,
-                                   error_max_len=error_max_len, iou_score=iou_score, chr_len=hic_real_len)
+        black_num_list = runner.run("adjust_" + adjust_name, adjust, inputs=adjust_inputs,
+                                    outputs=[mdy_asy_file, hic_file_path, asy_file],
+                                    params={"translocation": translocation_flag, "inversion": inversion_flag,
+                                            "debris": debris_flag},
+                                    clean=[final_adjust_path])
+
+        # generate hic img and infer error
+        hic_img_dir = os.path.join(final_adjust_path, "png")
+        infer_return = detect_stages(adjust_name, hic_file_path, final_adjust_path, previous_path=divided_error)
         if infer_return:  # no detect error
             adjust_hic_file = hic_file_path
             adjust_asy_file = asy_file
             break
-        logger.info(f"Detect the {adjust_name} file finished\n")
 
         # get error sum
         error_summary_json = os.path.join(final_adjust_path, "error_summary.json")
@@ -284,26 +448,39 @@ def whole(cfg_dir: str = typer.Option(..., "--config", "-c", help="autohic confi
             logger.info("Adjust 5 times at most, stop adjusting\n")
             break
     logger.info("Iterative tuning error completed\n")
+    if not resident_models:
+        registry.release("error")
 
     logger.info("Stage 3: Split chromosome\n")
     chr_adjust_path = os.path.join(autohic_results, "chromosome")
-    os.mkdir(chr_adjust_path)
-
-    # generate whole hic map png
-    logger.info("Generate adjusted whole hic map png\n")
-    plot_chr_inter(adjust_hic_file, adjust_asy_file, chr_adjust_path, fig_format="png")
-
-    # infer chromosome img
-    logger.info("Chromosome number detection\n")
-    img_path = os.path.join(chr_adjust_path, "chromosome.png")
-    chr_asy_file, chr_number = split_chr(img_path, adjust_asy_file, adjust_hic_file, cfg_dir, device=device)
-
-    # run 3d-dna to split chromosome
-    chr_adjust_log = os.path.join(top_output_dir, "logs", "chromosome_epoch.log")
-    run_sh = "bash " + os.path.join(cfg_data["TD_DNA_DIR"],
-                                    "run-asm-pipeline-post-review.sh") + " -r " + chr_asy_file + " " + \
-             original_genome + " " + merged_nodups_path + " > " + chr_adjust_log + " 2>&1"
-    get_cfg.subprocess_popen(run_sh, cwd=chr_adjust_path)
+    chr_hic_path = os.path.join(chr_adjust_path, genome_name_without_extension + ".final.hic")
+    final_chr_txt = os.path.join(chr_adjust_path, "chr.txt")
+
+    def split_chromosome():
+        os.makedirs(chr_adjust_path)
+
+        # generate whole hic map png
+        logger.info("Generate adjusted whole hic map png\n")
+        plot_chr_inter(adjust_hic_file, adjust_asy_file, chr_adjust_path, fig_format="png")
+
+        # infer chromosome img
+        logger.info("Chromosome number detection\n")
+        img_path = os.path.join(chr_adjust_path, "chromosome.png")
+        chr_asy, chr_num = split_chr(img_path, adjust_asy_file, adjust_hic_file, cfg_dir, device=device,
+                                     detector=registry.get("chromosome"))
+        if not resident_models:
+            registry.release("chromosome")
+
+        # run 3d-dna to split chromosome
+        chr_adjust_log = os.path.join(top_output_dir, "logs", "chromosome_epoch.log")
+        run_sh = "bash " + os.path.join(cfg_data["TD_DNA_DIR"],
+                                        "run-asm-pipeline-post-review.sh") + " -r " + chr_asy + " " + \
+                 original_genome + " " + merged_nodups_path + " > " + chr_adjust_log + " 2>&1"
+        get_cfg.subprocess_popen(run_sh, cwd=chr_adjust_path)
+        return chr_asy, chr_num
+
+    chr_asy_file, chr_number = runner.run("chromosome", split_chromosome, inputs=[adjust_hic_file, adjust_asy_file],
+                                          outputs=[chr_hic_path, final_chr_txt], clean=[chr_adjust_path])
     logger.info("Chromosome split completed\n")
 
     # Generate report
@@ -314,56 +491,59 @@ def whole(cfg_dir: str = typer.Option(..., "--config", "-c", help="autohic confi
         chr_fa_name_bak = genome_name_without_extension + "_HiC.fasta"
         chr_fa_path = os.path.join(chr_adjust_path, chr_fa_name_bak)
 
-    # delete last debris seq
     auto_hic_genome_path = os.path.join(chr_adjust_path, genome_name_without_extension + "_autohic.fasta")
-    get_auto_hic_genome(chr_fa_path, chr_number, auto_hic_genome_path)
+    quast_output = os.path.join(top_output_dir, "quast_output")
+    genome_link = os.path.join(top_output_dir, os.path.basename(auto_hic_genome_path))
 
-    # link genome
-    link_shell = "ln -s " + auto_hic_genome_path + " " + top_output_dir
-    get_cfg.subprocess_popen(link_shell)
+    def report():
+        # delete last debris seq
+        get_auto_hic_genome(chr_fa_path, chr_number, auto_hic_genome_path)
 
-    # run quast for chromosome-level genome
-    quast_output = os.path.join(top_output_dir, "quast_output")
-    os.mkdir(quast_output)
+        # link genome
+        os.symlink(auto_hic_genome_path, genome_link)
 
-    template_path = os.path.join(cfg_data["AutoHiC_DIR"], "src/report")
+        # run quast for chromosome-level genome
+        os.mkdir(quast_output)
 
-    ctg_extra_info["num_chr"] = chr_number
+        template_path = os.path.join(cfg_data["AutoHiC_DIR"], "src/report")
 
-    ctg_fa_path = original_genome
-    anchor_ratio = get_cfg.cal_anchor_rate(ctg_fa_path, auto_hic_genome_path)
-    autohic_extra_info = {'species': cfg_data["SPECIES_NAME"],
-                          'num_chr': chr_number,
-                          'anchor_ratio': anchor_ratio * 100,
-                          'inversion_len': get_cfg.get_error_len(
-                              os.path.join(final_adjust_path, "inversion_error.json")),
-                          'debris_len': get_cfg.get_error_len(
-                              os.path.join(final_adjust_path, "debris_error.json")),
-                          'translocation_len': get_cfg.get_error_len(
-                              os.path.join(final_adjust_path, "translocation_error.json"))}
+        ctg_extra_info["num_chr"] = chr_number
 
-    # get quast thread num
-    quast_thread = int(cfg_data["N_CPU"])
+        ctg_fa_path = original_genome
+        anchor_ratio = get_cfg.cal_anchor_rate(ctg_fa_path, auto_hic_genome_path)
+        autohic_extra_info = {'species': cfg_data["SPECIES_NAME"],
+                              'num_chr': chr_number,
+                              'anchor_ratio': anchor_ratio * 100,
+                              'inversion_len': get_cfg.get_error_len(
+                                  os.path.join(final_adjust_path, "inversion_error.json")),
+                              'debris_len': get_cfg.get_error_len(
+                                  os.path.join(final_adjust_path, "debris_error.json")),
+                              'translocation_len': get_cfg.get_error_len(
+                                  os.path.join(final_adjust_path, "translocation_error.json"))}
 
-    # generate after adjust whole hic map png
-    chr_hic_name = genome_name_without_extension + ".final.hic"
-    chr_hic_path = os.path.join(chr_adjust_path, chr_hic_name)
+        # get quast thread num
+        quast_thread = n_cpu
 
-    final_chr_txt = os.path.join(chr_adjust_path, "chr.txt")
-    plot_chr(chr_hic_path, genome_name="", chr_len_file=final_chr_txt, out_path=chr_adjust_path,
-             fig_format="png")
+        # generate after adjust whole hic map png
+        plot_chr(chr_hic_path, genome_name="", chr_len_file=final_chr_txt, out_path=chr_adjust_path,
+                 fig_format="png")
+
+        chr_hic_map = os.path.join(chr_adjust_path, "chromosome.png")
 
-    chr_hic_map = os.path.join(chr_adjust_path, "chromosome.png")
+        # get adjust error pairs for report
+        translocation_pairs, inversion_pairs, debris_pairs = get_cfg.get_error_pairs(
+            error_count_dict[min_hic]["adjust_path"])
 
-    # get adjust error pairs for report
-    translocation_pairs, inversion_pairs, debris_pairs = get_cfg.get_error_pairs(
-        error_count_dict[min_hic]["adjust_path"])
+        # generate report
+        gen_report_cfg(ctg_fa_path, auto_hic_genome_path, quast_output, ctg_extra_info, autohic_extra_info,
+                       quast_thread,
+                       ctg_hic_map,
+                       chr_hic_map, inversion_pairs, translocation_pairs, debris_pairs, hic_error_records,
+                       template_path, report_output=top_output_dir)
 
-    # generate report
-    gen_report_cfg(ctg_fa_path, auto_hic_genome_path, quast_output, ctg_extra_info, autohic_extra_info, quast_thread,
-                   ctg_hic_map,
-                   chr_hic_map, inversion_pairs, translocation_pairs, debris_pairs, hic_error_records,
-                   template_path, report_output=top_output_dir)
+    runner.run("report", report, inputs=[chr_hic_path, final_chr_txt],
+               outputs=[auto_hic_genome_path, os.path.join(top_output_dir, "result.html")],
+               clean=[auto_hic_genome_path, genome_link, quast_output])
     logger.info("Genome report completed\n")
     logger.info("AutoHiC finished\n")
 
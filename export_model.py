@@ -0,0 +1,35 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: export_model.py
+@time: 10/17/26 8:50 PM
+@function: export error / chromosome detector to TorchScript runtime
+"""
+
+import typer
+
+from src.common.detector_runtime import export_detector, verify_runtime
+
+
+def export_model(model_cfg: str = typer.Option(..., "--config", "-c",
+                                               help="model config path, src/models/cfgs/error_model.py or chr_model.py"),
+                 pretrained_model: str = typer.Option(..., "--pretrain-model", "-p", help="pretrained model path"),
+                 img_file: str = typer.Option(..., "--image", "-img",
+                                              help="sample tile, the runtime only accepts tiles of this size"),
+                 out_file: str = typer.Option("detector_runtime.pt", "--out-file", "-out", help="runtime output path"),
+                 img_path: str = typer.Option(None, "--check-tiles", "-check",
+                                              help="png folder with info.txt, compare runtime with the eager model"),
+                 tile_number: int = typer.Option(32, "--tile-number", "-n", help="tiles of the comparison")):
+    """
+        Export detector to TorchScript runtime (set ERROR_RUNTIME_MODEL / CHR_RUNTIME_MODEL in config to use it)
+    """
+    export_detector(model_cfg, pretrained_model, img_file, out_file)
+    if img_path is not None:
+        verify_runtime(model_cfg, pretrained_model, out_file, img_path, n_tiles=tile_number)
+
+
+if __name__ == "__main__":
+    typer.run(export_model)
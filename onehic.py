@@ -16,7 +16,7 @@ import typer
 
 from src.assembly.adjust_all_error import adjust_all_error
 from src.common.error_pd import infer_error
-from src.common.mul_gen_png import mul_process
+from src.common.mul_gen_png import mul_process, mul_stream
 from src.utils import get_cfg
 
 
@@ -33,7 +33,9 @@ def onehic(hic_file: str = typer.Option(..., "--hic-file", "-hic", help="hic fil
            error_max_len: int = typer.Option(20000000, "--max-len", "-max", help="error max length"),
            black_list: str = typer.Option(None, "--black-list", "-b", help="black list path"),
            score: float = typer.Option(0.9, "--scoree", "-s", help="score threshold"),
-           iou_score: float = typer.Option(0.8, "--iou-score", "-i", help="iou score threshold")):
+           iou_score: float = typer.Option(0.8, "--iou-score", "-i", help="iou score threshold"),
+           stream: bool = typer.Option(False, "--stream", "-stream",
+                                       help="stream tiles to the detector without writing images")):
     print("Check if the GPU is available")
     # check gpu whether available
     device = ('cuda:0' if torch.cuda.is_available() else 'cpu')
@@ -44,7 +46,11 @@ def onehic(hic_file: str = typer.Option(..., "--hic-file", "-hic", help="hic fil
 
     mdy_asy_file = os.path.join(out_path, "adjusted.assembly")
 
-    mul_process(hic_file, "png", out_path, "dia", threads)
+    tiles = None
+    if stream:
+        tiles = mul_stream(hic_file, "png", out_path, "dia", threads)
+    else:
+        mul_process(hic_file, "png", out_path, "dia", threads)
     hic_real_len = get_cfg.get_hic_real_len(hic_file, asy_file)
 
     # detect hic img
@@ -52,7 +58,8 @@ def onehic(hic_file: str = typer.Option(..., "--hic-file", "-hic", help="hic fil
     model_cfg = os.path.join(autohic, "src/models/cfgs/error_model.py")
     infer_error_result = infer_error(model_cfg, pretrained_model, hic_img_dir, out_path, device=device, score=score,
                                      error_min_len=error_min_len,
-                                     error_max_len=error_max_len, iou_score=iou_score, chr_len=hic_real_len)
+                                     error_max_len=error_max_len, iou_score=iou_score, chr_len=hic_real_len,
+                                     tiles=tiles)
 
     if infer_error_result:  # no detect error
         get_cfg.write_no_error_json(os.path.join(out_path, "error_summary.json"))
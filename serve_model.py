@@ -0,0 +1,51 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: serve_model.py
+@time: 10/17/26 10:10 PM
+@function: serve error / chromosome detectors to the autohic jobs of this node
+"""
+
+import os
+
+import torch
+import typer
+
+from src.common.cpu_infer import configure_cpu_threads
+from src.common.detector_server import serve_detectors
+from src.common.model_registry import DetectorRegistry
+from src.utils.get_cfg import get_cfg
+
+
+def serve_model(cfg_file: str = typer.Option(..., "--config", "-c", help="autohic config file (cfg-autohic.txt)"),
+                socket_path: str = typer.Option(None, "--socket", "-s",
+                                                help="Unix socket path (default: DETECTOR_SERVER of config)"),
+                max_batch: int = typer.Option(8, "--max-batch", "-b", help="max tiles of each forward pass"),
+                max_latency: float = typer.Option(0.05, "--max-latency", "-l",
+                                                  help="max seconds a tile waits for tiles of other jobs")):
+    """
+        Load error / chromosome detectors once and serve them on a Unix socket (set DETECTOR_SERVER in job configs)
+    """
+    cfg_data = get_cfg(cfg_file)
+    socket_path = socket_path or cfg_data.get("DETECTOR_SERVER")
+    if not socket_path:
+        raise typer.BadParameter("Set --socket or DETECTOR_SERVER in config")
+
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    n_cpu = int(cfg_data["N_CPU"])
+    if device == "cpu":
+        configure_cpu_threads(n_cpu)
+
+    registry = DetectorRegistry(device, cfg_data.get("CPU_PRECISION", "fp32"), max_batch, n_cpu, lazy=False)
+    registry.register("error", os.path.join(cfg_data["AutoHiC_DIR"], "src/models/cfgs/error_model.py"),
+                      cfg_data["ERROR_PRETRAINED_MODEL"], cfg_data.get("ERROR_RUNTIME_MODEL"))
+    registry.register("chromosome", os.path.join(cfg_data["AutoHiC_DIR"], "src/models/cfgs/chr_model.py"),
+                      cfg_data["CHR_PRETRAINED_MODEL"], cfg_data.get("CHR_RUNTIME_MODEL"))
+    serve_detectors(registry, socket_path, max_batch, max_latency)
+
+
+if __name__ == "__main__":
+    typer.run(serve_model)
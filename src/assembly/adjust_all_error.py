@@ -11,8 +11,7 @@
 
 import json
 import os
-import shutil
-from src.assembly.asy_operate import AssemblyOperate
+from src.assembly.asy_transaction import AssemblyTransaction
 from src.assembly.cut_errors_ctg import cut_errors_ctg
 from src.assembly.deb_adjust_v3 import adjust_debris
 from src.assembly.inv_adjust_v2 import adjust_inversion
@@ -41,13 +40,19 @@ def adjust_all_error(hic_file_path, asy_file_path, divided_error, modified_asy_f
     tran_black_num = 0
     inv_black_num = 0
 
+    # get ratio of hic file and assembly file (edits keep the assembly length)
+    ratio = get_ratio(hic_file_path, asy_file_path)
+
+    # cuts and moves of all errors are made on one in-memory assembly, modified_asy_file is written once
+    transaction = AssemblyTransaction(asy_file_path, ratio, modified_asy_file)
+
     # translocation rectify
     if os.path.exists(os.path.join(divided_error, "translocation_error.json")) and tran_flag:
         with open(os.path.join(divided_error, "translocation_error.json"), "r") as outfile:
             translocation_queue = outfile.read()
             translocation_queue = json.loads(translocation_queue)
 
-        cut_errors_ctg(translocation_queue, hic_file_path, asy_file_path, modified_asy_file)
+        cut_errors_ctg(translocation_queue, hic_file_path, asy_file_path, modified_asy_file, transaction)
         asy_file_path = modified_asy_file
         logger.info("Translocation rectify done\n")
     else:
@@ -59,7 +64,7 @@ def adjust_all_error(hic_file_path, asy_file_path, divided_error, modified_asy_f
             inversion_queue = outfile.read()
             inversion_queue = json.loads(inversion_queue)
 
-        cut_errors_ctg(inversion_queue, hic_file_path, asy_file_path, modified_asy_file)
+        cut_errors_ctg(inversion_queue, hic_file_path, asy_file_path, modified_asy_file, transaction)
         asy_file_path = modified_asy_file
         logger.info("Inversion rectify done")
     else:
@@ -71,15 +76,11 @@ def adjust_all_error(hic_file_path, asy_file_path, divided_error, modified_asy_f
             debris_queue = outfile.read()
             debris_queue = json.loads(debris_queue)
 
-        cut_errors_ctg(debris_queue, hic_file_path, asy_file_path, modified_asy_file)
+        cut_errors_ctg(debris_queue, hic_file_path, asy_file_path, modified_asy_file, transaction)
         logger.info("Debris rectify done")
     else:
         logger.info("No debris error")
 
-    # if not detect error, return old assembly file
-    if os.path.exists(modified_asy_file) is False:
-        shutil.copy(asy_file_path, modified_asy_file)
-
     # Define error info
     error_tran_info, error_inv_info, error_deb_info = None, None, None
 
@@ -90,37 +91,35 @@ def adjust_all_error(hic_file_path, asy_file_path, divided_error, modified_asy_f
     if os.path.exists(os.path.join(divided_error, "translocation_error.json")) and tran_flag:
         tran_black_num, error_tran_info = adjust_translocation(translocation_queue, hic_file_path, modified_asy_file,
                                                                black_list_output=black_list_output,
-                                                               black_list=black_list)
+                                                               black_list=black_list, asy_operate=transaction)
     # move inversion ctg
     if os.path.exists(os.path.join(divided_error, "inversion_error.json")) and inv_flag:
         inv_black_num, error_inv_info = adjust_inversion(inversion_queue, hic_file_path, modified_asy_file,
-                                                         black_list_output=black_list_output, black_list=black_list)
+                                                         black_list_output=black_list_output, black_list=black_list,
+                                                         asy_operate=transaction)
 
     # move debris ctg
     if os.path.exists(os.path.join(divided_error, "debris_error.json")) and deb_flag:
-        error_deb_info = adjust_debris(debris_queue, hic_file_path, modified_asy_file)
-
-    # get ratio of hic file and assembly file
-    ratio = get_ratio(hic_file_path, modified_asy_file)
-
-    # class AssemblyOperate class
-    asy_operate = AssemblyOperate(modified_asy_file, ratio)
+        error_deb_info = adjust_debris(debris_queue, hic_file_path, modified_asy_file, asy_operate=transaction)
 
     if os.path.exists(os.path.join(divided_error, "translocation_error.json")) and tran_flag:
         logger.info("Start moving translocation ctg\n")
-        asy_operate.moves_ctg(modified_asy_file, error_tran_info, modified_asy_file)
+        transaction.moves_ctg(modified_asy_file, error_tran_info, modified_asy_file)
         logger.info("Moving translocation ctg done\n")
 
     if os.path.exists(os.path.join(divided_error, "inversion_error.json")) and inv_flag:
         logger.info("Start moving inversion ctg\n")
-        asy_operate.inv_ctg_s(modified_asy_file, error_inv_info, modified_asy_file)
+        transaction.inv_ctg_s(modified_asy_file, error_inv_info, modified_asy_file)
         logger.info("Moving inversion ctg done\n")
 
     if os.path.exists(os.path.join(divided_error, "debris_error.json")) and deb_flag:
         logger.info("Start moving debris ctg\n")
-        asy_operate.move_deb_to_end(modified_asy_file, error_deb_info, modified_asy_file)
+        transaction.move_deb_to_end(modified_asy_file, error_deb_info, modified_asy_file)
         logger.info("Moving debris ctg done\n")
 
+    # validate and write modified assembly (the old assembly file when no error is detected)
+    transaction.commit(modified_asy_file)
+
     return [tran_black_num, inv_black_num, tran_black_num + inv_black_num]
 
 
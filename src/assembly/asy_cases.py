@@ -0,0 +1,334 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: asy_cases.py
+@time: 10/18/26 9:30 AM
+@function: recorded assembly edit cases, run with: python -m src.assembly.asy_cases
+"""
+
+import hashlib
+import json
+import os
+import random
+import tempfile
+from unittest import mock
+
+from src.assembly.asy_model import Assembly
+from src.assembly.asy_operate import AssemblyOperate
+from src.assembly.asy_transaction import AssemblyTransaction
+from src.utils.logger import logger
+
+# sha1 prefixes of out.assembly and black_list.txt of adjust_all_error on round_case(seed), written by the file-based
+# AssemblyOperate of each edit before edits were kept in memory
+ROUND_DIGESTS = {
+    0: ("30a76fbcd4660462", "d5f42191eec0b4b1"),
+    1: ("b0ebf3529fe7b5ee", "4f2385ce1132611e"),
+    2: ("8f549467a34397e9", "ea92d2b96568d368"),
+    3: ("a63b732315e9d194", "41658f39f752fdef"),
+    4: ("63e2854c732a710e", "266ccdaf8c95871b"),
+    5: ("c435e5caedd77821", "2f2c3756abbb6d7e"),
+    6: ("1885f35fa25901b6", "296360f91bcb075f"),
+    7: ("138b71cb9ed0455c", "efa47bf62b0ff97d"),
+    8: ("845fb464cb330148", "9bfc4b92d0a1e827"),
+    9: ("c5dda50f59b7f67f", "85a30540d4df38aa"),
+    10: ("a8aed156a855aa41", "0bc4181a14d8275f"),
+    11: ("f6e28d9882dea866", "d5e679bc74c56e5c"),
+    12: ("5afa56ad20dfdc0b", "445a48e5528423fb"),
+    13: ("b471721c4bc2970f", "735f2d69212210a9"),
+    14: ("ca619a85e0f5df18", "556a0866c54b954a"),
+    15: ("a86cd4d1644219a1", "52d1b1055efe2477"),
+    16: ("e7bbdc7babb231c1", "8361da6ef1921e73"),
+    17: ("614e19b0fa2eb3e8", "1bccc7a8422d22c0"),
+    18: ("a6fb35b6e7b581fd", "896ec58d7ff5336f"),
+    19: ("32a1c9a913ce600d", "b8c6d34022005b92"),
+    20: ("2a1d9618fb2f37e7", "73f1fbf6e466079e"),
+    21: ("77dca0af7666a1d1", "178bfb049dbc8a8f"),
+    22: ("af43e05cf3c9cfd8", "6d618ffe6dffdcd2"),
+    23: ("18c8d2d1113bd6f2", "c1b7285744eae649"),
+    24: ("d4bf3ff00da8873e", "3093f6db07b12b81"),
+}
+ROUND_RESOLUTIONS = [2500000, 500000, 100000, 10000]
+
+
+def write_assembly(lines, assembly_file_path):
+    """
+        write assembly file of a case
+    Args:
+        lines: header lines ">name number length" and scaffold lines
+        assembly_file_path: output file path
+
+    Returns:
+        assembly_file_path
+    """
+    with open(assembly_file_path, "w") as f:
+        f.writelines(line + "\n" for line in lines)
+    return assembly_file_path
+
+
+def read_lines(assembly_file_path):
+    with open(assembly_file_path, "r") as f:
+        return [line.rstrip("\n") for line in f]
+
+
+def case_bare_debris_cut(tmp_dir):
+    """
+        >scaffold_5:::debris has no :::fragment_N token, a cut gives :::fragment_1/2 pieces and leaves
+        >scaffold_6:::debris alone (it is not renumbered like a fragment sibling)
+    """
+    asy_file = write_assembly([">scaffold_5:::debris 1 1000", ">scaffold_6:::debris 2 800", "1 2"],
+                              os.path.join(tmp_dir, "bare_debris.assembly"))
+    assembly = Assembly.read(asy_file)
+    assembly.cut(">scaffold_5:::debris", [501])
+    out_file = os.path.join(tmp_dir, "bare_debris_cut.assembly")
+    assembly.write(out_file)
+
+    assert read_lines(out_file) == [">scaffold_5:::debris:::fragment_1 1 500",
+                                    ">scaffold_5:::debris:::fragment_2 2 500",
+                                    ">scaffold_6:::debris 3 800",
+                                    "1 2 3"], read_lines(out_file)
+    assert assembly.renamed(">scaffold_6:::debris") == ">scaffold_6:::debris"
+
+
+def case_fragment_recut(tmp_dir):
+    """
+        re cut of >ctg:::fragment_1 renumbers the later fragments of >ctg only, debris suffix is kept
+    """
+    asy_file = write_assembly([">ctg:::fragment_1 1 600", ">ctg:::fragment_2:::debris 2 400",
+                               ">scaffold_2 3 300", "1 -3", "2"],
+                              os.path.join(tmp_dir, "fragment.assembly"))
+    assembly = Assembly.read(asy_file)
+    assembly.cut(">ctg:::fragment_1", [201], recut=True)
+    out_file = os.path.join(tmp_dir, "fragment_cut.assembly")
+    assembly.write(out_file)
+
+    assert read_lines(out_file) == [">ctg:::fragment_1 1 200", ">ctg:::fragment_2 2 400",
+                                    ">ctg:::fragment_3:::debris 3 400", ">scaffold_2 4 300",
+                                    "1 2 -4", "3"], read_lines(out_file)
+    assert assembly.renamed(">ctg:::fragment_2:::debris") == ">ctg:::fragment_3:::debris"
+
+
+def case_renamed_edit_log(tmp_dir):
+    """
+        renamed follows the renames of every cut since the name was read, a name that was cut has no new name
+    """
+    asy_file = write_assembly([">ctg:::fragment_1 1 600", ">ctg:::fragment_2 2 400", ">ctg:::fragment_3 3 300",
+                               "1 2 3"], os.path.join(tmp_dir, "renamed.assembly"))
+    assembly = Assembly.read(asy_file)
+    assembly.cut(">ctg:::fragment_1", [301], recut=True)
+    since = len(assembly.edits)
+    assembly.invert(">ctg:::fragment_1")
+    assembly.cut(">ctg:::fragment_2", [101], recut=True)
+
+    # fragment_3 of the source is fragment_4 after the first cut and fragment_5 after the second one
+    assert assembly.renamed(">ctg:::fragment_3") == ">ctg:::fragment_5", assembly.renamed(">ctg:::fragment_3")
+    # fragment_3 read after the first cut (the source fragment_2) is fragment_4 now
+    assert assembly.renamed(">ctg:::fragment_3", since) == ">ctg:::fragment_4"
+    try:
+        assembly.renamed(">ctg:::fragment_1")
+    except KeyError:
+        pass
+    else:
+        raise AssertionError(">ctg:::fragment_1 is cut, it has no new name")
+
+
+def case_plain_cut_of_fragment(tmp_dir):
+    """
+        cut_ctg_s always cuts (:::fragment_N pieces), only re_cut_ctg_s renumbers fragments
+    """
+    asy_file = write_assembly([">ctg:::fragment_1 1 600", ">ctg:::fragment_2 2 400", "1 2"],
+                              os.path.join(tmp_dir, "plain.assembly"))
+    out_file = os.path.join(tmp_dir, "plain_cut.assembly")
+    AssemblyOperate(asy_file, 1).cut_ctg_s(asy_file, {">ctg:::fragment_1": 201}, out_file)
+
+    assert read_lines(out_file) == [">ctg:::fragment_1:::fragment_1 1 200", ">ctg:::fragment_1:::fragment_2 2 400",
+                                    ">ctg:::fragment_2 3 400", "1 2 3"], read_lines(out_file)
+
+
+def case_move_to_end_once(tmp_dir):
+    """
+        a ctg in several debris errors is moved to the end once (the file-based move_deb_to_end wrote it once for
+        each error, a duplicated ctg makes the assembly invalid)
+    """
+    asy_file = write_assembly([">a 1 100", ">b 2 100", ">c 3 100", "1 -2 3"],
+                              os.path.join(tmp_dir, "debris.assembly"))
+    AssemblyOperate(asy_file, 1).move_deb_to_end(asy_file, {"debris_0": {"deb_ctg": [">b"]},
+                                                            "debris_1": {"deb_ctg": [">b", ">c"]}}, asy_file)
+
+    assert read_lines(asy_file) == [">a 1 100", ">b 2 100", ">c 3 100", "1", "-2 3"], read_lines(asy_file)
+
+
+def case_insert_ctg_of_three(tmp_dir):
+    """
+        insert region over 3 ctg picks the max overlap, a middle ctg counts with its length (int, the file-based
+        search gave str lengths and max raised TypeError, the error was black listed)
+    """
+    from src.common.search_right_site_v8 import max_overlap_ctg
+
+    asy_file = write_assembly([">a 1 100", ">b 2 300", ">c 3 100", "1 2 3"], os.path.join(tmp_dir, "insert.assembly"))
+    asy_operate = AssemblyOperate(asy_file, 1)
+    contain_ctg = asy_operate.find_site_ctg_s(asy_file, 50, 450)
+
+    assert list(contain_ctg) == [">a", ">b", ">c"], list(contain_ctg)
+    assert list(max_overlap_ctg(contain_ctg, (50, 450))) == [">b"], max_overlap_ctg(contain_ctg, (50, 450))
+    assert list(max_overlap_ctg(contain_ctg, (-300, 450))) == [">a"], max_overlap_ctg(contain_ctg, (-300, 450))
+
+
+def case_transaction_paths(tmp_dir):
+    """
+        a transaction edits its source / target assembly in memory, other assembly paths are refused
+    """
+    asy_file = write_assembly([">a 1 100", ">b 2 100", "1 2"], os.path.join(tmp_dir, "source.assembly"))
+    other_file = write_assembly([">a 1 100", ">b 2 100", "2 1"], os.path.join(tmp_dir, "other.assembly"))
+    out_file = os.path.join(tmp_dir, "target.assembly")
+    transaction = AssemblyTransaction(asy_file, 1, out_file)
+    transaction.inv_ctg_s(asy_file, {"inversion_0": {"inv_ctg": [">a"]}}, out_file)
+    assert transaction.load(out_file) is transaction.load(asy_file)
+
+    try:
+        transaction.find_site_ctg_s(other_file, 1, 10)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("%s is not part of the transaction" % other_file)
+
+    transaction.commit()
+    assert read_lines(out_file) == [">a 1 100", ">b 2 100", "-1 2"], read_lines(out_file)
+
+
+def round_case(seed, case_dir):
+    """
+        seeded adjust round: 300 ctg assembly and up to 24 non overlapping errors of the 3 categories
+    Args:
+        seed: case seed
+        case_dir: folder of in.assembly and error json files
+
+    Returns:
+        assembly length
+    """
+    r = random.Random(seed)
+    n = 300
+    lengths = [r.randint(20000, 800000) for _ in range(n)]
+    orders = [i if r.random() < .7 else -i for i in range(1, n + 1)]
+    lines = [">ctg%d %d %d" % (i, i, lengths[i - 1]) for i in range(1, n + 1)]
+    k = 0
+    while k < n:
+        m = r.randint(5, 60)
+        lines.append(" ".join(map(str, orders[k:k + m])))
+        k += m
+    write_assembly(lines, os.path.join(case_dir, "in.assembly"))
+    total = sum(lengths)
+
+    r = random.Random(seed)
+    spots = sorted(r.sample(range(1, total // 200000 - 2), 24))
+    categories = {"translocation": [], "inversion": [], "debris": []}
+    for spot in spots:
+        start = spot * 200000 + r.randint(0, 50000)
+        end = start + r.randint(20000, 150000)
+        categories[r.choice(list(categories))].append((start, end))
+    for category, errors in categories.items():
+        if errors and r.random() < .9:
+            with open(os.path.join(case_dir, "%s_error.json" % category), "w") as f:
+                json.dump({"%s_%d" % (category, i): {"start": start, "end": end}
+                           for i, (start, end) in enumerate(errors)}, f)
+    return total
+
+
+def recorded_round(seed, tmp_dir):
+    """
+        adjust_all_error of round_case(seed) with recorded hic answers: the insert peak of an error is a hash of its
+        site, hic length is the assembly length (ratio 1)
+    Args:
+        seed: case seed
+        tmp_dir: temporary folder
+
+    Returns:
+        (out.assembly sha1 prefix, black_list.txt sha1 prefix)
+    """
+    import src.common.search_right_site_v8 as search_site
+    from src.assembly.adjust_all_error import adjust_all_error
+
+    case_dir = os.path.join(tmp_dir, "round_%s" % seed)
+    os.makedirs(case_dir)
+    total = round_case(seed, case_dir)
+
+    class Chrom:
+        name, length = "assembly", total
+
+    class RecordedHiC:
+        def __init__(self, *args):
+            pass
+
+        @staticmethod
+        def getChromosomes():
+            return [Chrom()]
+
+        @staticmethod
+        def getResolutions():
+            return ROUND_RESOLUTIONS
+
+    def insert_peak(matrix, error_site, fit_resolution, *args, **kwargs):
+        digest = int(hashlib.md5(str(error_site).encode()).hexdigest(), 16)
+        return digest % (total // fit_resolution - 2) + 1
+
+    with mock.patch("hicstraw.HiCFile", RecordedHiC), \
+            mock.patch.object(search_site, "get_full_len_matrix",
+                              lambda hic, asy, res, width, length=None: (width, length, res)), \
+            mock.patch.object(search_site, "get_insert_peak", insert_peak), \
+            mock.patch.object(search_site, "get_max_matrix_value", lambda matrix: (matrix[0][0] // 7) % 90):
+        adjust_all_error("recorded.hic", os.path.join(case_dir, "in.assembly"), case_dir,
+                         os.path.join(case_dir, "out.assembly"))
+
+    def digest_of(name):
+        path = os.path.join(case_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()[:16]
+
+    return digest_of("out.assembly"), digest_of("black_list.txt")
+
+
+def case_recorded_rounds(tmp_dir):
+    """
+        adjust rounds of one in-memory transaction write the same assembly and black list as the recorded
+        file-based edits
+    """
+    different = [seed for seed, digests in ROUND_DIGESTS.items() if recorded_round(seed, tmp_dir) != digests]
+    assert not different, "rounds differ from the recorded file-based edits: %s" % different
+
+
+CASES = [case_bare_debris_cut, case_fragment_recut, case_renamed_edit_log, case_plain_cut_of_fragment,
+         case_move_to_end_once, case_insert_ctg_of_three, case_transaction_paths, case_recorded_rounds]
+
+
+def run_cases(cases=None):
+    """
+        run recorded cases
+    Args:
+        cases: case functions (default: CASES)
+
+    Returns:
+        names of failed cases
+    """
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for case in cases or CASES:
+            try:
+                case(tmp_dir)
+            except AssertionError as e:
+                logger.error("%s failed: %s\n" % (case.__name__, e))
+                failed.append(case.__name__)
+    logger.info("Assembly cases: %s passed, %s failed\n" % (len(cases or CASES) - len(failed), len(failed)))
+    return failed
+
+
+def main():
+    if run_cases():
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,516 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: asy_model.py
+@time: 10/18/26 1:20 AM
+@function: in-memory assembly: contig table, signed scaffold orders and a prefix-sum coordinate index
+"""
+
+import re
+from bisect import bisect_right
+
+import numpy as np
+
+HEADER = np.dtype([("name", object), ("number", np.int64), ("length", np.int64)])  # header line of a contig
+FRAGMENT = re.compile(r"(.*:::fragment_)(\d+)")  # name head and fragment number of a cut contig
+
+
+def fragment_key(ctg_name):
+    """
+        fragment family of a contig name, fragments of one contig share the head and are numbered in contig order,
+        only names with a :::fragment_N token are fragments (>scaffold_5:::debris is not)
+    Args:
+        ctg_name: contig name with ">"
+
+    Returns:
+        (head, fragment number string), None when the contig is not a fragment
+    """
+    match = FRAGMENT.search(ctg_name)
+    return match.groups() if match else None
+
+
+class CtgSite(object):
+    """
+        Contig overlapping a searched assembly location
+    """
+    __slots__ = ("name", "length", "start", "end")
+
+    def __init__(self, name, length, start, end):
+        """
+        Args:
+            name: contig name with ">"
+            length: contig length
+            start: contig start (1-based)
+            end: contig end (inclusive)
+        """
+        self.name = name
+        self.length = length
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return "CtgSite(%s, length=%s, start=%s, end=%s)" % (self.name, self.length, self.start, self.end)
+
+
+class Assembly(object):
+    """
+        Contents of an assembly file. Edits (cut, invert, move) only change memory, write saves the file once.
+        Coordinates are 1-based and inclusive, same as AssemblyOperate.get_ctg_info site.
+        Header lines are one HEADER array, scaffold lines one signed order array, so renumbering is a masked add.
+    """
+
+    def __init__(self, table, orders, scaffold_ends):
+        """
+        Args:
+            table: HEADER array of contigs, in header order
+            orders: signed contig numbers of all scaffold lines, in assembly order
+            scaffold_ends: end of each scaffold line in orders
+        """
+        self.table = table
+        self.orders = orders
+        self.scaffold_ends = scaffold_ends
+
+        self.edits = []  # (operation, contig names) of each edit, in order
+        self._rows = None  # ({name: row}, header index of each row), rows stay while cuts move headers
+        self._headers = None  # header index of each number, rebuilt after a cut
+        self._index = None  # (end of each contig in assembly order, flat index of each number)
+        self._families = None  # {fragment head: {fragment number: name}}, kept up to date by cut
+
+    @classmethod
+    def read(cls, assembly_file_path):
+        """
+            parse assembly file
+        Args:
+            assembly_file_path: assembly file path
+
+        Returns:
+            Assembly
+        """
+        headers, orders, scaffold_ends = [], [], []
+        with open(assembly_file_path, "r") as f:
+            for line in f:
+                if line.startswith(">"):
+                    name, number, length = line.split()
+                    headers.append((name, int(number), int(length)))
+                else:
+                    orders += line.split()
+                    scaffold_ends.append(len(orders))
+        return cls(np.array(headers, dtype=HEADER), np.array(orders, dtype=np.int64),
+                   np.array(scaffold_ends, dtype=np.int64))
+
+    def write(self, out_file_path):
+        """
+            save assembly file
+        Args:
+            out_file_path: output file path
+
+        Returns:
+            None
+        """
+        tokens = self.orders.astype(str)
+        scaffold_starts = np.concatenate([[0], self.scaffold_ends[:-1]])
+        with open(out_file_path, "w") as f:
+            f.writelines("%s %s %s\n" % header for header in
+                         zip(self.names, self.numbers.tolist(), self.lengths.tolist()))
+            f.writelines(" ".join(tokens[start:end]) + "\n" for start, end in
+                         zip(scaffold_starts, self.scaffold_ends))
+
+    def copy(self):
+        assembly = Assembly(self.table.copy(), self.orders.copy(), self.scaffold_ends.copy())
+        assembly.edits = list(self.edits)
+        assembly._headers, assembly._index = self._headers, self._index  # replaced on edit, never changed
+        if self._rows is not None:
+            assembly._rows = (dict(self._rows[0]), self._rows[1].copy())
+        if self._families is not None:
+            assembly._families = {head: dict(family) for head, family in self._families.items()}
+        return assembly
+
+    def _changed(self):
+        self._index = None
+
+    @property
+    def names(self):
+        return self.table["name"]
+
+    @property
+    def numbers(self):
+        return self.table["number"]
+
+    @property
+    def lengths(self):
+        return self.table["length"]
+
+    @property
+    def scaffolds(self):
+        """
+            signed contig numbers of each scaffold line
+        """
+        scaffold_starts = np.concatenate([[0], self.scaffold_ends[:-1]])
+        return [self.orders[start:end].tolist() for start, end in zip(scaffold_starts, self.scaffold_ends)]
+
+    @staticmethod
+    def _positions(keys):
+        """
+            array of the index of each key, looked up by key (keys are contig numbers)
+        """
+        positions = np.zeros(keys.max(initial=0) + 1, dtype=np.int64)
+        positions[keys] = np.arange(len(keys))
+        return positions
+
+    @property
+    def rows(self):
+        """
+            name index, parsed once and updated by cut: ({name: row}, header index of each row)
+        """
+        if self._rows is None:
+            self._rows = (dict(zip(self.names.tolist(), range(len(self.table)))), np.arange(len(self.table)))
+        return self._rows
+
+    @property
+    def headers(self):
+        """
+            header index of each contig number
+        """
+        if self._headers is None:
+            self._headers = self._positions(self.numbers)
+        return self._headers
+
+    @property
+    def index(self):
+        """
+            prefix sums of contig lengths in assembly order, rebuilt after an edit
+        """
+        if self._index is None:
+            numbers = np.abs(self.orders)
+            self._index = (np.cumsum(self.lengths[self.headers[numbers]]), self._positions(numbers))
+        return self._index
+
+    @property
+    def families(self):
+        """
+            fragment index {fragment head: {fragment number: name}}, parsed once and updated by cut
+        """
+        if self._families is None:
+            self._families = {}
+            for name in self.names:
+                self._add_fragment(name)
+        return self._families
+
+    def _add_fragment(self, ctg_name):
+        key = fragment_key(ctg_name)
+        if key is not None:
+            self._families.setdefault(key[0], {})[int(key[1])] = ctg_name
+
+    def _remove_fragment(self, ctg_name):
+        key = fragment_key(ctg_name)
+        if key is not None:
+            self._families[key[0]].pop(int(key[1]), None)
+
+    def header(self, ctg_name):
+        """
+            header index of a contig
+        Args:
+            ctg_name: contig name (with or without ">")
+
+        Returns:
+            header index
+        """
+        if ctg_name.startswith(">") is False:
+            ctg_name = ">" + ctg_name
+        rows, header_of_row = self.rows
+        return int(header_of_row[rows[ctg_name]])
+
+    def seq_length(self):
+        return int(self.lengths.sum())
+
+    def _info(self, flat_index):
+        ends = self.index[0]
+        order = int(self.orders[flat_index])
+        header = self.headers[abs(order)]
+        start = int(ends[flat_index - 1]) + 1 if flat_index else 1
+        return {
+            "ctg_name": self.names[header],
+            "ctg_order": order,
+            "ctg_length": str(self.lengths[header]),
+            "site": (start, int(ends[flat_index]))
+        }
+
+    def ctg_info(self, ctg_name=None, ctg_order=None):
+        """
+            signed order and site of a contig, by name or by order
+        Args:
+            ctg_name: contig name
+            ctg_order: contig order
+
+        Returns:
+            {"ctg_name", "ctg_order", "ctg_length", "site"}
+        """
+        if ctg_name is not None:
+            ctg_order = self.numbers[self.header(ctg_name)]
+        return self._info(self.index[1][abs(int(ctg_order))])
+
+    def contigs_in(self, start, end):
+        """
+            contigs overlapping [start, end) by binary search on contig ends
+        Args:
+            start: assembly start
+            end: assembly end
+
+        Returns:
+            [CtgSite, ...] in assembly order
+        """
+        ends = self.index[0]
+        headers = self.headers
+        contigs = []
+        index = int(np.searchsorted(ends, start, side="left"))  # first contig ending at or after start
+        while index < len(ends):
+            ctg_start = int(ends[index - 1]) + 1 if index else 1
+            if ctg_start >= end:
+                break
+            # a contig ending exactly at start only counts when it also starts there
+            if ends[index] > start or ctg_start >= start:
+                header = headers[abs(self.orders[index])]
+                contigs.append(CtgSite(self.names[header], int(self.lengths[header]), ctg_start, int(ends[index])))
+            index += 1
+        return contigs
+
+    def cut(self, ctg_name, starts, recut=False):
+        """
+            split a contig into pieces, later contig numbers are shifted
+        Args:
+            ctg_name: contig name
+            starts: assembly sites where pieces after the first begin
+            recut: False: pieces are ctg_name:::fragment_N; True: ctg_name is a fragment, pieces take its number and
+                the next ones, later fragments of the same contig are renumbered
+
+        Returns:
+            None
+        """
+        info = self.ctg_info(ctg_name=ctg_name)
+        ctg_name, ctg_order = info["ctg_name"], info["ctg_order"]
+        number = abs(ctg_order)
+        flat_index = self.index[1][number]
+        site_start, site_end = info["site"]
+        bounds = [site_start] + list(starts) + [site_end + 1]
+        pieces = [bounds[i + 1] - bounds[i] for i in range(len(bounds) - 1)]  # in assembly order
+        shift = len(pieces) - 1
+        if ctg_order < 0:  # header lengths follow the contig, not the assembly
+            pieces.reverse()
+
+        families = self.families
+        key = fragment_key(ctg_name)
+        if recut:
+            if key is None:
+                raise ValueError("%s is not a fragment, it can not be re cut" % ctg_name)
+            head, fragment = key
+            suffix = ":::debris" if ctg_name.endswith("debris") else ""
+            piece_names = [head + fragment + suffix] + [head + str(int(fragment) + i) + suffix
+                                                        for i in range(1, len(pieces))]
+            # later fragments of the same contig are renumbered, only this family is visited
+            renames = {}
+            for sibling_fragment, name in families[head].items():
+                if sibling_fragment > int(fragment):
+                    renames[name] = head + str(sibling_fragment + shift) + \
+                                    (":::debris" if name.endswith("debris") else "")
+        else:
+            piece_names = [ctg_name + ":::fragment_%s" % (i + 1) for i in range(len(pieces))]
+            renames = {}
+
+        header = self.header(ctg_name)
+        for name in renames:
+            self.names[self.header(name)] = renames[name]
+        numbers = self.numbers
+        numbers[numbers > number] += shift
+        self.table = np.concatenate([self.table[:header],
+                                     np.array(list(zip(piece_names, range(number, number + len(pieces)), pieces)),
+                                              dtype=HEADER),
+                                     self.table[header + 1:]])
+
+        # renamed fragments keep their rows, pieces get new rows, later headers move by shift
+        rows, header_of_row = self.rows
+        renamed_rows = [rows.pop(name) for name in renames]
+        rows.update(zip(renames.values(), renamed_rows))
+        del rows[ctg_name]
+        header_of_row[header_of_row > header] += shift
+        rows.update(zip(piece_names, range(len(header_of_row), len(header_of_row) + len(pieces))))
+        self._rows = (rows, np.concatenate([header_of_row, header + np.arange(len(pieces))]))
+        self._headers = None
+
+        for name in [ctg_name] + list(renames):
+            self._remove_fragment(name)
+        for name in piece_names + list(renames.values()):
+            self._add_fragment(name)
+
+        # pieces replace the contig in its scaffold, later contig orders move away from 0 by shift
+        if ctg_order > 0:
+            split = np.arange(ctg_order, ctg_order + len(pieces))
+        else:
+            split = np.arange(ctg_order - shift, ctg_order + 1)
+        orders = self.orders
+        later = np.abs(orders) > number
+        orders[later] += np.sign(orders[later]) * shift
+        self.orders = np.concatenate([orders[:flat_index], split, orders[flat_index + 1:]])
+        self.scaffold_ends[self.scaffold_ends > flat_index] += shift
+        self.edits.append(("cut", ctg_name, piece_names, renames))
+        self._changed()
+
+    def renamed(self, ctg_name, since=0):
+        """
+            name of a contig now, re cuts renumber later fragments of the same contig
+        Args:
+            ctg_name: contig name when the assembly had since edits
+            since: len(edits) when ctg_name was read (default: 0, name of the unedited assembly)
+
+        Returns:
+            contig name now
+        """
+        for edit in self.edits[since:]:
+            if edit[0] == "cut":
+                if ctg_name == edit[1]:
+                    raise KeyError("%s is cut into %s" % (ctg_name, ", ".join(edit[2])))
+                ctg_name = edit[3].get(ctg_name, ctg_name)
+        return ctg_name
+
+    def lineage(self, ctg_name):
+        """
+            fragments an original contig is cut into, over every round of edits (fragment names keep the lineage)
+        Args:
+            ctg_name: original contig name, eg: >ctg of >ctg:::fragment_2
+
+        Returns:
+            [(fragment name, offset in original contig, fragment length), ...] in original contig order
+        """
+        if ctg_name.startswith(">") is False:
+            ctg_name = ">" + ctg_name
+        family = self.families.get(ctg_name + ":::fragment_")
+        if not family:  # never cut
+            return [(ctg_name, 0, int(self.lengths[self.header(ctg_name)]))]
+
+        lineage, offset = [], 0
+        for fragment in sorted(family):
+            length = int(self.lengths[self.header(family[fragment])])
+            lineage.append((family[fragment], offset, length))
+            offset += length
+        return lineage
+
+    def locate(self, ctg_name, base):
+        """
+            where a base of an original contig is in the assembly now
+        Args:
+            ctg_name: original contig name
+            base: 0-based offset in original contig
+
+        Returns:
+            (fragment name, assembly site of the base)
+        """
+        lineage = self.lineage(ctg_name)
+        index = bisect_right([offset for _, offset, _ in lineage], base) - 1
+        name, offset, length = lineage[index]
+        if not 0 <= base - offset < length:
+            raise ValueError("Base %s is out of %s" % (base, ctg_name))
+        info = self.ctg_info(ctg_name=name)
+        site_start, site_end = info["site"]
+        return name, site_start + base - offset if info["ctg_order"] > 0 else site_end - (base - offset)
+
+    def invert(self, ctg_name):
+        """
+            reverse a contig in its scaffold
+        Args:
+            ctg_name: contig name
+
+        Returns:
+            None
+        """
+        ctg_order = self.ctg_info(ctg_name=ctg_name)["ctg_order"]
+        self.orders[self.index[1][abs(ctg_order)]] = -ctg_order
+        self.edits.append(("invert", ctg_name))
+        self._changed()
+
+    def _remove(self, orders):
+        """
+            remove contigs from their scaffolds
+        Args:
+            orders: signed contig orders
+
+        Returns:
+            sorted flat indexes the contigs had
+        """
+        removed = np.unique(self.index[1][np.abs(np.array(orders, dtype=np.int64))])
+        self.orders = np.delete(self.orders, removed)
+        self.scaffold_ends = self.scaffold_ends - np.searchsorted(removed, self.scaffold_ends)
+        return removed
+
+    def move(self, ctg_names, insert_ctg, direction):
+        """
+            move contigs next to another contig, same as AssemblyOperate.moves_ctg for one error
+        Args:
+            ctg_names: moved contig names, in the order they are inserted
+            insert_ctg: contig name of the insert site
+            direction: "left" or "right" of insert contig
+
+        Returns:
+            None
+        """
+        move_orders = [self.ctg_info(ctg_name=name)["ctg_order"] for name in ctg_names]
+        insert_order = self.ctg_info(ctg_name=insert_ctg)["ctg_order"]
+
+        insert_index = self.index[1][abs(insert_order)]
+        removed = self._remove(move_orders)
+        insert_index -= np.searchsorted(removed, insert_index)
+
+        # the scaffold of insert contig and the later ones end later
+        self.scaffold_ends[self.scaffold_ends > insert_index] += len(move_orders)
+        if direction != "left":
+            insert_index += 1
+        self.orders = np.insert(self.orders, insert_index, move_orders)
+        self.edits.append(("move", list(ctg_names), insert_ctg, direction))
+        self._changed()
+
+    def move_to_end(self, ctg_names):
+        """
+            move contigs (debris) to a new last scaffold
+        Args:
+            ctg_names: contig names
+
+        Returns:
+            None
+        """
+        # a contig of several debris errors is moved once
+        end_orders = list(dict.fromkeys(self.ctg_info(ctg_name=name)["ctg_order"] for name in ctg_names))
+        self._remove(end_orders)
+        self.orders = np.concatenate([self.orders, np.array(end_orders, dtype=np.int64)])
+        self.scaffold_ends = np.append(self.scaffold_ends, len(self.orders))
+        self.edits.append(("move_to_end", list(ctg_names)))
+        self._changed()
+
+    def validate(self, seq_length=None):
+        """
+            check the assembly is consistent: unique names and numbers, every contig once in the scaffolds
+        Args:
+            seq_length: expected total length (default: not checked)
+
+        Returns:
+            None, raise ValueError when the assembly is broken
+        """
+        problems = []
+        if len(set(self.names.tolist())) != len(self.names):
+            problems.append("duplicate ctg names")
+        if not np.array_equal(np.sort(self.numbers), np.arange(1, len(self.numbers) + 1)):
+            problems.append("ctg numbers are not 1 - %s" % len(self.numbers))
+        if not np.array_equal(np.sort(np.abs(self.orders)), np.sort(self.numbers)):
+            problems.append("scaffolds do not contain every ctg exactly once")
+        if seq_length is not None and self.seq_length() != seq_length:
+            problems.append("total length %s != %s" % (self.seq_length(), seq_length))
+        if problems:
+            raise ValueError("Invalid assembly: %s" % ", ".join(problems))
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -8,10 +8,10 @@
 @time: 2/23/23 4:14 PM
 @function: assembly file operate class
 """
-import json
-import re
+import os
 from collections import OrderedDict
 
+from src.assembly.asy_model import Assembly, fragment_key
 from src.utils.logger import logger
 
 
@@ -25,6 +25,55 @@ class AssemblyOperate(object):
         self.assembly_file_path = assembly_file_path
         self.ratio = ratio  # thr ratio between assembly and hic
 
+        # parsed assembly files {path: ((mtime, size), Assembly)}, a file changed by others is parsed again
+        self.assemblies = {}
+
+    @staticmethod
+    def _stat(assembly_file_path):
+        stat = os.stat(assembly_file_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self, assembly_file_path=None) -> Assembly:
+        """
+            in-memory assembly of a file, parsed once while the file is unchanged
+        Args:
+            assembly_file_path: assembly file path (default: current assembly file path)
+
+        Returns:
+            Assembly (do not edit, see edit)
+        """
+        assembly_file_path = assembly_file_path or self.assembly_file_path
+        stat = self._stat(assembly_file_path)
+        cached = self.assemblies.get(assembly_file_path)
+        if cached is None or cached[0] != stat:
+            cached = (stat, Assembly.read(assembly_file_path))
+            self.assemblies[assembly_file_path] = cached
+        return cached[1]
+
+    def edit(self, assembly_file_path) -> Assembly:
+        """
+            assembly of a file to edit, the cached one is kept for the file
+        Args:
+            assembly_file_path: assembly file path
+
+        Returns:
+            Assembly copy
+        """
+        return self.load(assembly_file_path).copy()
+
+    def save(self, assembly, out_file_path):
+        """
+            write an edited assembly and keep it for the next reads of out_file_path
+        Args:
+            assembly: Assembly
+            out_file_path: output file path
+
+        Returns:
+            None
+        """
+        assembly.write(out_file_path)
+        self.assemblies[out_file_path] = (self._stat(out_file_path), assembly)
+
     def get_info(self, new_asy_file=None) -> dict:
         """
             Get basic information of assembly file
@@ -34,28 +83,17 @@ class AssemblyOperate(object):
         Returns:
             assembly_info: assembly information
         """
-        ctg_number = 0  # ctg number
-        seqs_length = 0  # sequence total length
-
         # when new_asy_file is not None
         if new_asy_file is not None:
             # renew assembly file path
             self.assembly_file_path = new_asy_file
 
-        # get ctg number and total length
-        with open(self.assembly_file_path, "r") as f:
-            for line in f:
-                if line.startswith(">"):
-                    ctg_number += 1
-
-                    # get ctg length
-                    seq_length = line.strip().split()[2]
-                    seqs_length += int(seq_length)
+        assembly = self.load()
 
         assembly_info = {
             "assembly_file": self.assembly_file_path,
-            "ctg_number": ctg_number,
-            "seq_length": seqs_length
+            "ctg_number": len(assembly.names),
+            "seq_length": assembly.seq_length()
         }
 
         return assembly_info
@@ -77,91 +115,15 @@ class AssemblyOperate(object):
             logger.error("Query field ctg name or ctg order not find \n")
             raise ValueError("Ctg name or ctg order must be specified")
 
-        ctg_infos = {}  # ctg information
-        ctg_orders = []  # ctg order
-
         # when new_asy_file is not None
         if new_asy_file is not None:
             self.assembly_file_path = new_asy_file
 
-        # get basic information
-        with open(self.assembly_file_path, "r") as f:
-            for line in f:
-                if line.startswith(">"):
-                    temp_line = line.strip().split()
-                    ctg_infos[temp_line[1]] = {
-                        "ctg_name": temp_line[0],
-                        "length": temp_line[2]
-                    }
-                else:
-                    for order in line.strip("\n").split(" "):
-                        try:
-                            ctg_orders.append(int(order))
-                        except ValueError:  # 如果是空的，则跳过
-                            print("Warning: order is empty, please check assembly file")
-
-        ctg_length = 1  # Calculated total ctg length
-
-        ctg_by_name = {}  # ctg information dict by name
-        ctg_by_order = {}  # ctg information dict by order
-
-        # format ctg information
-        for ctg_order in ctg_orders:
-            abs_ctg_order = abs(ctg_order)
-            ctg_by_name[ctg_infos[str(abs_ctg_order)]["ctg_name"]] = {
-                "ctg_name": ctg_infos[str(abs_ctg_order)]["ctg_name"],
-                "ctg_order": ctg_order,
-                "ctg_length": ctg_infos[str(abs_ctg_order)]["length"],
-                "site": (ctg_length, ctg_length - 1 + int(ctg_infos[str(abs_ctg_order)]["length"]))
-            }
-
-            ctg_by_order[abs_ctg_order] = {
-                "ctg_name": ctg_infos[str(abs_ctg_order)]["ctg_name"],
-                "ctg_order": ctg_order,
-                "ctg_length": ctg_infos[str(abs_ctg_order)]["length"],
-                "site": (ctg_length, ctg_length - 1 + int(ctg_infos[str(abs_ctg_order)]["length"]))
-            }
-
-            ctg_length += int(ctg_infos[str(abs_ctg_order)]["length"])
-
-        if ctg_name is not None:
-            if ctg_name.startswith(">") is False:
-                ctg_name = ">" + ctg_name
-
-            return ctg_by_name[ctg_name]
-        else:
-            return ctg_by_order[ctg_order]
-
-    @staticmethod
-    def _get_ctg_orders(assembly_file_path):
-        """
-            Get all ctg orders
-        Args:
-            assembly_file_path: assembly file path
-
-        Returns:
-            ctg_orders: all ctg_s and orders
-        """
-        ctg_s = OrderedDict()  # ctg_s information
-        ctg_orders = []  # ctg_s orders
-
-        # get ctg number and total length
-        with open(assembly_file_path, "r") as f:
-            for line in f:
-                if line.startswith(">"):
-                    temp_line = line.strip().split()
-                    ctg_s[temp_line[0]] = {
-                        "order": temp_line[1],
-                        "length": temp_line[2]
-                    }
-                else:
-                    temp_line = line.strip().split(" ")
-                    ctg_orders.append(temp_line)
-        return ctg_s, ctg_orders
+        return self.load().ctg_info(ctg_name=ctg_name, ctg_order=ctg_order)
 
     def cut_ctg_s(self, assembly_file_path, cut_ctg, out_file_path):
         """
-            Cut ctg by ctg name
+            Cut ctg by ctg name, pieces are ctg:::fragment_1 and ctg:::fragment_2 (a fragment: see re_cut_ctg_s)
         Args:
             assembly_file_path: assembly file path
             cut_ctg: cut ctg name （ctg_name: cut_site）
@@ -170,74 +132,14 @@ class AssemblyOperate(object):
         Returns:
 
         """
+        self.assembly_file_path = assembly_file_path
+        assembly = self.edit(assembly_file_path)
 
-        # get original ctg_s information
-        ctg_s, ctg_orders = self._get_ctg_orders(assembly_file_path)
-
-        # Declare variables (in case of subsequent reminders)
-        cut_ctg_name, cut_ctg_site = None, None
-
-        # get cut ctg information
-        for key, values in cut_ctg.items():
-            cut_ctg_name = key
-            cut_ctg_site = values
-
-        # calculated new information of cut ctg
-        cut_ctg_info = self.get_ctg_info(ctg_name=cut_ctg_name, new_asy_file=assembly_file_path)
-
-        # get cut_ctg order (True: positive, False: negative)
-        cut_ctg_order = cut_ctg_info["ctg_order"]
-
-        # calculated cut start and end site
-        cut_ctg_site1 = cut_ctg_site - cut_ctg_info["site"][0]
-        cut_ctg_site2 = cut_ctg_info["site"][1] - cut_ctg_site + 1
-
-        with open(out_file_path, "w") as f:
-            # write new ctg information
-            for key, value in ctg_s.items():
-                if key == cut_ctg_name:
-                    # when ctg order is positive
-                    if int(cut_ctg_order) > 0:
-                        f.write(key + ":::fragment_1 " + value["order"] + " " + str(cut_ctg_site1) + "\n")
-                        temp_order = int(value["order"]) + 1
-                        f.write(key + ":::fragment_2" + " " + str(temp_order) + " " + str(cut_ctg_site2) + "\n")
-                    else:
-                        f.write(key + ":::fragment_1 " + value["order"] + " " + str(cut_ctg_site2) + "\n")
-                        temp_order = int(value["order"]) + 1
-                        f.write(key + ":::fragment_2" + " " + str(temp_order) + " " + str(cut_ctg_site1) + "\n")
-                else:
-                    # cut ctg divides into two and then increase back ctg order
-                    if int(value["order"]) > abs(int(cut_ctg_order)):
-                        temp_order = int(value["order"]) + 1
-                        f.write(key + " " + str(temp_order) + " " + value["length"] + "\n")
-                    else:
-                        f.write(key + " " + value["order"] + " " + value["length"] + "\n")
-
-            # write new ctg order information
-            for ctg_order in ctg_orders:
-                temp_write_list = []
-                for x in ctg_order:
-                    # update cut ctg order
-                    if int(x) == int(cut_ctg_order):
-                        if cut_ctg_order > 0:  # when ctg order is positive
-                            temp = cut_ctg_order + 1
-                            temp_write_list.append(str(cut_ctg_order))
-                            temp_write_list.append(str(temp))
-                        else:  # when ctg order is negative
-                            temp = cut_ctg_order - 1
-                            temp_write_list.append(str(temp))
-                            temp_write_list.append(str(cut_ctg_order))
-                    else:  # the rest ctg order + 1
-                        if abs(int(x)) > abs(int(cut_ctg_order)):
-                            if int(x) > 0:
-                                temp = int(x) + 1
-                                temp_write_list.append(str(temp))
-                            else:
-                                temp = int(x) - 1
-                                temp_write_list.append(str(temp))
-                        else:
-                            temp_write_list.append(str(x))
-                f.write(" ".join(temp_write_list) + "\n")
+        # get cut ctg information (last item of cut_ctg)
+        cut_ctg_name, cut_ctg_site = list(cut_ctg.items())[-1]
+        assembly.cut(cut_ctg_name, [cut_ctg_site], recut=False)
+
+        self.save(assembly, out_file_path)
 
     def re_cut_ctg_s(self, assembly_file_path, cut_ctg, out_file_path):
         """
@@ -250,111 +152,26 @@ class AssemblyOperate(object):
         Returns:
             None
         """
-        # get original ctg_s information
-        ctg_s, ctg_orders = self._get_ctg_orders(assembly_file_path)
-
-        # Declare variables (in case of subsequent reminders)
-        cut_ctg_name, cut_ctg_site = None, None
-
-        # get cut ctg information
-        for key, values in cut_ctg.items():
-            cut_ctg_name = key  # get cut ctg name
-            cut_ctg_site = values  # get cut ctg site
-
-        # get re_cut ctg name head
-        cut_ctg_name_head = re.search(r"(.*_)(\d+)", cut_ctg_name).group(1)
-        # get re_cut ctg name fragment order(fragment_X)
-        cut_ctg_name_order = re.search(r"(.*_)(\d+)", cut_ctg_name).group(2)
-
-        # get re_cut ctg information
-        cut_ctg_info = self.get_ctg_info(ctg_name=cut_ctg_name, new_asy_file=assembly_file_path)
-
-        # get re_cut ctg order (True: positive, False: negative)
-        cut_ctg_order = cut_ctg_info["ctg_order"]
-
-        # calculated re_cut start and end site
-        cut_ctg_site1 = cut_ctg_site - cut_ctg_info["site"][0]
-        cut_ctg_site2 = cut_ctg_info["site"][1] - cut_ctg_site + 1
-
-        with open(out_file_path, "w") as f:
-            # write new ctg order information
-            for key, value in ctg_s.items():
-                if key.startswith(cut_ctg_name_head):
-                    head = re.search(r"(.*_)(\d+)", key).group(1)
-                    order = re.search(r"(.*_)(\d+)", key).group(2)
-
-                    # Direct writing of the previous ctg
-                    if int(order) < int(cut_ctg_name_order):
-                        f.write(key + " " + value["order"] + " " + value["length"] + "\n")
-
-                    # if ctg is re_cut ctg
-                    elif order == cut_ctg_name_order:
-                        temp_order = int(value["order"]) + 1
-                        # when ctg order is positive
-                        if int(cut_ctg_order) > 0:
-                            if key.endswith("debris"):
-                                f.write(head + order + ":::debris " + value["order"] + " " + str(cut_ctg_site1) + "\n")
-
-                                f.write(head + str(int(order) + 1) + ":::debris " + str(temp_order) + " " + str(
-                                    cut_ctg_site2) + "\n")
-                            else:
-                                f.write(head + order + " " + value["order"] + " " + str(cut_ctg_site1) + "\n")
-
-                                f.write(head + str(int(order) + 1) + " " + str(temp_order) + " " + str(
-                                    cut_ctg_site2) + "\n")
-                        else:
-                            if key.endswith("debris"):
-                                f.write(head + order + ":::debris " + value["order"] + " " + str(cut_ctg_site2) + "\n")
-
-                                f.write(head + str(int(order) + 1) + ":::debris " + str(temp_order) + " " + str(
-                                    cut_ctg_site1) + "\n")
-                            else:
-                                f.write(head + order + " " + value["order"] + " " + str(cut_ctg_site2) + "\n")
-
-                                f.write(head + str(int(order) + 1) + " " + str(temp_order) + " " + str(
-                                    cut_ctg_site1) + "\n")
-
-                    else:  # the rest ctg order + 1
-                        temp_order = int(value["order"]) + 1
-                        if key.endswith("debris"):
-                            f.write(head + str(int(order) + 1) + ":::debris " + str(temp_order) + " " + value[
-                                "length"] + "\n")
-                        else:
-                            f.write(
-                                head + str(int(order) + 1) + " " + str(temp_order) + " " + value["length"] + "\n")
-                else:
-                    # cut ctg divides into two and then increase back ctg order
-                    if int(value["order"]) > abs(int(cut_ctg_order)):
-                        temp_order = int(value["order"]) + 1
-                        f.write(key + " " + str(temp_order) + " " + value["length"] + "\n")
-                    else:
-                        f.write(key + " " + value["order"] + " " + value["length"] + "\n")
-
-            # write new ctg order information
-            for ctg_order in ctg_orders:
-                temp_write_list = []
-                for x in ctg_order:
-                    # update re_cut ctg order
-                    if int(x) == cut_ctg_order:
-                        if cut_ctg_order > 0:
-                            temp = cut_ctg_order + 1
-                            temp_write_list.append(str(cut_ctg_order))
-                            temp_write_list.append(str(temp))
-                        else:  # when re_cut ctg order is negative
-                            temp = cut_ctg_order - 1
-                            temp_write_list.append(str(temp))
-                            temp_write_list.append(str(cut_ctg_order))
-                    else:  # the rest ctg order + 1
-                        if abs(int(x)) > abs(cut_ctg_order):
-                            if int(x) > 0:
-                                temp = int(x) + 1
-                                temp_write_list.append(str(temp))
-                            else:
-                                temp = int(x) - 1
-                                temp_write_list.append(str(temp))
-                        else:
-                            temp_write_list.append(str(x))
-                f.write(" ".join(temp_write_list) + "\n")
+        self.assembly_file_path = assembly_file_path
+        assembly = self.edit(assembly_file_path)
+
+        # get re_cut ctg information (last item of cut_ctg), later fragments of the same ctg are renamed (X + 1)
+        cut_ctg_name, cut_ctg_site = list(cut_ctg.items())[-1]
+        assembly.cut(cut_ctg_name, [cut_ctg_site], recut=True)
+
+        self.save(assembly, out_file_path)
+
+    @staticmethod
+    def is_fragment(ctg_name):
+        """
+            check whether the ctg is already cut (has a :::fragment_N token), a fragment is re cut
+        Args:
+            ctg_name: ctg name
+
+        Returns:
+            True or False
+        """
+        return fragment_key(ctg_name) is not None
 
     def moves_ctg(self, assembly_file_path, error_info, out_file_path):
         """
@@ -369,64 +186,18 @@ class AssemblyOperate(object):
         """
 
         self.assembly_file_path = assembly_file_path
-
-        # get ctg_s information
-        ctg_s, ctg_orders = AssemblyOperate._get_ctg_orders(assembly_file_path)
+        if not error_info:
+            return
+        assembly = self.edit(assembly_file_path)
 
         for error in error_info:
-            # get move ctg name information
-            move_ctg = list(error_info[error]["moves_ctg"].keys())
-
-            # get move ctg order information
-            move_ctg_orders = []
-            for ctg in move_ctg:
-                get_ctg_info = self.get_ctg_info(ctg_name=ctg, new_asy_file=assembly_file_path)
-                get_ctg_info_order = get_ctg_info["ctg_order"]
-                move_ctg_orders.append(str(get_ctg_info_order))
-
-            # get insert ctg order information
-            insert_ctg = list(error_info[error]["insert_site"].keys())[0]
-            insert_ctg_order = self.get_ctg_info(ctg_name=insert_ctg)["ctg_order"]
-
-            # insert ctg order index
-            insert_ctg_order_index = None
-
-            # update ctg order
-            for move_ctg_order in move_ctg_orders:
-                for index in range(len(ctg_orders)):
-                    # delete the original position of the move ctg
-                    if move_ctg_order in ctg_orders[index]:
-                        ctg_orders[index].remove(move_ctg_order)
-
-                    # get insert ctg order index
-                    if str(insert_ctg_order) in ctg_orders[index]:
-                        insert_ctg_order_index = (index, ctg_orders[index].index(str(insert_ctg_order)))
-
-            # get move ctg
-            direction = error_info[error]["direction"]  # insert direction
-            if direction == "left":  # insert left
-                move_ctg_orders.reverse()
-                for move_ctg_order in move_ctg_orders:
-                    ctg_orders[insert_ctg_order_index[0]].insert(insert_ctg_order_index[1], move_ctg_order)
-            else:  # insert right
-                move_ctg_orders.reverse()
-                for move_ctg_order in move_ctg_orders:
-                    ctg_orders[insert_ctg_order_index[0]].insert(insert_ctg_order_index[1] + 1, move_ctg_order)
-
-            # update assembly file
-            with open(out_file_path, "w") as f:
-                # write new ctg information
-                for key, value in ctg_s.items():
-                    f.write(key + " " + value["order"] + " " + value["length"] + "\n")
-
-                # write new ctg order information
-                for ctg_order in ctg_orders:
-                    temp_write_list = []
-                    for x in ctg_order:
-                        temp_write_list.append(str(x))
-                    f.write(" ".join(temp_write_list) + "\n")
-
-    def find_site_ctg_s(self, assembly_file_path, start, end):
+            # insert move ctg_s on the left or right of insert ctg
+            assembly.move(list(error_info[error]["moves_ctg"].keys()),
+                          list(error_info[error]["insert_site"].keys())[0], error_info[error]["direction"])
+
+        self.save(assembly, out_file_path)
+
+    def find_site_ctg_s(self, assembly_file_path, start, end) -> OrderedDict:
         """
             Find site coordinate interval ctg_s
         Args:
@@ -435,87 +206,24 @@ class AssemblyOperate(object):
             end: end coordinate
 
         Returns:
-            site_ctg_s: site coordinate interval ctg_s
+            site_ctg_s: site coordinate interval ctg_s {ctg name: CtgSite} in assembly order
         """
-
-        contain_ctg = OrderedDict()  # site coordinate interval ctg_s
-
-        ctg_info = {}  # ctg information {order: {name, length}}
-
-        ctg_order = []  # ctg order list
-
         # get the real position information on the genome
         genome_start = round(start * self.ratio)
         genome_end = round(end * self.ratio)
 
-        logger.info("Search assembly location ： {0} - {1} \n".format(genome_start, genome_end))
-
-        logger.info("This location ctg contains:\n")
-
-        with open(assembly_file_path, "r") as f:
-            lines = f.readlines()
-            for line in lines:
-                # ctg :name : order, length
-                if line.startswith(">"):
-                    each_line = line.strip().split()
-                    ctg_info[each_line[1].strip(">")] = {
-                        "name": each_line[0],
-                        "length": each_line[2]
-                    }
-                # ctg order
-                else:
-                    ctg_order.append(line.strip().split())
-
-            # Two-dimensional reduction to one-dimensional
-            ctg_order = [order for st in ctg_order for order in st]
-
-        # 寻找ctg
-        temp_len_s = 0  # record the start position of the current ctg
-        temp_len_e = 0  # record the end position of the current ctg
-
-        for i in ctg_order:  # loop ctg_s
-
-            if i.startswith("-"):  # when ctg is reverse(Negative)
-                i = i[1:]
-                temp_len_s = temp_len_e + 1
-                temp_len_e += int(ctg_info[i]["length"])
-            else:
-                temp_len_s = temp_len_e + 1
-                temp_len_e += int(ctg_info[i]["length"])
-
-            # Decoupling
-            def callback():
-                contain_ctg[ctg_info[i]["name"]] = {
-                    "length": ctg_info[i]["length"],
-                    "start": temp_len_s,
-                    "end": temp_len_e
-                }
-                return temp_len_e
-
-            # each ctg relationship with the query site (refer to the relationship between two line segments)
-            if temp_len_s < genome_start:
-                if genome_start < temp_len_e:
-                    callback()
-            elif temp_len_s >= genome_start:
-                if temp_len_e < genome_end:
-                    callback()
-                elif temp_len_s < genome_end:
-                    callback()
-
-        # reformatted output to json
-        contain_ctg = json.dumps(
-            contain_ctg,
-            indent=4,
-            separators=(
-                ',',
-                ': '))
-        logger.info(contain_ctg)
+        # binary search of the ctg_s overlapping the location
+        contain_ctg = OrderedDict((ctg.name, ctg) for ctg in
+                                  self.load(assembly_file_path).contigs_in(genome_start, genome_end))
+
+        logger.debug("Search assembly location %s - %s, this location ctg contains: %s\n", genome_start, genome_end,
+                     list(contain_ctg.values()))
 
         return contain_ctg
 
     def cut_ctg_to_3(self, assembly_file_path, cut_ctg_name, site_1, site_2, out_file_path):
         """
-            Cut ctg to 3 parts
+            Cut ctg to 3 parts, pieces are ctg:::fragment_1 - 3 (a fragment: see re_cut_ctg_to_3)
         Args:
             assembly_file_path: assembly file path
             cut_ctg_name: cut ctg name
@@ -526,79 +234,13 @@ class AssemblyOperate(object):
         Returns:
             None
         """
+        self.assembly_file_path = assembly_file_path
+        assembly = self.edit(assembly_file_path)
 
-        if cut_ctg_name.startswith(">") is False:
-            cut_ctg_name = ">" + cut_ctg_name
-
-        # get original ctg_s information
-        ctg_s, ctg_orders = self._get_ctg_orders(assembly_file_path)
-
-        # get new information of cut ctg
-        cut_ctg_info = self.get_ctg_info(ctg_name=cut_ctg_name, new_asy_file=assembly_file_path)
-
-        #  get cut ctg order (positive: True, negative: False)
-        cut_ctg_order = cut_ctg_info["ctg_order"]
-
-        # calculate the start and end position of the cut
-        cut_ctg_site1 = site_1 - cut_ctg_info["site"][0]
-        cut_ctg_site2 = site_2 - site_1 + 1
-        cut_ctg_site3 = cut_ctg_info["site"][1] - site_2
-
-        with open(out_file_path, "w") as f:
-            # write new ctg information
-            for key, value in ctg_s.items():
-                if key == cut_ctg_name:
-                    # when ctg order is positive
-                    if cut_ctg_order > 0:
-                        f.write(key + ":::fragment_1 " + value["order"] + " " + str(cut_ctg_site1) + "\n")
-                        temp_order = int(value["order"]) + 1
-                        f.write(key + ":::fragment_2" + " " + str(temp_order) + " " + str(cut_ctg_site2) + "\n")
-                        temp_order += 1
-                        f.write(key + ":::fragment_3" + " " + str(temp_order) + " " + str(cut_ctg_site3) + "\n")
-
-                    else:
-                        f.write(key + ":::fragment_1 " + value["order"] + " " + str(cut_ctg_site3) + "\n")
-                        temp_order = int(value["order"]) + 1
-                        f.write(key + ":::fragment_2" + " " + str(temp_order) + " " + str(cut_ctg_site2) + "\n")
-                        temp_order += 1
-                        f.write(key + ":::fragment_3" + " " + str(temp_order) + " " + str(cut_ctg_site1) + "\n")
-                else:
-                    # update other ctg information
-                    if int(value["order"]) > abs(cut_ctg_order):
-                        temp_order = int(value["order"]) + 2
-                        f.write(key + " " + str(temp_order) + " " + value["length"] + "\n")
-                    else:
-                        f.write(key + " " + value["order"] + " " + value["length"] + "\n")
-
-            # write new ctg order
-            for ctg_order in ctg_orders:
-                temp_write_list = []
-                for x in ctg_order:
-                    # update ctg order
-                    if int(x) == cut_ctg_order:
-                        if cut_ctg_order > 0:
-                            temp = cut_ctg_order + 1
-                            temp_write_list.append(str(cut_ctg_order))
-                            temp_write_list.append(str(temp))
-                            temp += 1
-                            temp_write_list.append(str(temp))
-                        else:  # when ctg order is negative
-                            temp = cut_ctg_order - 2
-                            temp_write_list.append(str(temp))
-                            temp += 1
-                            temp_write_list.append(str(temp))
-                            temp_write_list.append(str(cut_ctg_order))
-                    else:  # other ctg order + 1
-                        if abs(int(x)) > abs(cut_ctg_order):
-                            if int(x) > 0:
-                                temp = int(x) + 2
-                                temp_write_list.append(str(temp))
-                            else:
-                                temp = int(x) - 2
-                                temp_write_list.append(str(temp))
-                        else:
-                            temp_write_list.append(str(x))
-                f.write(" ".join(temp_write_list) + "\n")
+        # the middle part is site_1 - site_2
+        assembly.cut(cut_ctg_name, [site_1, site_2 + 1], recut=False)
+
+        self.save(assembly, out_file_path)
 
     def re_cut_ctg_to_3(self, assembly_file_path, cut_ctg_name, site_1, site_2, out_file_path):
         """
@@ -613,120 +255,13 @@ class AssemblyOperate(object):
         Returns:
             None
         """
-        if cut_ctg_name.startswith(">") is False:
-            cut_ctg_name = ">" + cut_ctg_name
-
-        # get original ctg_s information
-        ctg_s, ctg_orders = self._get_ctg_orders(assembly_file_path)
-
-        # get re_cut ctg head information
-        cut_ctg_name_head = re.search(r"(.*_)(\d+)", cut_ctg_name).group(1)
-        # get re_cut ctg order information（fragment_X）
-        cut_ctg_name_order = re.search(r"(.*_)(\d+)", cut_ctg_name).group(2)
-
-        # calculate the new information of the cut ctg
-        cut_ctg_info = self.get_ctg_info(ctg_name=cut_ctg_name, new_asy_file=assembly_file_path)
-
-        # get cut ctg order (positive: True, negative: False)
-        cut_ctg_order = cut_ctg_info["ctg_order"]
-
-        # calculate the start and end position of the cut
-        cut_ctg_site1 = site_1 - cut_ctg_info["site"][0]
-        cut_ctg_site2 = site_2 - site_1 + 1
-        cut_ctg_site3 = cut_ctg_info["site"][1] - site_2
-
-        with open(out_file_path, "w") as f:
-            # write new ctg information
-            for key, value in ctg_s.items():
-                if key.startswith(cut_ctg_name_head):
-                    head = re.search(r"(.*_)(\d+)", key).group(1)
-                    order = re.search(r"(.*_)(\d+)", key).group(2)
-
-                    # directly write the front ctg information
-                    if int(order) < int(cut_ctg_name_order):
-                        f.write(key + " " + value["order"] + " " + value["length"] + "\n")
-
-                    # re_cut ctg
-                    elif int(order) == int(cut_ctg_name_order):
-                        temp_order = int(value["order"]) + 1
-                        # judge the order direction of the cut ctg
-                        if int(cut_ctg_order) > 0:
-                            if key.endswith("debris"):
-                                f.write(head + order + ":::debris " + value["order"] + " " + str(cut_ctg_site1) + "\n")
-                                f.write(head + str(int(order) + 1) + ":::debris " + str(temp_order) + " " + str(
-                                    cut_ctg_site2) + "\n")
-                                temp_order += 1
-                                f.write(head + str(int(order) + 2) + ":::debris " + str(temp_order) + " " + str(
-                                    cut_ctg_site3) + "\n")
-                            else:
-                                f.write(head + order + " " + value["order"] + " " + str(cut_ctg_site1) + "\n")
-                                f.write(head + str(int(order) + 1) + " " + str(temp_order) + " " + str(
-                                    cut_ctg_site2) + "\n")
-                                temp_order += 1
-                                f.write(head + str(int(order) + 2) + " " + str(temp_order) + " " + str(
-                                    cut_ctg_site3) + "\n")
-
-                        else:
-                            if key.endswith("debris"):
-                                f.write(head + order + ":::debris " + value["order"] + " " + str(cut_ctg_site3) + "\n")
-                                f.write(head + str(int(order) + 1) + ":::debris " + str(temp_order) + " " + str(
-                                    cut_ctg_site2) + "\n")
-                                temp_order += 1
-                                f.write(head + str(int(order) + 2) + ":::debris " + str(temp_order) + " " + str(
-                                    cut_ctg_site1) + "\n")
-                            else:
-                                f.write(head + order + " " + value["order"] + " " + str(cut_ctg_site3) + "\n")
-                                f.write(head + str(int(order) + 1) + " " + str(temp_order) + " " + str(
-                                    cut_ctg_site2) + "\n")
-                                temp_order += 1
-                                f.write(head + str(int(order) + 2) + " " + str(temp_order) + " " + str(
-                                    cut_ctg_site1) + "\n")
-                    # write the back ctg information and update the order + 2
-                    else:
-                        temp_order = int(value["order"]) + 2
-                        if key.endswith("debris"):
-                            f.write(head + str(int(order) + 2) + ":::debris " + str(temp_order) + " " + value[
-                                "length"] + "\n")
-                        else:
-                            f.write(
-                                head + str(int(order) + 2) + " " + str(temp_order) + " " + value["length"] + "\n")
-                else:
-                    # update the order + 2
-                    if int(value["order"]) > abs(int(cut_ctg_order)):
-                        temp_order = int(value["order"]) + 2
-                        f.write(key + " " + str(temp_order) + " " + value["length"] + "\n")
-                    else:
-                        f.write(key + " " + value["order"] + " " + value["length"] + "\n")
-
-            # write new ctg order information
-            for ctg_order in ctg_orders:
-                temp_write_list = []
-                for x in ctg_order:
-                    # update the new order of the cut ctg
-                    if int(x) == cut_ctg_order:
-                        if cut_ctg_order > 0:
-                            temp = cut_ctg_order + 1
-                            temp_write_list.append(str(cut_ctg_order))
-                            temp_write_list.append(str(temp))
-                            temp += 1
-                            temp_write_list.append(str(temp))
-                        else:  # when the cut ctg is negative
-                            temp = cut_ctg_order - 2
-                            temp_write_list.append(str(temp))
-                            temp += 1
-                            temp_write_list.append(str(temp))
-                            temp_write_list.append(str(cut_ctg_order))
-                    else:  # other ctg order + 2
-                        if abs(int(x)) > abs(cut_ctg_order):
-                            if int(x) > 0:
-                                temp = int(x) + 2
-                                temp_write_list.append(str(temp))
-                            else:
-                                temp = int(x) - 2
-                                temp_write_list.append(str(temp))
-                        else:
-                            temp_write_list.append(str(x))
-                f.write(" ".join(temp_write_list) + "\n")
+        self.assembly_file_path = assembly_file_path
+        assembly = self.edit(assembly_file_path)
+
+        # the middle part is site_1 - site_2, later fragments of the same ctg are renamed (fragment_X + 2)
+        assembly.cut(cut_ctg_name, [site_1, site_2 + 1], recut=True)
+
+        self.save(assembly, out_file_path)
 
     def inv_ctg(self, ctg_name, assembly_file_path, out_file_path, _ctg_order=None):
         """
@@ -740,28 +275,10 @@ class AssemblyOperate(object):
         Returns:
             None
         """
-
-        # get the order of the invert ctg
-        inv_ctg_order = self.get_ctg_info(ctg_name=ctg_name, new_asy_file=assembly_file_path)["ctg_order"]
-
-        # get the ctg_s order information in assembly_file_path
-        ctg_s, ctg_orders = AssemblyOperate._get_ctg_orders(assembly_file_path)
-
-        # update assembly file
-        with open(out_file_path, "w") as f:
-            # write the new ctg information
-            for key, value in ctg_s.items():
-                f.write(key + " " + value["order"] + " " + value["length"] + "\n")
-
-            # write new ctg order information
-            for ctg_order in ctg_orders:
-                temp_write_list = []
-                for x in ctg_order:
-                    if int(x) == inv_ctg_order:
-                        temp_write_list.append(str(-int(x)))
-                    else:
-                        temp_write_list.append(str(x))
-                f.write(" ".join(temp_write_list) + "\n")
+        self.assembly_file_path = assembly_file_path
+        assembly = self.edit(assembly_file_path)
+        assembly.invert(ctg_name)
+        self.save(assembly, out_file_path)
 
     def inv_ctg_s(self, assembly_file_path, error_inv_info, out_file_path):
         """
@@ -774,10 +291,17 @@ class AssemblyOperate(object):
         Returns:
             None
         """
+        self.assembly_file_path = assembly_file_path
+        inv_ctg_s = [inv_ctg for error in error_inv_info for inv_ctg in error_inv_info[error]["inv_ctg"]]
+        if not inv_ctg_s:
+            return
+        assembly = self.edit(assembly_file_path)
 
-        for error in error_inv_info:
-            for inv_ctg in error_inv_info[error]["inv_ctg"]:
-                self.inv_ctg(inv_ctg, assembly_file_path, out_file_path)
+        # invert all ctg_s in memory, the file is written once
+        for inv_ctg in inv_ctg_s:
+            assembly.invert(inv_ctg)
+
+        self.save(assembly, out_file_path)
 
     def move_deb_to_end(self, assembly_file_path, moves_ctg, out_file_path):
         """
@@ -790,32 +314,10 @@ class AssemblyOperate(object):
         Returns:
             None
         """
-        deb_ctg_order = []
-
-        for i in moves_ctg:
-            for j in moves_ctg[i]["deb_ctg"]:
-                temp = self.get_ctg_info(ctg_name=j, new_asy_file=assembly_file_path)
-                deb_ctg_order.append(str(temp["ctg_order"]))
-
-        # get the ctg_s order information in assembly_file_path
-        ctg_s, ctg_orders = AssemblyOperate._get_ctg_orders(assembly_file_path)
-
-        # update order and write to new file
-        with open(out_file_path, "w") as f:
-            # write the new ctg information
-            for key, value in ctg_s.items():
-                f.write(key + " " + value["order"] + " " + value["length"] + "\n")
-
-            # write new ctg order information
-            for ctg_order in ctg_orders:
-                temp_write_list = []
-                for x in ctg_order:
-                    if str(x) in deb_ctg_order:
-                        continue
-                    else:
-                        temp_write_list.append(str(x))
-                f.write(" ".join(temp_write_list) + "\n")
-            f.write(" ".join(deb_ctg_order) + "\n")
+        self.assembly_file_path = assembly_file_path
+        assembly = self.edit(assembly_file_path)
+        assembly.move_to_end([j for i in moves_ctg for j in moves_ctg[i]["deb_ctg"]])
+        self.save(assembly, out_file_path)
 
     @staticmethod
     def remove_asy_blank(raw_asy, new_asy=None):
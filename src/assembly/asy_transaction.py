@@ -0,0 +1,112 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: asy_transaction.py
+@time: 10/18/26 2:10 AM
+@function: assembly edits of one adjust round applied to one in-memory assembly and written once
+"""
+
+import os
+import shutil
+
+from src.assembly.asy_model import Assembly
+from src.assembly.asy_operate import AssemblyOperate
+from src.utils.logger import logger
+
+
+class AssemblyTransaction(AssemblyOperate):
+    """
+        AssemblyOperate of one edit session: the source and target assembly paths read and edit the same in-memory
+        assembly, nothing is written until commit. Cuts keep assembly coordinates, so errors (hic coordinates of
+        the original assembly) are searched in the current state exactly like the sequential file edits did.
+        Other assembly paths raise ValueError, they are not part of the session.
+    """
+
+    def __init__(self, assembly_file_path, ratio, target_file=None):
+        """
+        Args:
+            assembly_file_path: assembly file path before edits
+            ratio: the ratio between assembly and hic
+            target_file: assembly file path the edits are committed to (default: assembly_file_path)
+        """
+        super().__init__(assembly_file_path, ratio)
+        self.source_file = assembly_file_path
+        self.target_file = target_file or assembly_file_path
+        self.session_files = {os.path.abspath(self.source_file), os.path.abspath(self.target_file)}
+        self.assembly = Assembly.read(assembly_file_path)
+        self.seq_length = self.assembly.seq_length()
+
+        # edited assemblies are only validated when the source assembly is valid
+        try:
+            self.assembly.validate()
+            self.checked = True
+        except ValueError as e:
+            logger.warning("%s, edits are not validated\n" % e)
+            self.checked = False
+
+    def check_file(self, assembly_file_path):
+        """
+            check that a path is the source or target of the session
+        Args:
+            assembly_file_path: assembly file path
+
+        Returns:
+            None
+        """
+        if assembly_file_path is not None and os.path.abspath(assembly_file_path) not in self.session_files:
+            raise ValueError("%s is not the source (%s) or target (%s) of the assembly transaction" %
+                             (assembly_file_path, self.source_file, self.target_file))
+
+    def load(self, assembly_file_path=None) -> Assembly:
+        self.check_file(assembly_file_path)
+        return self.assembly
+
+    def edit(self, assembly_file_path) -> Assembly:
+        self.check_file(assembly_file_path)
+        return self.assembly
+
+    def save(self, assembly, out_file_path):
+        self.check_file(out_file_path)
+        self.assembly = assembly
+
+    @property
+    def edits(self):
+        """
+            (operation, contig names) of each edit, in order
+        """
+        return self.assembly.edits
+
+    def commit(self, out_file_path=None):
+        """
+            validate the edited assembly and write it
+        Args:
+            out_file_path: output file path (default: target_file)
+
+        Returns:
+            None
+        """
+        out_file_path = out_file_path or self.target_file
+        if not self.edits:  # nothing to change, keep the source file as it is
+            if os.path.abspath(self.source_file) != os.path.abspath(out_file_path):
+                shutil.copy(self.source_file, out_file_path)
+            logger.info("No assembly edit, %s kept\n" % self.source_file)
+            return
+
+        if self.checked:
+            self.assembly.validate(self.seq_length)
+        empty = [name for name, length in zip(self.assembly.names, self.assembly.lengths) if length <= 0]
+        if empty:
+            logger.warning("Ctg with length <= 0 after cuts: %s\n" % empty)
+        self.assembly.write(out_file_path)
+        logger.info("Assembly %s edits written to %s\n" % (len(self.edits), out_file_path))
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
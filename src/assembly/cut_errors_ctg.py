@@ -8,15 +8,12 @@
 @time: 3/2/23 2:39 PM
 @function: 
 """
-import json
-import re
-
 from src.assembly.asy_operate import AssemblyOperate
 from src.utils.get_cfg import get_ratio
 from src.utils.logger import logger
 
 
-def cut_errors_ctg(errors_queue, hic_file, assembly_file, modified_assembly_file) -> None:
+def cut_errors_ctg(errors_queue, hic_file, assembly_file, modified_assembly_file, asy_operate=None) -> None:
     """
     cut errors ctg
     Args:
@@ -24,6 +21,7 @@ def cut_errors_ctg(errors_queue, hic_file, assembly_file, modified_assembly_file
         hic_file: hic file path
         assembly_file: assembly file path
         modified_assembly_file: modified assembly file path
+        asy_operate: AssemblyOperate of the edit session (default: edit files)
 
     Returns:
         None
@@ -31,11 +29,14 @@ def cut_errors_ctg(errors_queue, hic_file, assembly_file, modified_assembly_file
 
     logger.info("Start cut errors:\n")
 
-    # get ratio of hic file and assembly file
-    ratio = get_ratio(hic_file, assembly_file)
+    if asy_operate is None:
+        # get ratio of hic file and assembly file
+        ratio = get_ratio(hic_file, assembly_file)
 
-    # class AssemblyOperate class
-    asy_operate = AssemblyOperate(assembly_file, ratio)
+        # class AssemblyOperate class
+        asy_operate = AssemblyOperate(assembly_file, ratio)
+    else:
+        ratio = asy_operate.ratio
 
     flag = True  # flag to judge whether the file is modified
 
@@ -53,8 +54,6 @@ def cut_errors_ctg(errors_queue, hic_file, assembly_file, modified_assembly_file
         # find ctg in error location
         error_contains_ctg = asy_operate.find_site_ctg_s(assembly_file, errors_queue[error]["start"],
                                                          errors_queue[error]["end"])
-
-        error_contains_ctg = json.loads(error_contains_ctg)  # str to dict
         error_contains_ctg = list(error_contains_ctg.items())  # dict to list
 
         logger.info("Start cut location ctg：\n")
@@ -69,35 +68,22 @@ def cut_errors_ctg(errors_queue, hic_file, assembly_file, modified_assembly_file
             cut_ctg_name_site[first_ctg[0]] = round(errors_queue[error]["start"] * ratio)
 
             # check whether the ctg is already cut
-            if "fragment" in first_ctg[0] or "debris" in first_ctg[0]:
+            since = len(asy_operate.load(assembly_file).edits)
+            if asy_operate.is_fragment(first_ctg[0]):
                 asy_operate.re_cut_ctg_s(assembly_file, cut_ctg_name_site, modified_assembly_file)
             else:
                 asy_operate.cut_ctg_s(assembly_file, cut_ctg_name_site, modified_assembly_file)
 
-            # cut last ctg
+            # cut last ctg, renamed when the first cut renumbers the later fragments of the same ctg
             last_ctg = error_contains_ctg[-1]
+            last_ctg_name = asy_operate.load(modified_assembly_file).renamed(last_ctg[0], since)
 
             # clear dict( a bug here, no error because the next function has processed it)
             cut_ctg_name_site.clear()
-            cut_ctg_name_site[last_ctg[0]] = round(errors_queue[error]["end"] * ratio)
+            cut_ctg_name_site[last_ctg_name] = round(errors_queue[error]["end"] * ratio)
 
             # check whether the ctg is already cut
-            if "fragment" in last_ctg[0] or "debris" in last_ctg[0]:
-                try:
-                    first_ctg_name_head = re.search(r"(.*_)(\d+)", first_ctg[0]).group(1)
-                    last_ctg_name_head = re.search(r"(.*_)(\d+)", last_ctg[0]).group(1)
-                    first_ctg_name_order = re.search(r"(.*_)(\d+)", first_ctg[0]).group(2)
-                    last_ctg_name_order = re.search(r"(.*_)(\d+)", last_ctg[0]).group(2)
-
-                    # ctg are synonymous and in the same direction
-                    if first_ctg_name_head == last_ctg_name_head and int(first_ctg_name_order) < int(
-                            last_ctg_name_order):
-                        renew_last_ctg_name = last_ctg_name_head + str(int(last_ctg_name_order) + 1)
-                        cut_ctg_name_site.clear()  # clear dict
-                        cut_ctg_name_site[renew_last_ctg_name] = round(errors_queue[error]["end"] * ratio)
-                except AttributeError:
-                    logger.warning(
-                        "AttributeError: {0} or {1} is not synonymous ctg\n".format(first_ctg[0], last_ctg[0]))
+            if asy_operate.is_fragment(last_ctg_name):
                 asy_operate.re_cut_ctg_s(modified_assembly_file, cut_ctg_name_site, modified_assembly_file)
             else:
                 asy_operate.cut_ctg_s(modified_assembly_file, cut_ctg_name_site, modified_assembly_file)
@@ -115,7 +101,7 @@ def cut_errors_ctg(errors_queue, hic_file, assembly_file, modified_assembly_file
                 cut_ctg_name_site[_ctg[0]] = cut_ctg_site_end
 
                 # cut a ctg to two ctg
-                if "fragment" in _ctg[0] or "debris" in _ctg[0]:  # check whether the ctg is already cut
+                if asy_operate.is_fragment(_ctg[0]):  # check whether the ctg is already cut
                     asy_operate.re_cut_ctg_s(assembly_file, cut_ctg_name_site, modified_assembly_file)
                 else:
                     asy_operate.cut_ctg_s(assembly_file, cut_ctg_name_site, modified_assembly_file)
@@ -124,13 +110,13 @@ def cut_errors_ctg(errors_queue, hic_file, assembly_file, modified_assembly_file
                 cut_ctg_name_site[_ctg[0]] = cut_ctg_site_start
 
                 # cut a ctg to two ctg
-                if "fragment" in _ctg[0] or "debris" in _ctg[0]:  # check whether the ctg is already cut
+                if asy_operate.is_fragment(_ctg[0]):  # check whether the ctg is already cut
                     asy_operate.re_cut_ctg_s(assembly_file, cut_ctg_name_site, modified_assembly_file)
                 else:
                     asy_operate.cut_ctg_s(assembly_file, cut_ctg_name_site, modified_assembly_file)
 
             else:  # no boundary situation, cut it into three ctg
-                if "fragment" in _ctg[0] or "debris" in _ctg[0]:  # check whether the ctg is already cut
+                if asy_operate.is_fragment(_ctg[0]):  # check whether the ctg is already cut
                     asy_operate.re_cut_ctg_to_3(assembly_file, _ctg[0], cut_ctg_site_start,
                                                 cut_ctg_site_end, modified_assembly_file)
                 else:
@@ -9,7 +9,6 @@
 @function: 
 """
 
-import json
 from collections import OrderedDict
 
 from src.assembly.asy_operate import AssemblyOperate
@@ -17,13 +16,14 @@ from src.utils.get_cfg import get_ratio
 from src.utils.logger import logger
 
 
-def adjust_debris(errors_queue, hic_file, modified_assembly_file):
+def adjust_debris(errors_queue, hic_file, modified_assembly_file, asy_operate=None):
     """
     Debris adjust
     Args:
         errors_queue:
         hic_file:
         modified_assembly_file:
+        asy_operate: AssemblyOperate of the edit session (default: read modified_assembly_file)
 
     Returns:
         debris error information queue
@@ -31,11 +31,12 @@ def adjust_debris(errors_queue, hic_file, modified_assembly_file):
 
     logger.info("Start adjust debris errors:\n")
 
-    # get ratio between chromosome length and hic file length
-    ratio = get_ratio(hic_file, modified_assembly_file)
+    if asy_operate is None:
+        # get ratio between chromosome length and hic file length
+        ratio = get_ratio(hic_file, modified_assembly_file)
 
-    # initialize AssemblyOperate class
-    asy_operate = AssemblyOperate(modified_assembly_file, ratio)
+        # initialize AssemblyOperate class
+        asy_operate = AssemblyOperate(modified_assembly_file, ratio)
 
     error_deb_info = OrderedDict()  # debris info
 
@@ -45,9 +46,7 @@ def adjust_debris(errors_queue, hic_file, modified_assembly_file):
         new_error_contain_ctg = asy_operate.find_site_ctg_s(modified_assembly_file, errors_queue[error]["start"],
                                                             errors_queue[error]["end"])
 
-        new_error_contain_ctg = json.loads(new_error_contain_ctg)  # convert str to dict
-
-        logger.info(f"Needs to be moved ctg: {new_error_contain_ctg}\n")
+        logger.info("Needs to be moved ctg: %s\n", list(new_error_contain_ctg))
 
         error_deb_info[error] = {
             "deb_ctg": list(new_error_contain_ctg.keys())
@@ -11,10 +11,11 @@
 
 from collections import defaultdict
 
-import hicstraw
 import numpy as np
 from scipy.signal import find_peaks
 
+from src.common.contact_source import ContactSource
+from src.common.hic_adv_model import get_hic_file
 from src.utils.logger import logger
 
 
@@ -34,11 +35,11 @@ def get_error_matrix(
         flag_of_site: flag of site
 
     Returns:
-        error matrix
+        error matrix (ContactSource), self bin index
     """
 
     # get hic object
-    hic_object = hicstraw.HiCFile(hic_file)
+    hic_object = get_hic_file(hic_file)
 
     # get all chromosome length
     assembly_len = 0  # Declare variables (Line 67)
@@ -46,10 +47,6 @@ def get_error_matrix(
         if chrom.name == "assembly":
             assembly_len = chrom.length
 
-    # according to resolution, get matrix object
-    chr_matrix_object = hic_object.getMatrixZoomData(
-        'assembly', 'assembly', "observed", "KR", "BP", resolution)
-
     # get error matrix range
     true_start_bin = round(error_site[0] / resolution)
     true_end_bin = round(error_site[1] / resolution)
@@ -78,14 +75,14 @@ def get_error_matrix(
         search_site_b = error_site[1]
 
     if flag_of_site:  # first search, search error site is whole length
-        error_matrix_object = chr_matrix_object.getRecordsAsMatrix(
-            search_site_a, search_site_b, search_site[0], assembly_len)
+        error_matrix_object = ContactSource.from_hic(
+            hic_file, resolution, search_site_a, search_site_b, search_site[0], assembly_len, "KR")
         print("Insert search loci(hic) ：{0} - {1}".format(search_site[0], assembly_len))
     else:
         print("Insert search loci(hic) ：{0} - {1}".format(search_site[0], search_site[1]))
 
-        error_matrix_object = chr_matrix_object.getRecordsAsMatrix(
-            search_site_a, search_site_b, search_site[0], search_site[1])
+        error_matrix_object = ContactSource.from_hic(
+            hic_file, resolution, search_site_a, search_site_b, search_site[0], search_site[1], "KR")
     return error_matrix_object, bin_index
 
 
@@ -93,28 +90,28 @@ def find_error_peaks(numpy_matrix, distance=5):
     """
         get error matrix peaks
     Args:
-        numpy_matrix: error matrix
+        numpy_matrix: error matrix (ContactSource)
         distance: distance
 
     Returns:
         error peaks
     """
 
-    numpy_matrix_num = len(numpy_matrix)  # get matrix length
-    numpy_matrix_len = len(numpy_matrix[0])  # get matrix width
+    numpy_matrix_num, numpy_matrix_len = numpy_matrix.shape  # get matrix length and width
+    peak_height = numpy_matrix.percentile(50)  # median of all cells
 
     peaks_dict = defaultdict(int)
 
     for i in range(numpy_matrix_num):
         x = np.arange(0, numpy_matrix_len)  # get matrix index
 
-        y = numpy_matrix[i]  # get matrix value
+        y = numpy_matrix.row(i)  # get matrix value
 
         # get peaks
         # peak_id, peak_property = find_peaks(y, height=2000, distance=20)
         # distance should be a hyperparameter
         peak_id, peak_property = find_peaks(
-            y, height=np.median(numpy_matrix), distance=distance)
+            y, height=peak_height, distance=distance)
 
         peaks_index = x[peak_id]  # get peaks index
         peaks_height = peak_property['peak_heights']  # get peaks height/value
@@ -137,15 +134,15 @@ def find_max_peaks(numpy_matrix):
     """
         get max peaks in second search
     Args:
-        numpy_matrix: error matrix
+        numpy_matrix: error matrix (ContactSource)
 
     Returns:
         max peaks
     """
 
-    max_matrix_num = np.max(numpy_matrix)
-    max_matrix_num_index = np.where(numpy_matrix == max_matrix_num)
-    max_matrix_num_index = (max_matrix_num_index[0].astype(int)[0] + 1, max_matrix_num_index[1].astype(int)[0] + 1)
+    max_row, max_col = numpy_matrix.argmax()
+    max_matrix_num = numpy_matrix.matrix[max_row, max_col]
+    max_matrix_num_index = (max_row + 1, max_col + 1)
 
     return max_matrix_num, max_matrix_num_index
 
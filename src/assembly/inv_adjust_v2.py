@@ -9,7 +9,6 @@
 @function: 
 """
 
-import json
 from collections import OrderedDict
 
 from src.assembly.asy_operate import AssemblyOperate
@@ -17,7 +16,8 @@ from src.utils.get_cfg import get_ratio
 from src.utils.logger import logger
 
 
-def adjust_inversion(errors_queue, hic_file, modified_assembly_file, black_list_output, black_list=None):
+def adjust_inversion(errors_queue, hic_file, modified_assembly_file, black_list_output, black_list=None,
+                     asy_operate=None):
     """
     Inversion adjust
     Args:
@@ -26,6 +26,7 @@ def adjust_inversion(errors_queue, hic_file, modified_assembly_file, black_list_
         modified_assembly_file:
         black_list_output: black list output path
         black_list: the black list of ctg name
+        asy_operate: AssemblyOperate of the edit session (default: read modified_assembly_file)
 
     Returns:
         inversion error information queue
@@ -33,11 +34,12 @@ def adjust_inversion(errors_queue, hic_file, modified_assembly_file, black_list_
     logger.info("Start adjust inversion errors:\n")
 
     black_num = 0
-    # get ratio between chromosome length and hic file length
-    ratio = get_ratio(hic_file, modified_assembly_file)
+    if asy_operate is None:
+        # get ratio between chromosome length and hic file length
+        ratio = get_ratio(hic_file, modified_assembly_file)
 
-    # initialize AssemblyOperate class
-    asy_operate = AssemblyOperate(modified_assembly_file, ratio)
+        # initialize AssemblyOperate class
+        asy_operate = AssemblyOperate(modified_assembly_file, ratio)
 
     error_inv_info = OrderedDict()  # inversion info
 
@@ -54,8 +56,6 @@ def adjust_inversion(errors_queue, hic_file, modified_assembly_file, black_list_
         new_error_contains_ctg = asy_operate.find_site_ctg_s(modified_assembly_file, errors_queue[error]["start"],
                                                              errors_queue[error]["end"])
 
-        new_error_contains_ctg = json.loads(new_error_contains_ctg)  # convert str to dict
-
         if black_list is not None:
             # error in black list
             error_set = set(new_error_contains_ctg)
@@ -64,7 +64,7 @@ def adjust_inversion(errors_queue, hic_file, modified_assembly_file, black_list_
                 black_num += 1
                 continue
 
-        logger.info("Needs to be moved ctg: %s\n", new_error_contains_ctg)
+        logger.info("Needs to be moved ctg: %s\n", list(new_error_contains_ctg))
 
         error_inv_info[error] = {
             "inv_ctg": list(new_error_contains_ctg.keys())
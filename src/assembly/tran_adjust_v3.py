@@ -9,7 +9,6 @@
 @function: update translocation adjust and add black list
 """
 
-import json
 from collections import OrderedDict
 
 from src.assembly.asy_operate import AssemblyOperate
@@ -18,7 +17,8 @@ from src.utils.get_cfg import get_ratio
 from src.utils.logger import logger
 
 
-def adjust_translocation(errors_queue, hic_file, modified_assembly_file, black_list_output, black_list=None):
+def adjust_translocation(errors_queue, hic_file, modified_assembly_file, black_list_output, black_list=None,
+                         asy_operate=None):
     """
     Translocation adjust
     Args:
@@ -27,6 +27,7 @@ def adjust_translocation(errors_queue, hic_file, modified_assembly_file, black_l
         modified_assembly_file: modified assembly file path
         black_list_output: black list output path
         black_list: the black list of ctg name
+        asy_operate: AssemblyTransaction of the edit session (default: edit modified_assembly_file)
 
     Returns:
         translocation error information queue
@@ -36,11 +37,17 @@ def adjust_translocation(errors_queue, hic_file, modified_assembly_file, black_l
 
     black_num = 0
 
-    # get ratio of hic file and assembly file
-    ratio = get_ratio(hic_file, modified_assembly_file)
+    if asy_operate is None:
+        # get ratio of hic file and assembly file
+        ratio = get_ratio(hic_file, modified_assembly_file)
 
-    # class AssemblyOperate class
-    asy_operate = AssemblyOperate(modified_assembly_file, ratio)
+        # class AssemblyOperate class
+        asy_operate = AssemblyOperate(modified_assembly_file, ratio)
+        matrix_assembly_file = modified_assembly_file
+    else:
+        ratio = asy_operate.ratio
+        # cuts keep the first scaffold length the matrix search reads from file
+        matrix_assembly_file = asy_operate.source_file
 
     # error modify information record
     error_tran_info = OrderedDict()
@@ -58,8 +65,6 @@ def adjust_translocation(errors_queue, hic_file, modified_assembly_file, black_l
         new_error_contains_ctg = asy_operate.find_site_ctg_s(modified_assembly_file, errors_queue[error]["start"],
                                                              errors_queue[error]["end"])
 
-        new_error_contains_ctg = json.loads(new_error_contains_ctg)  # str to dict
-
         if black_list is not None:
             # error in black list
             error_set = set(new_error_contains_ctg)
@@ -68,7 +73,7 @@ def adjust_translocation(errors_queue, hic_file, modified_assembly_file, black_l
                 black_num += 1
                 continue
 
-        logger.info(f"Needs to be moved ctg: {new_error_contains_ctg}\n")
+        logger.info("Needs to be moved ctg: %s\n", list(new_error_contains_ctg))
 
         logger.info("Search {0} translocation error insert location：".format(error))
 
@@ -76,14 +81,13 @@ def adjust_translocation(errors_queue, hic_file, modified_assembly_file, black_l
         try:
             # get insert ctg site
             error_site = (errors_queue[error]["start"], errors_queue[error]["end"])
-            temp_result, insert_left = search_right_site_v8(hic_file, modified_assembly_file, ratio, error_site,
-                                                            modified_assembly_file)
+            temp_result, insert_left = search_right_site_v8(hic_file, matrix_assembly_file, ratio, error_site,
+                                                            modified_assembly_file, asy_operate)
         except Exception as e:
             logger.info("Error {0} insert location search failed, skip\n".format(error))
             # find ctg in error location
             error_contains_ctg = asy_operate.find_site_ctg_s(modified_assembly_file, errors_queue[error]["start"],
                                                              errors_queue[error]["end"])
-            error_contains_ctg = json.loads(error_contains_ctg)  # str to dict
             # write error information to blacklist
             with open(black_list_output, "a") as outfile:
                 outfile.write("\n".join(list(error_contains_ctg.keys())) + "\n")
@@ -92,8 +96,6 @@ def adjust_translocation(errors_queue, hic_file, modified_assembly_file, black_l
         new_error_contains_ctg = asy_operate.find_site_ctg_s(modified_assembly_file, errors_queue[error]["start"],
                                                              errors_queue[error]["end"])
 
-        new_error_contains_ctg = json.loads(new_error_contains_ctg)  # str to dict
-
         error_tran_info[error] = {
             "moves_ctg": new_error_contains_ctg,
             "insert_site": temp_result,
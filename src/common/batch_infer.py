@@ -0,0 +1,179 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: batch_infer.py
+@time: 10/17/26 7:10 PM
+@function: batched detector inference, test pipeline built once and tiles preprocessed in worker threads
+"""
+
+import copy
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from mmcv.ops import RoIPool
+from mmcv.parallel import collate, scatter
+from mmdet.apis import init_detector
+from mmdet.datasets import replace_ImageToTensor
+from mmdet.datasets.pipelines import Compose
+
+from src.utils.logger import logger
+
+
+class BatchDetector:
+    """
+        Run detector on fixed size batches of tiles, the next batch is preprocessed while the model runs
+    """
+
+    def __init__(self, model, batch_size=4, workers=4):
+        """
+        Args:
+            model: detector from init_detector
+            batch_size: tiles of each forward pass
+            workers: preprocessing threads
+        """
+        self.model = model
+        self.batch_size = max(int(batch_size), 1)
+        self.workers = max(int(workers), 1)
+        self.device = next(model.parameters()).device
+
+        # image path pipeline and in memory image (LoadImageFromWebcam) pipeline, built only once
+        pipeline = replace_ImageToTensor(copy.deepcopy(model.cfg.data.test.pipeline))
+        array_pipeline = copy.deepcopy(pipeline)
+        array_pipeline[0].type = 'LoadImageFromWebcam'
+        self.path_pipeline = Compose(pipeline)
+        self.array_pipeline = Compose(array_pipeline)
+
+        if not self.device.type == "cuda":
+            for m in model.modules():
+                assert not isinstance(m, RoIPool), 'CPU inference with RoIPool is not supported currently.'
+
+        self.tiles = 0  # detected tiles
+        self.seconds = 0  # time of detection (preprocessing wait and forward, not the time suspended at yield)
+
+    def prepare(self, img):
+        """
+            run test pipeline of one tile
+        Args:
+            img: image path or BGR image array
+
+        Returns:
+            pipeline result
+        """
+        if isinstance(img, np.ndarray):
+            return self.array_pipeline(dict(img=img))
+        return self.path_pipeline(dict(img_info=dict(filename=img), img_prefix=None))
+
+    def forward(self, datas):
+        """
+            run model on one batch
+        Args:
+            datas: pipeline results
+
+        Returns:
+            detection result of each tile
+        """
+        data = collate(datas, samples_per_gpu=len(datas))
+        # just get the actual data from DataContainer
+        data['img_metas'] = [img_metas.data[0] for img_metas in data['img_metas']]
+        data['img'] = [img.data[0] for img in data['img']]
+        if self.device.type == "cuda":
+            data = scatter(data, [self.device])[0]
+
+        with torch.no_grad():
+            return self.model(return_loss=False, rescale=True, **data)
+
+    def detect(self, items):
+        """
+            detect tiles batch by batch
+        Args:
+            items: (key, image path or BGR image array) iterable
+
+        Returns:
+            (key, detection result) generator, same order as items
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = None
+            batch = []
+            for item in items:
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+                futures = [executor.submit(self.prepare, img) for _, img in batch]
+                if pending is not None:
+                    yield from self.collect(*pending)
+                pending, batch = (batch, futures), []
+
+            if pending is not None:
+                yield from self.collect(*pending)
+            if batch:
+                yield from self.collect(batch, [executor.submit(self.prepare, img) for _, img in batch])
+
+    def collect(self, batch, futures):
+        """
+            wait for preprocessed batch and run model
+        Args:
+            batch: (key, image) list
+            futures: preprocessing futures of batch
+
+        Returns:
+            (key, detection result) generator
+        """
+        start = time.perf_counter()
+        results = self.forward([future.result() for future in futures])
+        self.seconds += time.perf_counter() - start
+        self.tiles += len(batch)
+        for (key, _), result in zip(batch, results):
+            yield key, result
+
+    def throughput(self):
+        """
+            detected tiles per second
+        Returns:
+            tiles / s
+        """
+        return self.tiles / self.seconds if self.seconds else 0.0
+
+
+def benchmark_batch_detector(model_cfg, pretrained_model, img_path, batch_sizes=(1, 2, 4, 8), n_tiles=32,
+                             device="cpu", workers=4):
+    """
+        throughput of batch sizes on tiles of a mul_process png folder
+    Args:
+        model_cfg: model config path
+        pretrained_model: pretrained model path
+        img_path: png folder with info.txt
+        batch_sizes: batch sizes to compare
+        n_tiles: tiles of each run
+        device: GPU device or CPU
+        workers: preprocessing threads
+
+    Returns:
+        {batch size: tiles / s}
+    """
+    model = init_detector(model_cfg, pretrained_model, device=device)
+    with open(os.path.join(img_path, "info.txt"), "r") as f:
+        tiles = [list(json.loads(line).keys())[0] for line in f.readlines()[:n_tiles]]
+
+    result = {}
+    for batch_size in batch_sizes:
+        detector = BatchDetector(model, batch_size=batch_size, workers=workers)
+        for _ in detector.detect((tile, tile) for tile in tiles):
+            pass
+        result[batch_size] = detector.throughput()
+        logger.info("batch size %s: %.2f tiles/s on %s\n" % (batch_size, result[batch_size], device))
+    return result
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: cascade_detect.py
+@time: 10/17/26 11:30 PM
+@function: coarse-to-fine detection, finer resolution tiles are only generated around errors of coarser resolutions
+"""
+
+import json
+import os
+import time
+from bisect import bisect_left
+
+from src.common.error_pd import ERRORS, infer_error
+from src.common.hic_adv_model import GenBaseModel
+from src.common.mul_gen_png import mul_stream
+from src.utils.logger import logger
+
+
+def merge_regions(regions):
+    """
+        merge overlapping regions
+    Args:
+        regions: [(start, end), ...]
+
+    Returns:
+        sorted disjoint regions
+    """
+    merged = []
+    for start, end in sorted(regions):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(region) for region in merged]
+
+
+def in_regions(regions, resolution, window):
+    """
+        whether a diagonal window overlaps one of regions
+    Args:
+        regions: sorted disjoint regions from merge_regions
+        resolution: hic resolution (unused, window_filter signature)
+        window: (a_start, a_end, b_start, b_end)
+
+    Returns:
+        True or False
+    """
+    # first region ending after window start
+    index = bisect_left([end for _, end in regions], window[0] + 1)
+    return index < len(regions) and regions[index][0] < window[1]
+
+
+def error_regions(info, detection_result, img_size, score=0.9, margin_bins=20):
+    """
+        hic regions of errors in a tile, widened by a margin for the localization error of the tile resolution
+    Args:
+        info: info record
+        detection_result: per class (n, 5) arrays
+        img_size: (width, height) of tile image
+        score: errors below score are ignored
+        margin_bins: margin in bins of the tile resolution
+
+    Returns:
+        [(start, end), ...]
+    """
+    record = info[list(info.keys())[0]]
+    margin = margin_bins * record["resolution"]
+    w_ratio = (record["chr_A_end"] - record["chr_A_start"]) / img_size[0]
+    h_ratio = (record["chr_B_end"] - record["chr_B_start"]) / img_size[1]
+
+    regions = []
+    for boxes in detection_result:
+        for x1, y1, x2, y2, box_score in boxes:
+            if box_score <= score:
+                continue
+            start = min(x1 * w_ratio + record["chr_A_start"], y1 * h_ratio + record["chr_B_start"])
+            end = max(x2 * w_ratio + record["chr_A_start"], y2 * h_ratio + record["chr_B_start"])
+            regions.append((max(int(start) - margin, 0), int(end) + margin))
+    return regions
+
+
+def cascade_detect(detector, hic_file, out_file, process_num, resolutions=None, score=0.9, margin_bins=20,
+                   genome_id="png", start_method=None):
+    """
+        detect the coarsest resolution on every window, then each finer resolution only on windows overlapping
+        errors found at coarser resolutions
+    Args:
+        detector: loaded detector from DetectorRegistry
+        hic_file: hic file path
+        out_file: output file path
+        process_num: tile generation processes
+        resolutions: resolutions to detect, eg: from plan_hic_resolutions (default: all resolutions >= 500)
+        score: errors below score do not open finer tiles
+        margin_bins: margin around errors in bins of the resolution they were found at
+        genome_id: genome id
+        start_method: worker start method of mul_stream (default: None, platform default)
+
+    Returns:
+        ((info record, BGR image array), detection result) generator, same as detector.detect of mul_stream tiles
+    """
+    if resolutions is None:
+        resolutions = GenBaseModel(hic_file, genome_id, out_file).get_resolutions()
+    resolutions = sorted((resolution for resolution in resolutions if resolution >= 500), reverse=True)
+
+    regions = None  # None: every window of the coarsest resolution
+    for resolution in resolutions:
+        if regions == []:
+            logger.info("Cascade: no error region left, skip resolution %s and finer\n" % resolution)
+            break
+
+        window_filter = None if regions is None else (lambda res, window, _regions=regions:
+                                                      in_regions(_regions, res, window))
+        tiles = mul_stream(hic_file, genome_id, out_file, "dia", process_num, _resolution=resolution,
+                           window_filter=window_filter, start_method=start_method)
+        n_tiles, found = 0, []
+        for (info, img), detection_result in detector.detect(((info, img), img) for info, img in tiles):
+            n_tiles += 1
+            found += error_regions(info, detection_result[0], (img.shape[1], img.shape[0]), score, margin_bins)
+            yield (info, img), detection_result
+
+        regions = merge_regions((regions or []) + found)
+        logger.info("Cascade resolution %s: %s tiles, %s error regions (%s bp)\n" % (
+            resolution, n_tiles, len(regions), sum(end - start for start, end in regions)))
+
+
+def load_errors(out_path):
+    """
+        errors of infer_error output
+    Args:
+        out_path: infer_error out path
+
+    Returns:
+        [error, ...] of chr_len_filtered_errors.json (empty when no error is detected)
+    """
+    error_json = os.path.join(out_path, "chr_len_filtered_errors.json")
+    if not os.path.exists(error_json):
+        return []
+    with open(error_json, "r") as f:
+        return [error for errors in json.load(f).values() for error in errors]
+
+
+def compare_cascade(detector, hic_file, out_path, process_num, chr_len, resolutions=None, score=0.9,
+                    error_min_len=15000, error_max_len=20000000, iou_score=0.8, margin_bins=20, match_iou=0.5):
+    """
+        recall and runtime of cascaded detection against the exhaustive scan of every tile
+    Args:
+        detector: loaded detector from DetectorRegistry
+        hic_file: hic file path
+        out_path: output path, infer_error results are written to exhaustive / cascade sub folders
+        process_num: tile generation processes
+        chr_len: hic real length
+        resolutions: resolutions to detect (default: all resolutions >= 500)
+        score: infer score
+        error_min_len: error min length
+        error_max_len: error max length
+        iou_score: overlap filtering iou
+        margin_bins: margin of cascade_detect
+        match_iou: min iou of an exhaustive error and the cascade error matching it (same category)
+
+    Returns:
+        {"exhaustive": {"tiles", "seconds", "errors"}, "cascade": {...}, "matched": errors, "recall": recall}
+    """
+    report = {}
+    for mode in ("exhaustive", "cascade"):
+        mode_path = os.path.join(out_path, mode)
+        os.makedirs(mode_path, exist_ok=True)
+        tiles_before, start = detector.tiles, time.perf_counter()
+        if mode == "exhaustive":
+            run_args = {"tiles": mul_stream(hic_file, "png", mode_path, "dia", process_num, _resolutions=resolutions)}
+        else:
+            run_args = {"cascade": cascade_detect(detector, hic_file, mode_path, process_num, resolutions, score,
+                                                  margin_bins)}
+        infer_error(None, None, os.path.join(mode_path, "png"), mode_path, score=score, error_min_len=error_min_len,
+                    error_max_len=error_max_len, iou_score=iou_score, chr_len=chr_len, detector=detector,
+                    **run_args)
+        report[mode] = {"tiles": detector.tiles - tiles_before, "seconds": time.perf_counter() - start,
+                        "errors": load_errors(mode_path)}
+
+    matched = 0
+    candidates = list(report["cascade"]["errors"])
+    for error in report["exhaustive"]["errors"]:
+        ious = [ERRORS.cal_iou(error["hic_loci"], candidate["hic_loci"]) if
+                candidate["category"] == error["category"] else 0 for candidate in candidates]
+        if ious and max(ious) >= match_iou:
+            matched += 1
+            candidates.pop(ious.index(max(ious)))
+
+    for mode in ("exhaustive", "cascade"):
+        report[mode]["errors"] = len(report[mode]["errors"])
+    report["matched"] = matched
+    report["recall"] = matched / report["exhaustive"]["errors"] if report["exhaustive"]["errors"] else 1.0
+    logger.info("Cascade vs exhaustive: %s\n" % report)
+    with open(os.path.join(out_path, "cascade_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: contact_source.py
+@time: 10/17/26 5:30 PM
+@function: sparse contact matrix of hic region read from straw getRecords, densify only on demand
+"""
+
+import math
+
+import numpy as np
+from scipy import sparse
+
+from src.common.hic_adv_model import get_matrix_zoom_data
+from src.common.hic_cache import get_matrix_cache
+
+
+class ContactSource:
+    """
+        Contacts of region rows [x_start, x_end] x columns [y_start, y_end], stored as CSR
+    """
+
+    def __init__(self, matrix, resolution, x_start=0, y_start=0):
+        """
+        Args:
+            matrix: scipy sparse matrix (bins)
+            resolution: hic resolution
+            x_start: row start (bp)
+            y_start: column start (bp)
+        """
+        self.matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+        self.matrix.eliminate_zeros()
+        self.resolution = resolution
+        self.x_bin = max(x_start, 0) // resolution  # first row bin
+        self.y_bin = max(y_start, 0) // resolution  # first column bin
+
+    @classmethod
+    def from_straw(cls, matrix_object, resolution, x_start, x_end, y_start, y_end, block_bins=1400):
+        """
+            read region from straw getRecords, block by block
+        Args:
+            matrix_object: straw MatrixZoomData
+            resolution: hic resolution
+            x_start: row start (bp)
+            x_end: row end (bp)
+            y_start: column start (bp)
+            y_end: column end (bp)
+            block_bins: bins of each straw block read
+
+        Returns:
+            ContactSource object
+        """
+        x_bin, y_bin = max(x_start, 0) // resolution, max(y_start, 0) // resolution
+        x_bins, y_bins = x_end // resolution - x_bin + 1, y_end // resolution - y_bin + 1
+
+        rows, cols, counts = [], [], []
+        for row in range(x_bin, x_bin + x_bins, block_bins):
+            row_end = min(row + block_bins, x_bin + x_bins) - 1
+            for col in range(y_bin, y_bin + y_bins, block_bins):
+                col_end = min(col + block_bins, y_bin + y_bins) - 1
+                records = matrix_object.getRecords(row * resolution, row_end * resolution,
+                                                   col * resolution, col_end * resolution)
+                if not records:
+                    continue
+
+                bin_x = np.fromiter((record.binX for record in records), np.int64, len(records)) // resolution
+                bin_y = np.fromiter((record.binY for record in records), np.int64, len(records)) // resolution
+                value = np.fromiter((record.counts for record in records), np.float32, len(records))
+
+                # straw stores upper triangle, a record may fill this block as (x, y) or as (y, x)
+                keep = (bin_x >= row) & (bin_x <= row_end) & (bin_y >= col) & (bin_y <= col_end)
+                mirror = (bin_y >= row) & (bin_y <= row_end) & (bin_x >= col) & (bin_x <= col_end) & (bin_x != bin_y)
+                rows += [bin_x[keep], bin_y[mirror]]
+                cols += [bin_y[keep], bin_x[mirror]]
+                counts += [value[keep], value[mirror]]
+
+        if rows:
+            rows, cols, counts = np.concatenate(rows), np.concatenate(cols), np.concatenate(counts)
+        else:
+            rows, cols, counts = np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32)
+
+        matrix = sparse.coo_matrix((counts, (rows - x_bin, cols - y_bin)), shape=(x_bins, y_bins))
+        return cls(matrix, resolution, x_start, y_start)
+
+    @classmethod
+    def from_dense(cls, matrix, resolution, x_start=0, y_start=0, chunk_rows=1400):
+        """
+            convert dense (or memory-mapped) matrix chunk by chunk
+        Args:
+            matrix: dense matrix
+            resolution: hic resolution
+            x_start: row start (bp)
+            y_start: column start (bp)
+            chunk_rows: rows converted at once
+
+        Returns:
+            ContactSource object
+        """
+        chunks = [sparse.csr_matrix(np.asarray(matrix[row:row + chunk_rows], dtype=np.float32))
+                  for row in range(0, matrix.shape[0], chunk_rows)]
+        if not chunks:
+            return cls(sparse.csr_matrix(matrix.shape, dtype=np.float32), resolution, x_start, y_start)
+        return cls(sparse.vstack(chunks, format="csr"), resolution, x_start, y_start)
+
+    @classmethod
+    def from_hic(cls, hic_file, resolution, x_start, x_end, y_start, y_end, norm="NONE"):
+        """
+            read region of hic file, from matrix cache when the resolution is cached, else from straw
+        Args:
+            hic_file: hic file path
+            resolution: hic resolution
+            x_start: row start (bp)
+            x_end: row end (bp)
+            y_start: column start (bp)
+            y_end: column end (bp)
+            norm: normalization method
+
+        Returns:
+            ContactSource object
+        """
+        matrix_cache = get_matrix_cache(hic_file, resolution, norm)
+        if matrix_cache is not None:
+            return cls.from_dense(matrix_cache.slice(x_start, x_end, y_start, y_end), resolution, x_start, y_start)
+        return cls.from_straw(get_matrix_zoom_data(hic_file, resolution, norm), resolution,
+                              x_start, x_end, y_start, y_end)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def nnz(self):
+        return self.matrix.nnz
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def row(self, index):
+        """
+            dense row
+        Args:
+            index: row index (bins from region start)
+
+        Returns:
+            1-D array
+        """
+        return self.matrix.getrow(index).toarray().ravel()
+
+    def rows(self, start, end):
+        """
+            row slice [start, end)
+        Args:
+            start: first row index
+            end: end row index
+
+        Returns:
+            ContactSource object
+        """
+        return ContactSource(self.matrix[start:end], self.resolution, (self.x_bin + start) * self.resolution,
+                             self.y_bin * self.resolution)
+
+    def cols(self, start, end):
+        """
+            column slice [start, end)
+        Args:
+            start: first column index
+            end: end column index
+
+        Returns:
+            ContactSource object
+        """
+        return ContactSource(self.matrix[:, start:end], self.resolution, self.x_bin * self.resolution,
+                             (self.y_bin + start) * self.resolution)
+
+    def select(self, row_mask, col_mask):
+        """
+            keep rows and columns of masks
+        Args:
+            row_mask: bool array of rows
+            col_mask: bool array of columns
+
+        Returns:
+            scipy CSR matrix
+        """
+        return self.matrix[np.flatnonzero(row_mask)][:, np.flatnonzero(col_mask)]
+
+    def row_sums(self):
+        """
+            marginal sum of each row
+        Returns:
+            1-D array
+        """
+        return np.asarray(self.matrix.sum(axis=1)).ravel()
+
+    def col_sums(self):
+        """
+            marginal sum of each column
+        Returns:
+            1-D array
+        """
+        return np.asarray(self.matrix.sum(axis=0)).ravel()
+
+    def nonempty_rows(self):
+        """
+            rows with at least one contact
+        Returns:
+            bool array
+        """
+        return np.diff(self.matrix.indptr) > 0
+
+    def nonempty_cols(self):
+        """
+            columns with at least one contact
+        Returns:
+            bool array
+        """
+        return np.bincount(self.matrix.indices, minlength=self.matrix.shape[1]) > 0
+
+    def argmax(self):
+        """
+            (row, column) of max value, same as np.unravel_index(np.argmax(dense), shape)
+        Returns:
+            (row index, column index)
+        """
+        n_cols = self.matrix.shape[1]
+        if self.matrix.nnz == 0:
+            return 0, 0
+
+        coo = self.matrix.tocoo()
+        flat = coo.row.astype(np.int64) * n_cols + coo.col
+        if np.isnan(coo.data).any():  # np.argmax stops at the first nan
+            return divmod(int(flat[np.isnan(coo.data)].min()), n_cols)
+
+        max_value = coo.data.max()
+        if max_value < 0 and self.matrix.nnz < self.matrix.shape[0] * n_cols:
+            # max is an implicit zero, find the first cell not stored
+            stored = np.sort(flat)
+            gaps = stored != np.arange(len(stored))
+            return divmod(int(np.argmax(gaps)) if gaps.any() else len(stored), n_cols)
+        return divmod(int(flat[coo.data == max_value].min()), n_cols)
+
+    def percentile(self, q):
+        """
+            percentile over all cells including zeros, same as np.percentile(dense, q)
+        Args:
+            q: percentile (0 - 100)
+
+        Returns:
+            percentile value
+        """
+        size = self.matrix.shape[0] * self.matrix.shape[1]
+        data = self.matrix.data
+        if size == 0:
+            return np.nan
+        if np.isnan(data).any():
+            return np.nan
+
+        # sorted cells: negative values, implicit zeros, positive values
+        data = np.sort(data)
+        n_negative = int(np.searchsorted(data, 0))
+        n_zero = size - len(data)
+
+        def value(k):
+            if k < n_negative:
+                return float(data[k])
+            if k < n_negative + n_zero:
+                return 0.0
+            return float(data[k - n_zero])
+
+        index = q / 100 * (size - 1)
+        low, high = math.floor(index), math.ceil(index)
+        return value(low) + (value(high) - value(low)) * (index - low)
+
+    def toarray(self):
+        """
+            densify
+        Returns:
+            dense float32 matrix
+        """
+        return self.matrix.toarray()
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: cpu_infer.py
+@time: 10/17/26 7:40 PM
+@function: CPU inference mode of detector: thread tuning, channels-last, bf16 autocast and int8 dynamic quantization
+"""
+
+import json
+import os
+
+import numpy as np
+import torch
+from mmdet.apis import init_detector
+from torch import nn
+
+from src.common.batch_infer import BatchDetector
+from src.utils.logger import logger
+
+PRECISIONS = ("fp32", "bf16", "int8")
+
+
+def configure_cpu_threads(n_cpu):
+    """
+        torch intra-op threads of each forward pass, one inter-op thread (tiles are preprocessed in other threads)
+    Args:
+        n_cpu: cpu number
+
+    Returns:
+        None
+    """
+    torch.set_num_threads(max(int(n_cpu), 1))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:  # can only be set once, before any inter-op parallel work
+        pass
+    logger.info("CPU inference threads: %s\n" % torch.get_num_threads())
+
+
+def optimize_cpu_model(model, precision="fp32", channels_last=False):
+    """
+        convert detector from init_detector for CPU inference in place
+    Args:
+        model: detector on cpu
+        precision: fp32, bf16 (autocast of Swin backbone) or int8 (dynamic quantization of linear layers)
+        channels_last: convolution weights in channels-last memory format (check it with accuracy_regression)
+
+    Returns:
+        model
+    """
+    if precision not in PRECISIONS:
+        raise ValueError("CPU precision must be one of %s, got %s" % (PRECISIONS, precision))
+
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
+        neck_forward = model.neck.forward
+
+        def contiguous_neck(*args, **kwargs):
+            # mmcv RoIAlign reads NCHW buffers
+            return tuple(out.contiguous() for out in neck_forward(*args, **kwargs))
+
+        model.neck.forward = contiguous_neck
+
+    if precision == "bf16":
+        backbone_forward = model.backbone.forward
+
+        def bf16_backbone(*args, **kwargs):
+            with torch.autocast("cpu", dtype=torch.bfloat16):
+                outs = backbone_forward(*args, **kwargs)
+            return tuple(out.float() for out in outs)
+
+        model.backbone.forward = bf16_backbone
+    elif precision == "int8":
+        # Swin attention / mlp and ConvFC bbox head fc layers
+        torch.quantization.quantize_dynamic(model.backbone, {nn.Linear}, dtype=torch.qint8, inplace=True)
+        bbox_heads = model.roi_head.bbox_head
+        for bbox_head in (bbox_heads if isinstance(bbox_heads, nn.ModuleList) else [bbox_heads]):
+            torch.quantization.quantize_dynamic(bbox_head, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+    logger.info("CPU inference mode: %s, channels last %s\n" % (precision, channels_last))
+    return model
+
+
+def init_cpu_detector(model_cfg, pretrained_model, precision="fp32", channels_last=False):
+    """
+        init_detector on cpu, then optimize it for CPU inference
+    Args:
+        model_cfg: model config path
+        pretrained_model: pretrained model path
+        precision: fp32, bf16 or int8
+        channels_last: convolution weights in channels-last memory format (default: False, same as init_detector)
+
+    Returns:
+        model
+    """
+    model = init_detector(model_cfg, pretrained_model, device="cpu")
+    return optimize_cpu_model(model, precision, channels_last)
+
+
+def box_iou(boxes_1, boxes_2):
+    """
+        iou of each box pair
+    Args:
+        boxes_1: (n, 4) x1, y1, x2, y2
+        boxes_2: (m, 4) x1, y1, x2, y2
+
+    Returns:
+        (n, m) iou
+    """
+    x1 = np.maximum(boxes_1[:, None, 0], boxes_2[None, :, 0])
+    y1 = np.maximum(boxes_1[:, None, 1], boxes_2[None, :, 1])
+    x2 = np.minimum(boxes_1[:, None, 2], boxes_2[None, :, 2])
+    y2 = np.minimum(boxes_1[:, None, 3], boxes_2[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_1 = (boxes_1[:, 2] - boxes_1[:, 0]) * (boxes_1[:, 3] - boxes_1[:, 1])
+    area_2 = (boxes_2[:, 2] - boxes_2[:, 0]) * (boxes_2[:, 3] - boxes_2[:, 1])
+    return inter / np.maximum(area_1[:, None] + area_2[None, :] - inter, 1e-9)
+
+
+def compare_detections(reference, candidate, score=0.9, iou_score=0.5):
+    """
+        match boxes of candidate detections to reference detections of each class, greedy by iou
+    Args:
+        reference: bbox results of each tile (list of per class (n, 5) arrays)
+        candidate: bbox results of each tile, same tiles as reference
+        score: boxes below score are ignored (same threshold as error filtering)
+        iou_score: min iou of matched boxes
+
+    Returns:
+        {"reference": boxes, "candidate": boxes, "matched": boxes, "mean_iou": iou, "max_score_diff": score}
+    """
+    n_reference, n_candidate, ious, score_diffs = 0, 0, [], [0.0]
+    for ref_tile, cand_tile in zip(reference, candidate):
+        for ref_boxes, cand_boxes in zip(ref_tile, cand_tile):
+            ref_boxes = ref_boxes[ref_boxes[:, 4] >= score]
+            cand_boxes = cand_boxes[cand_boxes[:, 4] >= score]
+            n_reference += len(ref_boxes)
+            n_candidate += len(cand_boxes)
+            if not len(ref_boxes) or not len(cand_boxes):
+                continue
+
+            iou = box_iou(ref_boxes[:, :4], cand_boxes[:, :4])
+            while iou.size and iou.max() >= iou_score:
+                i, j = np.unravel_index(np.argmax(iou), iou.shape)
+                ious.append(float(iou[i, j]))
+                score_diffs.append(abs(float(ref_boxes[i, 4] - cand_boxes[j, 4])))
+                iou[i, :] = -1
+                iou[:, j] = -1
+
+    return {"reference": n_reference, "candidate": n_candidate, "matched": len(ious),
+            "mean_iou": float(np.mean(ious)) if ious else 1.0, "max_score_diff": max(score_diffs)}
+
+
+def accuracy_regression(model_cfg, pretrained_model, img_path, precisions=("bf16", "int8"), n_tiles=32, n_cpu=4,
+                        batch_size=4, score=0.9):
+    """
+        compare detections of CPU inference modes (precision, with and without channels last) with fp32 on a fixed
+        tile set (first tiles of info.txt), a mode matches when every fp32 box is matched and no box is added
+    Args:
+        model_cfg: model config path
+        pretrained_model: pretrained model path
+        img_path: png folder with info.txt
+        precisions: CPU precisions compared with fp32
+        n_tiles: tiles of the set
+        n_cpu: cpu number
+        batch_size: tiles of each forward pass
+        score: boxes below score are ignored
+
+    Returns:
+        {mode: compare_detections result with "tiles/s" and "matches"}
+    """
+    configure_cpu_threads(n_cpu)
+    with open(os.path.join(img_path, "info.txt"), "r") as f:
+        tiles = [list(json.loads(line).keys())[0] for line in f.readlines()[:n_tiles]]
+
+    def detect(precision, channels_last):
+        model = init_cpu_detector(model_cfg, pretrained_model, precision, channels_last)
+        detector = BatchDetector(model, batch_size=batch_size, workers=n_cpu)
+        results = [result[0] for _, result in detector.detect((tile, tile) for tile in tiles)]
+        return results, detector.throughput()
+
+    reference, reference_speed = detect("fp32", False)
+    report = {"fp32": {"tiles/s": reference_speed}}
+    logger.info("fp32: %.2f tiles/s\n" % reference_speed)
+    for precision in ("fp32",) + tuple(precisions):
+        for channels_last in ((True,) if precision == "fp32" else (False, True)):
+            results, speed = detect(precision, channels_last)
+            name = precision + ("_channels_last" if channels_last else "")
+            report[name] = dict(compare_detections(reference, results, score=score), **{"tiles/s": speed})
+            report[name]["matches"] = report[name]["matched"] == report[name]["reference"] == report[name]["candidate"]
+            logger.info("%s: %s\n" % (name, report[name]))
+    return report
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: detector_runtime.py
+@time: 10/17/26 8:20 PM
+@function: TorchScript runtime of cascade detectors, traced backbone / neck / heads with NumPy pre- and post-processing
+"""
+
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+import torch
+from torch import nn
+from torchvision.ops import roi_align
+
+from src.common.batch_infer import BatchDetector
+from src.utils.logger import logger
+
+META_NAME = "meta.json"
+
+
+class _Features(nn.Module):
+    """
+        backbone, neck and rpn head convolutions: features of each level, rpn scores, rpn deltas
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.backbone = model.backbone
+        self.neck = model.neck
+        self.rpn_head = model.rpn_head
+
+    def forward(self, img):
+        feats = self.neck(self.backbone(img))
+        cls_scores, bbox_preds = self.rpn_head(feats)
+        return tuple(feats) + tuple(cls_scores) + tuple(bbox_preds)
+
+
+class _Runtime(nn.Module):
+    """
+        container of traced modules, bbox head of each cascade stage is kept as stage_<i>
+    """
+
+    def __init__(self, features, stages):
+        super().__init__()
+        self.features = features
+        for i, stage in enumerate(stages):
+            setattr(self, "stage_%s" % i, stage)
+
+    def forward(self, img):
+        return self.features(img)
+
+
+def pipeline_meta(pipeline):
+    """
+        resize, normalize and pad settings of mmdet test pipeline
+    Args:
+        pipeline: cfg.data.test.pipeline
+
+    Returns:
+        dict
+    """
+    meta = {}
+    for step in pipeline:
+        if step["type"] == "MultiScaleFlipAug":
+            meta["img_scale"] = list(step["img_scale"])
+            for transform in step["transforms"]:
+                if transform["type"] == "Resize":
+                    meta["keep_ratio"] = transform.get("keep_ratio", True)
+                elif transform["type"] == "Normalize":
+                    meta["mean"], meta["std"] = list(transform["mean"]), list(transform["std"])
+                    meta["to_rgb"] = transform.get("to_rgb", True)
+                elif transform["type"] == "Pad":
+                    meta["size_divisor"] = transform["size_divisor"]
+    return meta
+
+
+def preprocess(img, meta):
+    """
+        same as mmdet test pipeline: keep ratio resize, normalize, pad to size divisor
+    Args:
+        img: BGR image array
+        meta: runtime meta
+
+    Returns:
+        (3, h, w) float32 array, img_shape (h, w), scale_factor (w, h, w, h)
+    """
+    h, w = img.shape[:2]
+    if meta["keep_ratio"]:
+        long_edge, short_edge = max(meta["img_scale"]), min(meta["img_scale"])
+        scale = min(long_edge / max(h, w), short_edge / min(h, w))
+        new_w, new_h = int(w * float(scale) + 0.5), int(h * float(scale) + 0.5)
+    else:
+        new_w, new_h = meta["img_scale"]
+    img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    scale_factor = np.array([new_w / w, new_h / h, new_w / w, new_h / h], dtype=np.float32)
+
+    img = img.astype(np.float32)
+    if meta["to_rgb"]:
+        cv2.cvtColor(img, cv2.COLOR_BGR2RGB, img)
+    cv2.subtract(img, np.array(meta["mean"], dtype=np.float64).reshape(1, -1), img)
+    cv2.multiply(img, 1 / np.array(meta["std"], dtype=np.float64).reshape(1, -1), img)
+
+    divisor = meta["size_divisor"]
+    pad_h, pad_w = -(-new_h // divisor) * divisor, -(-new_w // divisor) * divisor
+    img = np.pad(img, ((0, pad_h - new_h), (0, pad_w - new_w), (0, 0)))
+    return np.ascontiguousarray(img.transpose(2, 0, 1)), (new_h, new_w), scale_factor
+
+
+def delta2bbox(rois, deltas, means, stds, max_shape, wh_ratio_clip=16 / 1000):
+    """
+        apply (n, 4 * k) deltas to (n, 4) boxes, clip to max_shape (h, w), same as mmdet delta2bbox
+    Args:
+        rois: base boxes
+        deltas: encoded offsets
+        means: denormalizing means
+        stds: denormalizing stds
+        max_shape: image shape (h, w)
+        wh_ratio_clip: max aspect ratio
+
+    Returns:
+        (n, 4 * k) boxes
+    """
+    k = deltas.shape[1] // 4
+    deltas = deltas * np.tile(np.asarray(stds, np.float32), k) + np.tile(np.asarray(means, np.float32), k)
+    max_ratio = np.float32(abs(np.log(wh_ratio_clip)))
+    dx, dy = deltas[:, 0::4], deltas[:, 1::4]
+    dw, dh = np.clip(deltas[:, 2::4], -max_ratio, max_ratio), np.clip(deltas[:, 3::4], -max_ratio, max_ratio)
+
+    px, py = ((rois[:, 0] + rois[:, 2]) * 0.5)[:, None], ((rois[:, 1] + rois[:, 3]) * 0.5)[:, None]
+    pw, ph = (rois[:, 2] - rois[:, 0])[:, None], (rois[:, 3] - rois[:, 1])[:, None]
+    gw, gh = pw * np.exp(dw), ph * np.exp(dh)
+    gx, gy = px + pw * dx, py + ph * dy
+
+    bboxes = np.stack([gx - gw * 0.5, gy - gh * 0.5, gx + gw * 0.5, gy + gh * 0.5], axis=-1).reshape(deltas.shape)
+    bboxes[:, 0::2] = np.clip(bboxes[:, 0::2], 0, max_shape[1])
+    bboxes[:, 1::2] = np.clip(bboxes[:, 1::2], 0, max_shape[0])
+    return bboxes.astype(np.float32)
+
+
+def nms(boxes, scores, iou_threshold):
+    """
+        greedy nms, same as mmcv nms (offset 0)
+    Args:
+        boxes: (n, 4) boxes
+        scores: (n, ) scores
+        iou_threshold: boxes overlapping a kept box more than this are removed
+
+    Returns:
+        kept indices, score descending
+    """
+    order = np.argsort(-scores, kind="stable")
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.maximum(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0)
+        h = np.maximum(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def batched_nms(boxes, scores, idxs, iou_threshold):
+    """
+        nms inside each group of idxs, same as mmcv batched_nms
+    Args:
+        boxes: (n, 4) boxes
+        scores: (n, ) scores
+        idxs: (n, ) group of each box
+        iou_threshold: nms iou threshold
+
+    Returns:
+        (k, 5) boxes with score, kept indices
+    """
+    if not len(boxes):
+        return np.zeros((0, 5), np.float32), np.zeros(0, np.int64)
+    offsets = idxs.astype(boxes.dtype) * (boxes.max() + 1)
+    keep = nms(boxes + offsets[:, None], scores, iou_threshold)
+    return np.hstack([boxes[keep], scores[keep, None]]).astype(np.float32), keep
+
+
+def export_detector(model_cfg, pretrained_model, img_file, runtime_file):
+    """
+        trace detector on the tile size of img_file and save TorchScript runtime
+    Args:
+        model_cfg: model config path
+        pretrained_model: pretrained model path
+        img_file: sample tile, every tile of the runtime has its (padded) size
+        runtime_file: output runtime path
+
+    Returns:
+        runtime meta
+    """
+    from mmdet.apis import init_detector
+
+    model = init_detector(model_cfg, pretrained_model, device="cpu")
+    meta = pipeline_meta(model.cfg.data.test.pipeline)
+    img, _, _ = preprocess(cv2.imread(img_file, cv2.IMREAD_COLOR), meta)
+    meta["input_shape"] = list(img.shape)
+
+    rpn_head, roi_head = model.rpn_head, model.roi_head
+    anchor_generator = rpn_head.anchor_generator
+    meta["rpn"] = {
+        "strides": [list(stride) for stride in anchor_generator.strides],
+        "base_anchors": [anchors.tolist() for anchors in anchor_generator.base_anchors],
+        "means": list(rpn_head.bbox_coder.means), "stds": list(rpn_head.bbox_coder.stds),
+        "nms_pre": rpn_head.test_cfg.nms_pre, "max_per_img": rpn_head.test_cfg.max_per_img,
+        "iou_threshold": rpn_head.test_cfg.nms.iou_threshold
+    }
+    extractor = roi_head.bbox_roi_extractor[0]
+    meta["roi"] = {
+        "strides": list(extractor.featmap_strides), "finest_scale": extractor.finest_scale,
+        "output_size": list(extractor.roi_layers[0].output_size),
+        "sampling_ratio": extractor.roi_layers[0].sampling_ratio, "aligned": extractor.roi_layers[0].aligned
+    }
+    meta["stages"] = [{"means": list(head.bbox_coder.means), "stds": list(head.bbox_coder.stds),
+                       "reg_class_agnostic": head.reg_class_agnostic} for head in roi_head.bbox_head]
+    meta["rcnn"] = {"score_thr": roi_head.test_cfg.score_thr, "iou_threshold": roi_head.test_cfg.nms.iou_threshold,
+                    "max_per_img": roi_head.test_cfg.max_per_img}
+    meta["num_classes"] = roi_head.bbox_head[-1].num_classes
+    meta["classes"] = list(model.CLASSES)
+
+    with torch.no_grad():
+        features = torch.jit.trace(_Features(model).eval(), torch.from_numpy(img)[None])
+        roi_feats = torch.rand(8, extractor.out_channels, *meta["roi"]["output_size"])
+        stages = [torch.jit.trace(head.eval(), roi_feats) for head in roi_head.bbox_head]
+    runtime = torch.jit.script(_Runtime(features, stages))
+    torch.jit.save(runtime, runtime_file, _extra_files={META_NAME: json.dumps(meta)})
+    logger.info("Export detector runtime: %s, input shape %s\n" % (runtime_file, meta["input_shape"]))
+    return meta
+
+
+class RuntimeDetector(BatchDetector):
+    """
+        BatchDetector on TorchScript runtime from export_detector, results are (bbox result, None) like mmdet
+    """
+
+    def __init__(self, runtime_file, workers=4, fallback=None):
+        """
+        Args:
+            runtime_file: runtime path
+            workers: preprocessing threads
+            fallback: function building the eager BatchDetector, it detects tiles whose input shape is not the
+                      exported one (e.g. chromosome images of different sizes), None: such tiles raise ValueError
+        """
+        extra_files = {META_NAME: ""}
+        self.runtime = torch.jit.load(runtime_file, map_location="cpu", _extra_files=extra_files)
+        self.runtime.eval()
+        self.meta = json.loads(extra_files[META_NAME])
+        self.stages = [getattr(self.runtime, "stage_%s" % i) for i in range(len(self.meta["stages"]))]
+
+        self.batch_size = 1  # traced on one tile
+        self.workers = max(int(workers), 1)
+        self.fallback = fallback
+        self.eager = None  # built on first tile of another shape
+        self.lock = threading.Lock()  # prepare runs on preprocessing threads
+        self.tiles = 0
+        self.seconds = 0
+
+    def prepare(self, img):
+        """
+            preprocess one tile
+        Args:
+            img: image path or BGR image array
+
+        Returns:
+            (image array, img_shape, scale_factor), or (None, eager pipeline result) when the input shape is not
+            the exported one and fallback is given
+        """
+        if not isinstance(img, np.ndarray):
+            img = cv2.imread(img, cv2.IMREAD_COLOR)
+        data = preprocess(img, self.meta)
+        if list(data[0].shape) != self.meta["input_shape"]:
+            if self.fallback is None:
+                raise ValueError("Runtime is exported for input shape %s, got %s, export it again with a tile of "
+                                 "this size" % (self.meta["input_shape"], list(data[0].shape)))
+            return None, self.eager_detector(data[0].shape).prepare(img)
+        return data
+
+    def eager_detector(self, shape):
+        """
+            eager detector of tiles of another input shape, built once
+        Args:
+            shape: input shape of the tile
+
+        Returns:
+            BatchDetector
+        """
+        with self.lock:
+            if self.eager is None:
+                logger.warning("Runtime is exported for input shape %s, got %s, use the eager model for such "
+                               "tiles\n" % (self.meta["input_shape"], list(shape)))
+                self.eager = self.fallback()
+        return self.eager
+
+    def forward(self, datas):
+        """
+            run runtime on each tile, tiles of another input shape on the eager model
+        Args:
+            datas: prepare results
+
+        Returns:
+            detection result of each tile
+        """
+        return [self.eager.forward([data[1]])[0] if data[0] is None else self.infer(*data) for data in datas]
+
+    def infer(self, img, img_shape, scale_factor):
+        """
+            detect one preprocessed tile
+        Args:
+            img: (3, h, w) array
+            img_shape: resized shape (h, w)
+            scale_factor: (w, h, w, h)
+
+        Returns:
+            (bbox result of each class, None)
+        """
+        meta = self.meta
+        n_levels = len(meta["rpn"]["strides"])
+        with torch.no_grad():
+            outs = self.runtime(torch.from_numpy(img)[None])
+        feats = outs[:n_levels]
+        rpn_scores = [out[0].numpy() for out in outs[n_levels:2 * n_levels]]
+        rpn_deltas = [out[0].numpy() for out in outs[2 * n_levels:]]
+
+        rois = self.rpn_proposals(rpn_scores, rpn_deltas, img_shape)[:, :4]
+        num_classes = meta["num_classes"]
+        if not len(rois):
+            return [np.zeros((0, 5), np.float32) for _ in range(num_classes)], None
+
+        ms_scores = []
+        for i, stage in enumerate(self.stages):
+            with torch.no_grad():
+                cls_score, bbox_pred = stage(self.roi_features(feats, rois))
+            cls_score, bbox_pred = cls_score.numpy(), bbox_pred.numpy()
+            ms_scores.append(cls_score)
+
+            if i < len(self.stages) - 1:
+                if not meta["stages"][i]["reg_class_agnostic"]:
+                    label = cls_score[:, :-1].argmax(axis=1)
+                    bbox_pred = np.take_along_axis(bbox_pred, label[:, None] * 4 + np.arange(4), axis=1)
+                rois = delta2bbox(rois, bbox_pred, meta["stages"][i]["means"], meta["stages"][i]["stds"], img_shape)
+
+        # average scores of stages, decode with last stage
+        cls_score = sum(ms_scores) / float(len(ms_scores))
+        scores = np.exp(cls_score - cls_score.max(axis=1, keepdims=True))
+        scores /= scores.sum(axis=1, keepdims=True)
+        bboxes = delta2bbox(rois, bbox_pred, meta["stages"][-1]["means"], meta["stages"][-1]["stds"], img_shape)
+        bboxes /= np.tile(scale_factor, bboxes.shape[1] // 4)
+
+        det_bboxes, det_labels = self.multiclass_nms(bboxes, scores)
+        return [det_bboxes[det_labels == i] for i in range(num_classes)], None
+
+    def rpn_proposals(self, rpn_scores, rpn_deltas, img_shape):
+        """
+            proposals from rpn outputs, same as mmdet RPNHead get_bboxes
+        Args:
+            rpn_scores: (anchors, h, w) score logits of each level
+            rpn_deltas: (anchors * 4, h, w) deltas of each level
+            img_shape: resized shape (h, w)
+
+        Returns:
+            (n, 5) proposals with score
+        """
+        cfg = self.meta["rpn"]
+        scores, deltas, anchors, level_ids = [], [], [], []
+        for level, (score, delta) in enumerate(zip(rpn_scores, rpn_deltas)):
+            feat_h, feat_w = score.shape[-2:]
+            stride_w, stride_h = cfg["strides"][level]
+            shift_x, shift_y = np.meshgrid(np.arange(feat_w) * stride_w, np.arange(feat_h) * stride_h)
+            shifts = np.stack([shift_x.ravel(), shift_y.ravel()] * 2, axis=1).astype(np.float32)
+            level_anchors = (np.asarray(cfg["base_anchors"][level], np.float32)[None] + shifts[:, None]).reshape(-1, 4)
+
+            score = 1 / (1 + np.exp(-score.transpose(1, 2, 0).ravel()))
+            delta = delta.transpose(1, 2, 0).reshape(-1, 4)
+            if 0 < cfg["nms_pre"] < len(score):
+                top = np.argsort(-score, kind="stable")[:cfg["nms_pre"]]
+                score, delta, level_anchors = score[top], delta[top], level_anchors[top]
+            scores.append(score)
+            deltas.append(delta)
+            anchors.append(level_anchors)
+            level_ids.append(np.full(len(score), level))
+
+        proposals = delta2bbox(np.concatenate(anchors), np.concatenate(deltas), cfg["means"], cfg["stds"], img_shape)
+        dets, _ = batched_nms(proposals, np.concatenate(scores).astype(np.float32), np.concatenate(level_ids),
+                              cfg["iou_threshold"])
+        return dets[:cfg["max_per_img"]]
+
+    def roi_features(self, feats, rois):
+        """
+            RoIAlign features of each roi on its level, same as mmdet SingleRoIExtractor
+        Args:
+            feats: feature maps of each level
+            rois: (n, 4) boxes
+
+        Returns:
+            (n, channels, size, size) roi features
+        """
+        cfg = self.meta["roi"]
+        n_levels = len(cfg["strides"])
+        scale = np.sqrt((rois[:, 2] - rois[:, 0]) * (rois[:, 3] - rois[:, 1]))
+        levels = np.clip(np.floor(np.log2(scale / cfg["finest_scale"] + 1e-6)), 0, n_levels - 1).astype(np.int64)
+
+        boxes = torch.from_numpy(np.hstack([np.zeros((len(rois), 1), np.float32), rois]))
+        roi_feats = feats[0].new_zeros(len(rois), feats[0].shape[1], *cfg["output_size"])
+        for level in range(n_levels):
+            inds = torch.from_numpy(np.flatnonzero(levels == level))
+            if len(inds):
+                roi_feats[inds] = roi_align(feats[level], boxes[inds], cfg["output_size"],
+                                            spatial_scale=1 / cfg["strides"][level],
+                                            sampling_ratio=cfg["sampling_ratio"], aligned=cfg["aligned"])
+        return roi_feats
+
+    def multiclass_nms(self, bboxes, scores):
+        """
+            score threshold and class wise nms, same as mmdet multiclass_nms
+        Args:
+            bboxes: (n, 4) or (n, classes * 4) boxes
+            scores: (n, classes + 1) scores, last column is background
+
+        Returns:
+            (k, 5) boxes with score, (k, ) labels
+        """
+        cfg = self.meta["rcnn"]
+        num_classes = scores.shape[1] - 1
+        if bboxes.shape[1] > 4:
+            bboxes = bboxes.reshape(len(scores), -1, 4)
+        else:
+            bboxes = np.repeat(bboxes[:, None], num_classes, axis=1)
+        bboxes, scores = bboxes.reshape(-1, 4), scores[:, :-1].reshape(-1)
+        labels = np.tile(np.arange(num_classes), len(bboxes) // num_classes)
+
+        valid = scores > cfg["score_thr"]
+        bboxes, scores, labels = bboxes[valid], scores[valid], labels[valid]
+        dets, keep = batched_nms(bboxes, scores.astype(np.float32), labels, cfg["iou_threshold"])
+        if cfg["max_per_img"] > 0:
+            dets, keep = dets[:cfg["max_per_img"]], keep[:cfg["max_per_img"]]
+        return dets, labels[keep]
+
+
+def verify_runtime(model_cfg, pretrained_model, runtime_file, img_path, n_tiles=32, score=0.9):
+    """
+        compare runtime detections with the eager model on a fixed tile set (first tiles of info.txt)
+    Args:
+        model_cfg: model config path
+        pretrained_model: pretrained model path
+        runtime_file: runtime path
+        img_path: png folder with info.txt
+        n_tiles: tiles of the set
+        score: boxes below score are ignored
+
+    Returns:
+        compare_detections result
+    """
+    from mmdet.apis import init_detector
+    from src.common.cpu_infer import compare_detections
+
+    with open(os.path.join(img_path, "info.txt"), "r") as f:
+        tiles = [list(json.loads(line).keys())[0] for line in f.readlines()[:n_tiles]]
+
+    eager = BatchDetector(init_detector(model_cfg, pretrained_model, device="cpu"), batch_size=1)
+    reference = [result[0] for _, result in eager.detect((tile, tile) for tile in tiles)]
+    runtime = RuntimeDetector(runtime_file)
+    results = [result[0] for _, result in runtime.detect((tile, tile) for tile in tiles)]
+
+    report = dict(compare_detections(reference, results, score=score),
+                  **{"eager tiles/s": eager.throughput(), "runtime tiles/s": runtime.throughput()})
+    logger.info("Runtime check: %s\n" % report)
+    return report
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: detector_server.py
+@time: 10/17/26 9:50 PM
+@function: local detector daemon on a Unix socket, tiles of concurrent jobs are batched together
+"""
+
+import io
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+from src.utils.logger import logger
+
+_SIZES = struct.Struct("!QQ")  # header length, payload length
+
+
+def _recv_exact(sock, size):
+    """
+        read size bytes, None when the connection is closed before the first byte
+    """
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            if received == 0:
+                return None
+            raise ConnectionError("Connection closed in the middle of a message")
+        received += n
+    return bytes(data)
+
+
+def send_message(sock, header, arrays=None):
+    """
+        send json header and arrays (npz, no pickle)
+    Args:
+        sock: connected socket
+        header: json serializable dict
+        arrays: {name: ndarray}
+
+    Returns:
+        None
+    """
+    payload = b""
+    if arrays:
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        payload = buffer.getvalue()
+    head = json.dumps(header).encode()
+    sock.sendall(_SIZES.pack(len(head), len(payload)) + head + payload)
+
+
+def recv_message(sock):
+    """
+        receive message of send_message
+    Args:
+        sock: connected socket
+
+    Returns:
+        (header, {name: ndarray}), None when the connection is closed
+    """
+    sizes = _recv_exact(sock, _SIZES.size)
+    if sizes is None:
+        return None
+    head_len, payload_len = _SIZES.unpack(sizes)
+    header = json.loads(_recv_exact(sock, head_len))
+    arrays = {}
+    if payload_len:
+        with np.load(io.BytesIO(_recv_exact(sock, payload_len)), allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+    return header, arrays
+
+
+class _DetectorHandler(socketserver.BaseRequestHandler):
+    """
+        one client connection: preprocess its tiles, queue them, send back detections
+    """
+
+    def handle(self):
+        while True:
+            message = recv_message(self.request)
+            if message is None:
+                return
+            header, arrays = message
+            try:
+                detector = self.server.detector(header["model"])
+                datas = [detector.prepare(arrays["img_%s" % i]) for i in range(header["tiles"])]
+                results = [future.result() for future in self.server.submit(header["model"], datas)]
+            except Exception as e:
+                send_message(self.request, {"error": "%s: %s" % (type(e).__name__, e)})
+                continue
+
+            bboxes = {"bbox_%s_%s" % (i, c): np.asarray(boxes, dtype=np.float32)
+                      for i, result in enumerate(results) for c, boxes in enumerate(result[0])}
+            send_message(self.request, {"tiles": len(results), "classes": len(results[0][0]) if results else 0},
+                         bboxes)
+
+
+class DetectorServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+        Detectors of a DetectorRegistry served on a Unix socket with dynamic batching
+    """
+    daemon_threads = True
+
+    def __init__(self, registry, socket_path, max_batch=8, max_latency=0.05):
+        """
+        Args:
+            registry: DetectorRegistry with error / chromosome detectors
+            socket_path: Unix socket path
+            max_batch: max tiles of each forward pass
+            max_latency: max seconds a tile waits for other tiles of its batch
+        """
+        self.registry = registry
+        self.max_batch = max(int(max_batch), 1)
+        self.max_latency = max_latency
+        self.queues = {}  # {model name: tile queue}
+        self.lock = threading.Lock()
+
+        if os.path.exists(socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+            except ConnectionRefusedError:  # left by a stopped server
+                os.remove(socket_path)
+            else:
+                raise OSError("Detector server is already listening on %s" % socket_path)
+            finally:
+                probe.close()
+        super().__init__(socket_path, _DetectorHandler)
+
+    def detector(self, name):
+        """
+            loaded detector of name, the batching thread of it is started on first use
+        Args:
+            name: detector name
+
+        Returns:
+            detector
+        """
+        with self.lock:
+            detector = self.registry.get(name)
+            if name not in self.queues:
+                self.queues[name] = queue.Queue()
+                threading.Thread(target=self.batch_loop, args=(name, detector, self.queues[name]),
+                                 daemon=True).start()
+        return detector
+
+    def submit(self, name, datas):
+        """
+            queue preprocessed tiles
+        Args:
+            name: detector name
+            datas: prepare results
+
+        Returns:
+            future of each tile
+        """
+        futures = []
+        for data in datas:
+            future = Future()
+            self.queues[name].put((data, future))
+            futures.append(future)
+        return futures
+
+    def batch_loop(self, name, detector, tile_queue):
+        """
+            collect tiles of all clients until max_batch tiles or max_latency seconds, run one forward pass
+        Args:
+            name: detector name
+            detector: loaded detector
+            tile_queue: (data, future) queue
+
+        Returns:
+            None
+        """
+        while True:
+            batch = [tile_queue.get()]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(tile_queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                results = detector.forward([data for data, _ in batch])
+            except Exception as e:
+                logger.error("%s detector failed on a batch of %s tiles: %s\n" % (name, len(batch), e))
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                # tiles of other clients must not fail with the bad one: run tile by tile, errors go to their sender
+                for data, future in batch:
+                    try:
+                        future.set_result(detector.forward([data])[0])
+                    except Exception as tile_error:
+                        future.set_exception(tile_error)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+def serve_detectors(registry, socket_path, max_batch=8, max_latency=0.05):
+    """
+        run detector server until interrupted
+    Args:
+        registry: DetectorRegistry with error / chromosome detectors
+        socket_path: Unix socket path
+        max_batch: max tiles of each forward pass
+        max_latency: max seconds a tile waits for other tiles of its batch
+
+    Returns:
+        None
+    """
+    with DetectorServer(registry, socket_path, max_batch, max_latency) as server:
+        logger.info("Detector server listening on %s\n" % socket_path)
+        try:
+            server.serve_forever()
+        finally:
+            try:
+                os.remove(socket_path)
+            except FileNotFoundError:
+                pass
+
+
+class RemoteDetector:
+    """
+        Client of DetectorServer, same detect interface as BatchDetector, results are (bbox result, None)
+    """
+
+    def __init__(self, socket_path, name, batch_size=8):
+        """
+        Args:
+            socket_path: Unix socket path of server
+            name: detector name on server
+            batch_size: tiles of each request
+        """
+        self.socket_path = socket_path
+        self.name = name
+        self.batch_size = max(int(batch_size), 1)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+
+        self.tiles = 0
+        self.seconds = 0
+
+    def request(self, images):
+        """
+            detect tiles on server
+        Args:
+            images: BGR image arrays
+
+        Returns:
+            detection result of each tile
+        """
+        send_message(self.sock, {"model": self.name, "tiles": len(images)},
+                     {"img_%s" % i: img for i, img in enumerate(images)})
+        message = recv_message(self.sock)
+        if message is None:
+            raise ConnectionError("Detector server %s closed the connection" % self.socket_path)
+        header, arrays = message
+        if "error" in header:
+            raise RuntimeError("Detector server: %s" % header["error"])
+        return [([arrays["bbox_%s_%s" % (i, c)] for c in range(header["classes"])], None)
+                for i in range(header["tiles"])]
+
+    def detect(self, items):
+        """
+            detect tiles batch by batch
+        Args:
+            items: (key, image path or BGR image array) iterable
+
+        Returns:
+            (key, detection result) generator, same order as items
+        """
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) < self.batch_size:
+                continue
+            yield from self.collect(batch)
+            batch = []
+
+        if batch:
+            yield from self.collect(batch)
+
+    def collect(self, batch):
+        """
+            send one batch to server
+        Args:
+            batch: (key, image) list
+
+        Returns:
+            (key, detection result) generator
+        """
+        start = time.perf_counter()
+        images = [img if isinstance(img, np.ndarray) else cv2.imread(img, cv2.IMREAD_COLOR) for _, img in batch]
+        results = self.request(images)
+        self.seconds += time.perf_counter() - start
+        self.tiles += len(batch)
+        for (key, _), result in zip(batch, results):
+            yield key, result
+
+    def throughput(self):
+        """
+            detected tiles per second
+        Returns:
+            tiles / s
+        """
+        return self.tiles / self.seconds if self.seconds else 0.0
+
+    def close(self):
+        self.sock.close()
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
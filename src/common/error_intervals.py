@@ -0,0 +1,137 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: error_intervals.py
+@time: 10/18/26 12:10 AM
+@function: interval index of error hic loci: overlapping pairs, disjoint interval set and batched iou
+"""
+
+from bisect import bisect_right
+
+import numpy as np
+
+
+def loci_iou(boxes_1, boxes_2):
+    """
+        iou of hic loci pairs, same as ERRORS.cal_iou
+    Args:
+        boxes_1: (n, 4) a_start, a_end, b_start, b_end
+        boxes_2: (n, 4) a_start, a_end, b_start, b_end
+
+    Returns:
+        (n,) iou
+    """
+    areas_1 = (boxes_1[:, 3] - boxes_1[:, 2] + 1.) * (boxes_1[:, 1] - boxes_1[:, 0] + 1.)
+    areas_2 = (boxes_2[:, 3] - boxes_2[:, 2] + 1.) * (boxes_2[:, 1] - boxes_2[:, 0] + 1.)
+    inter_w = np.maximum(np.minimum(boxes_1[:, 1], boxes_2[:, 1]) - np.maximum(boxes_1[:, 0], boxes_2[:, 0]) + 1, 0)
+    inter_h = np.maximum(np.minimum(boxes_1[:, 3], boxes_2[:, 3]) - np.maximum(boxes_1[:, 2], boxes_2[:, 2]) + 1, 0)
+    intersection = inter_w * inter_h
+    return intersection / (areas_1 + areas_2 - intersection)
+
+
+class IntervalIndex:
+    """
+        Closed intervals sorted by start (stable). Overlapping pairs are found by binary search, so the cost is
+        O(n log n + overlapping pairs) instead of comparing every pair.
+    """
+
+    def __init__(self, starts, ends):
+        """
+        Args:
+            starts: interval starts
+            ends: interval ends
+        """
+        starts = np.asarray(starts)
+        ends = np.asarray(ends)
+        self.order = np.argsort(starts, kind="stable")  # sorted position -> input index
+        self.starts = starts[self.order]
+        self.ends = ends[self.order]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlap_pairs(self):
+        """
+            every pair of overlapping intervals
+        Returns:
+            (first, second) sorted positions, first < second
+        """
+        # intervals after position i starting before its end overlap it
+        his = np.searchsorted(self.starts, self.ends, side="right")
+        counts = np.maximum(his - np.arange(len(self)) - 1, 0)
+        first = np.repeat(np.arange(len(self)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return first, first + offsets + 1
+
+    def neighbors(self, first, second):
+        """
+            adjacency lists (CSR) of an undirected pair set
+        Args:
+            first: sorted positions
+            second: sorted positions
+
+        Returns:
+            (indptr, indices) lists, neighbors of i are indices[indptr[i]:indptr[i + 1]] in sorted order
+        """
+        sources = np.concatenate([first, second])
+        targets = np.concatenate([second, first])
+        order = np.lexsort((targets, sources))
+        indptr = np.searchsorted(sources[order], np.arange(len(self) + 1))
+        return indptr.tolist(), targets[order].tolist()
+
+
+class DisjointIntervals:
+    """
+        Sorted set of pairwise disjoint closed intervals, the ends are sorted as well so one bisect finds the
+        interval overlapping a query
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.items = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def find(self, start, end):
+        """
+            an interval overlapping [start, end]
+        Args:
+            start: query start
+            end: query end
+
+        Returns:
+            item of the overlapping interval, None when [start, end] overlaps no interval
+        """
+        index = bisect_right(self.starts, end) - 1  # last interval starting before query end
+        if index >= 0 and self.ends[index] >= start:
+            return self.items[index]
+        return None
+
+    def add(self, start, end, item):
+        """
+            add an interval overlapping no interval of the set
+        Args:
+            start: interval start
+            end: interval end
+            item: item of interval
+
+        Returns:
+            None
+        """
+        index = bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        self.items.insert(index, item)
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
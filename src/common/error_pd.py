@@ -12,13 +12,17 @@
 import json
 import os
 import random
+import time
 from collections import defaultdict
 
 import cv2
+import numpy as np
 import pandas as pd
 from PIL import Image
-from mmdet.apis import init_detector, inference_detector
 
+from src.common.error_intervals import DisjointIntervals, IntervalIndex, loci_iou
+from src.common.model_registry import DetectorRegistry
+from src.common.tile_cache import cached_detections
 from src.utils.logger import logger
 
 
@@ -26,7 +30,7 @@ class ERRORS:
     """
         Infer error class
     """
-    __slots__ = "filter_dict", "df", "info_file", "classes", "out_path", "img_size"
+    __slots__ = "filter_dict", "chunks", "_df", "info_file", "classes", "out_path", "img_size", "tile_images"
 
     def __init__(self, classes, info_file, out_path, img_size):
         self.info_file = info_file
@@ -34,41 +38,84 @@ class ERRORS:
         self.out_path = out_path
         self.img_size = img_size
 
-        # 创建一个空的DataFrame
-        self.df = pd.DataFrame()
+        # error columns of each tile and category, the DataFrame is built once from them
+        self.chunks = []
+        self._df = None
 
         # 创建一个记录每次过滤的字典
         self.filter_dict = dict()
 
-    # generate error structure
-    def create_structure(self, img_info, detection_result):
+        # in memory tiles which have errors (image path: BGR image array)
+        self.tile_images = dict()
+
+    @property
+    def df(self):
+        """
+            errors DataFrame, concatenated once after new errors are added
+        Returns:
+            DataFrame
         """
+        if self._df is None:
+            if self.chunks:
+                self._df = pd.DataFrame({column: np.concatenate([chunk[column] for chunk in self.chunks])
+                                         for column in self.chunks[0]})
+            else:
+                self._df = pd.DataFrame()
+        return self._df
 
+    # generate error structure
+    def create_structure(self, img_info, detection_result, img=None):
+        """
+            add errors (score > 0.9) of one tile
         Args:
-            img_info:
-            detection_result:
+            img_info: info record
+            detection_result: per class (n, 5) arrays
+            img: in memory image array, kept when the tile has errors
 
         Returns:
-
+            number of added errors
         """
+        image_id = next(iter(img_info))
+        n_errors = 0
         for category, classes in zip(detection_result, self.classes):
-            for index, error in enumerate(category):
-                error = error.tolist()
-                temp_dict = dict()
-                temp_dict["image_id"] = list(img_info.keys())[0]
-                temp_dict["category"] = classes
-                temp_dict["bbox_1"], temp_dict["bbox_2"], temp_dict["bbox_3"], temp_dict["bbox_4"] = error[0:4]
-                temp_dict["score"] = round(error[4], 2)
-                temp_dict["resolution"] = img_info[list(img_info.keys())[0]]["resolution"]
-                temp_dict["hic_loci_1"], temp_dict["hic_loci_2"], temp_dict["hic_loci_3"], temp_dict[
-                    "hic_loci_4"] = self.bbox2hic(error[0:4], img_info)
-
-                # 将字典数据添加到DataFrame中
-                if error[4] > 0.9:
-                    df_new_row = pd.DataFrame(temp_dict, index=[0])
-                    self.df = pd.concat([self.df, df_new_row])
-
-        return self.df
+            errors = np.asarray(category, dtype=np.float64).reshape(-1, 5)
+            errors = errors[errors[:, 4] > 0.9]
+            if not len(errors):
+                continue
+
+            hic_loci = self.bboxes2hic(errors[:, :4], img_info[image_id])
+            n = len(errors)
+            self.chunks.append({
+                "image_id": np.full(n, image_id, dtype=object),
+                "category": np.full(n, classes, dtype=object),
+                "bbox_1": errors[:, 0], "bbox_2": errors[:, 1], "bbox_3": errors[:, 2], "bbox_4": errors[:, 3],
+                "score": np.array([round(score, 2) for score in errors[:, 4].tolist()]),
+                "resolution": np.full(n, img_info[image_id]["resolution"]),
+                "hic_loci_1": hic_loci[:, 0], "hic_loci_2": hic_loci[:, 1],
+                "hic_loci_3": hic_loci[:, 2], "hic_loci_4": hic_loci[:, 3]})
+            n_errors += n
+
+        if n_errors:
+            self._df = None
+            if img is not None:
+                self.tile_images[image_id] = img
+
+        return n_errors
+
+    def save_tile_images(self, image_ids=None):
+        """
+            write in memory tiles to their image path (for error visualization)
+        Args:
+            image_ids: image paths to write (default: all tiles with errors)
+
+        Returns:
+            None
+        """
+        for image_id, img in self.tile_images.items():
+            if image_ids is not None and image_id not in image_ids:
+                continue
+            os.makedirs(os.path.dirname(image_id), exist_ok=True)
+            cv2.imwrite(image_id, img)
 
     def zoom_error2excel(self, zoom_error_json_file, output_excel_file="error_summary.xlsx"):
         with open(zoom_error_json_file) as f:
@@ -107,33 +154,38 @@ class ERRORS:
         Returns:
             hic coordinate
         """
+        return self.bboxes2hic(np.array([bbox], dtype=np.float64), img_info[next(iter(img_info))])[0].tolist()
+
+    def bboxes2hic(self, bboxes, record):
+        """
+            bbox coordinates of one tile to hic coordinates
+        Args:
+            bboxes: (n, 4) x1, y1, x2, y2
+            record: info record value of the tile
+
+        Returns:
+            (n, 4) int64 a_start, a_end, b_start, b_end
+        """
         img_size = self.img_size
-        key = list(img_info.keys())[0]
         # Straw b chromosome
-        img_chr_a_s = img_info[key]["chr_A_start"]
-        img_chr_a_e = img_info[key]["chr_A_end"]
+        img_chr_a_s = record["chr_A_start"]
+        img_chr_a_e = record["chr_A_end"]
 
         # Straw a chromosome
-        img_chr_b_s = img_info[key]["chr_B_start"]
-        img_chr_b_e = img_info[key]["chr_B_end"]
+        img_chr_b_s = record["chr_B_start"]
+        img_chr_b_e = record["chr_B_end"]
 
-        img_chr_w = img_chr_a_e - img_chr_a_s
-        img_chr_h = img_chr_b_e - img_chr_b_s
+        w_ration = (img_chr_a_e - img_chr_a_s) / img_size[0]
+        h_ration = (img_chr_b_e - img_chr_b_s) / img_size[1]
 
-        w_ration = img_chr_w / img_size[0]
-        h_ration = img_chr_h / img_size[1]
+        hic_loci = np.empty((len(bboxes), 4), dtype=np.float64)
+        hic_loci[:, 0] = bboxes[:, 0] * w_ration + img_chr_a_s
+        hic_loci[:, 1] = bboxes[:, 2] * w_ration + img_chr_a_s
+        hic_loci[:, 2] = bboxes[:, 1] * h_ration + img_chr_b_s
+        hic_loci[:, 3] = bboxes[:, 3] * h_ration + img_chr_b_s
 
-        x, y, w, h = bbox
-
-        a_s = x * w_ration + img_chr_a_s
-        a_e = w * w_ration + img_chr_a_s
-        b_s = y * h_ration + img_chr_b_s
-        b_e = h * h_ration + img_chr_b_s
-
-        # to int
-        hic_loci = list(map(lambda temp: int(temp), [a_s, a_e, b_s, b_e]))
-
-        return hic_loci
+        # to int (truncate like int())
+        return hic_loci.astype(np.int64)
 
     @staticmethod
     def cal_iou(box1, box2):
@@ -299,21 +351,18 @@ class ERRORS:
         # sort by hic_loci_1
         df_sorted = tran_pd.sort_values(by=['hic_loci_1'], na_position='first')
 
-        result_pd = None
-        repeat_pd = None
+        # a translocation starting within error_space of the end of the last kept one is a repeat
+        starts = df_sorted["hic_loci_1"].to_numpy()
+        ends = df_sorted["hic_loci_2"].to_numpy()
+        repeat = np.zeros(len(df_sorted), dtype=bool)
+        last_end = None
         for index in range(len(df_sorted)):
-            if result_pd is None:
-                result_pd = df_sorted.iloc[0:1]
-                continue
+            if last_end is not None and abs(starts[index] - last_end) < error_space:
+                repeat[index] = True
             else:
-                temp_value_1 = df_sorted.iloc[index:index + 1, 8].values[0]
-                temp_value_2 = result_pd.iloc[-1:, 9].values[0]
-                temp_value = abs(temp_value_1 - temp_value_2)
-                if temp_value < error_space:
-                    repeat_pd = pd.concat([repeat_pd, df_sorted[index:index + 1]], axis=0)
-                else:
-                    result_pd = pd.concat([result_pd, df_sorted[index:index + 1]], axis=0)
-        result_pd = pd.concat([result_pd, else__pd], axis=0)
+                last_end = ends[index]
+        result_pd = pd.concat([df_sorted[~repeat], else__pd], axis=0)
+        repeat_pd = df_sorted[repeat]
 
         # save to excel
         repeat_pd.to_excel(os.path.join(self.out_path, out_path), sheet_name='Sheet1', index=False)
@@ -368,8 +417,7 @@ class ERRORS:
         Returns:
             overlap filtered errors
         """
-        remove_list = list()  # save the key of the errors_dict which has been removed
-        ans = []  # store de_overlap errors
+        remove_list = list()  # (removed error, error kept instead)
         ans_dict = defaultdict()  # store de_overlap errors
         all_errors = []
 
@@ -380,41 +428,45 @@ class ERRORS:
             all_errors += errors_dict[class_]
             overlap_filtered_errors_counter[class_] = 0  # error counter
 
-        # loop errors
         sorted_errors_dict = sorted(all_errors, key=lambda itme: itme["hic_loci"][0], reverse=False)
-        temp_compare = None  # first error to compare
-        for error in sorted_errors_dict:
-            # whether there is overlap
-            if ans and error["hic_loci"][0] <= temp_compare["hic_loci"][1]:
-                remove_list.append((error, temp_compare))  # save the error which has overlap
-
-                # calculate overlap ratio
-                bbox1 = error["hic_loci"]
-                bbox2 = temp_compare["hic_loci"]
-                counted_score = self.cal_iou(bbox1, bbox2)
-                if float(counted_score) > float(iou_score):
-                    # judge which one's resolution is higher
-                    if int(error["resolution"]) == int(temp_compare["resolution"]):
-                        insert_result = max(error, temp_compare, key=lambda item: item["score"])
-                    else:
-                        # select the error with the highest resolution
-                        insert_result = min(error, temp_compare, key=lambda item: item["resolution"])
-
-                    if insert_result == temp_compare:
-                        continue
-                    else:
-                        del ans[-1]
-                        ans.append(insert_result)
-
-                else:  # not same error but have overlap
-                    error_len_1 = bbox1[1] - bbox1[0]
-                    temp_compare_len_2 = bbox2[1] - bbox2[0]
-                    if error_len_1 > temp_compare_len_2:
-                        del ans[-1]
-                        ans.append(error)
-            else:  # nought overlap
-                ans.append(error)
-            temp_compare = ans[-1]
+        n = len(sorted_errors_dict)
+        loci = np.array([error["hic_loci"] for error in sorted_errors_dict], dtype=np.float64).reshape(n, 4)
+        resolutions = np.array([int(error["resolution"]) for error in sorted_errors_dict], dtype=np.int64)
+        scores = np.array([float(error["score"]) for error in sorted_errors_dict], dtype=np.float64)
+        index = IntervalIndex(loci[:, 0], loci[:, 1])  # errors are sorted, sorted position == list position
+
+        # iou of every overlapping pair (not only neighbours of the sweep), same errors form a graph
+        first, second = index.overlap_pairs()
+        same = loci_iou(loci[first], loci[second]) > float(iou_score)
+        same_ptr, sames = index.neighbors(first[same], second[same])
+
+        # same error (iou > iou_score): keep the highest resolution, then the highest score (later one on tie)
+        positions = np.arange(n)
+        survivors = []
+        visited = [False] * n
+        for i in np.lexsort((-positions, -scores, resolutions)).tolist():
+            if visited[i]:
+                continue
+            visited[i] = True
+            survivors.append(i)
+            for j in sames[same_ptr[i]:same_ptr[i + 1]]:
+                if not visited[j]:
+                    visited[j] = True
+                    remove_list.append((sorted_errors_dict[j], sorted_errors_dict[i]))
+
+        # different errors with overlap: keep the longer one (earlier one on tie)
+        survivors = np.array(survivors, dtype=np.int64)
+        lengths = loci[survivors, 1] - loci[survivors, 0]
+        kept = DisjointIntervals()
+        for i in survivors[np.lexsort((survivors, -lengths))].tolist():
+            start, end = loci[i, 0], loci[i, 1]
+            overlap = kept.find(start, end)
+            if overlap is None:
+                kept.add(start, end, i)
+            else:
+                remove_list.append((sorted_errors_dict[i], sorted_errors_dict[overlap]))
+
+        ans = [sorted_errors_dict[i] for i in kept.items]  # sorted by start
 
         # regenerate error structure
         for _ in ans:
@@ -732,7 +784,8 @@ def json_vis(error_json, out_dir):
 
 
 def infer_error(model_cfg, pretrained_model, img_path, out_path, device='cuda:0', score=0.9, error_min_len=15000,
-                error_max_len=20000000, iou_score=0.8, chr_len=1453515699):
+                error_max_len=20000000, iou_score=0.8, chr_len=1453515699, tiles=None, batch_size=4, workers=4,
+                cpu_precision="fp32", runtime_model=None, detector=None, tile_cache=None, cascade=None):
     """
         infer error
     Args:
@@ -746,45 +799,95 @@ def infer_error(model_cfg, pretrained_model, img_path, out_path, device='cuda:0'
         error_max_len: error max length
         iou_score: iou score
         chr_len: chromosome length
+        tiles: (info record, BGR image array) iterable from mul_stream, img_path is not read when it is given
+        batch_size: tiles of each detector forward pass
+        workers: tile preprocessing threads
+        cpu_precision: CPU inference precision, fp32, bf16 or int8
+        runtime_model: TorchScript runtime from export_model.py, used instead of model_cfg / pretrained_model
+        detector: loaded detector from DetectorRegistry, model arguments above are ignored when it is given
+        tile_cache: TileCache of the hic file, detections of all tiles are saved to out_path/tile_cache.json
+        cascade: cascade_detect generator of detected in memory tiles, used instead of tiles / img_path
 
     Returns:
         None
     """
 
     # Initializing model
-    model = init_detector(model_cfg, pretrained_model, device=device)
-
-    info_file = os.path.join(img_path, "info.txt")
-    infos = []
-    with open(info_file, "r") as f:
-        for line in f.readlines():
-            info = json.loads(line)
-            infos.append(info)
+    if detector is None:
+        registry = DetectorRegistry(device, cpu_precision, batch_size, workers)
+        registry.register("error", model_cfg, pretrained_model, runtime_model)
+        detector = registry.get("error")
+    tiles_before, seconds_before = detector.tiles, detector.seconds
 
     classes = ("translocation", "inversion", "debris")
 
     if not os.path.exists(out_path):  # check if folder is existing
         os.mkdir(out_path)
 
-    # get img size
+    info_file = None
+    infos = []
     img_size = None
-    contents = os.listdir(img_path)
-
-    for item in contents:
-        item_path = os.path.join(img_path, item)
-        if os.path.isdir(item_path):
-            random_file = random.choice(os.listdir(item_path))
-            img_size = Image.open(os.path.join(item_path, random_file)).size
-            print("img size: ", img_size)
-            break
+    if tiles is None and cascade is None:
+        info_file = os.path.join(img_path, "info.txt")
+        with open(info_file, "r") as f:
+            for line in f.readlines():
+                info = json.loads(line)
+                infos.append(info)
+
+        # get img size
+        contents = os.listdir(img_path)
+
+        for item in contents:
+            item_path = os.path.join(img_path, item)
+            if os.path.isdir(item_path) and os.listdir(item_path):  # every tile of a resolution may be cached
+                random_file = random.choice(os.listdir(item_path))
+                img_size = Image.open(os.path.join(item_path, random_file)).size
+                print("img size: ", img_size)
+                break
 
     error_class = ERRORS(classes, info_file, out_path, img_size=img_size)
 
-    # for info in infos:
-    for info in infos:
-        detection_result = inference_detector(model, list(info.keys())[0])
+    # tiles with detections of the previous epoch (TileCache.lookup) skip the detector
+    cached_infos = []
 
-        error_class.create_structure(info, detection_result[0])
+    def uncached(items):
+        for info, img in items:
+            if cached_detections(info) is None:
+                yield info, img
+            else:
+                cached_infos.append(info)
+
+    if tiles is None and cascade is None:
+        for info, detection_result in detector.detect(
+                (info, list(info.keys())[0]) for info, _ in uncached((info, None) for info in infos)):
+            error_class.create_structure(info, detection_result[0])
+            if tile_cache is not None:
+                tile_cache.add(info, detection_result[0], error_class.img_size)
+    else:
+        # in memory tiles go through the LoadImageFromWebcam pipeline, cascade tiles are detected level by level
+        detected = cascade
+        if detected is None:
+            detected = detector.detect(((info, img), img) for info, img in uncached(tiles))
+        for (info, img), detection_result in detected:
+            if error_class.img_size is None:
+                error_class.img_size = (img.shape[1], img.shape[0])
+
+            error_class.create_structure(info, detection_result[0], img=img)
+            if tile_cache is not None:
+                tile_cache.add(info, detection_result[0], error_class.img_size)
+
+    for info in cached_infos:
+        if error_class.img_size is None:
+            error_class.img_size = tuple(info[list(info.keys())[0]]["img_size"])
+        error_class.create_structure(info, cached_detections(info))
+        if tile_cache is not None:
+            tile_cache.add(info, cached_detections(info), error_class.img_size, cached=True)
+    if tile_cache is not None:
+        tile_cache.save(out_path)
+    n_tiles, seconds = detector.tiles - tiles_before, detector.seconds - seconds_before
+    logger.info("Detected %s tiles in %.1f s, %.2f tiles/s (batch size %s, %s)\n" % (
+        n_tiles, seconds, n_tiles / seconds if seconds else 0.0, detector.batch_size,
+        type(detector).__name__))
 
     if len(error_class.df) == 0:  # no detect error
         return True
@@ -826,9 +929,47 @@ def infer_error(model_cfg, pretrained_model, img_path, out_path, device='cuda:0'
         os.mkdir(infer_out_dir)
 
     error_json = os.path.join(out_path, "chr_len_filtered_errors.json")
+
+    # only the tiles used by error visualization are written in stream mode
+    error_class.save_tile_images({error["image_id"] for errors in chr_filtered_errors.values() for error in errors})
     json_vis(error_json, infer_out_dir)
 
 
+def benchmark_create_structure(n_errors=(10000, 100000), errors_per_tile=4, out_path="."):
+    """
+        time of building the errors DataFrame from random detections
+    Args:
+        n_errors: error numbers to benchmark
+        errors_per_tile: errors of each class in each tile
+        out_path: ERRORS out path (nothing is written)
+
+    Returns:
+        {error number: seconds}
+    """
+    classes = ("translocation", "inversion", "debris")
+    rng = np.random.default_rng(0)
+    result = {}
+    for n in n_errors:
+        n_tiles = max(n // (errors_per_tile * len(classes)), 1)
+        tiles = []
+        for index in range(n_tiles):
+            boxes = rng.uniform(0, 800, (len(classes), errors_per_tile, 4)).astype(np.float32)
+            scores = rng.uniform(0.91, 1, (len(classes), errors_per_tile, 1)).astype(np.float32)
+            info = {"png/%s.jpg" % index: {"resolution": 5000, "chr_A_start": index * 2000000,
+                                           "chr_A_end": index * 2000000 + 3500000, "chr_B_start": index * 2000000,
+                                           "chr_B_end": index * 2000000 + 3500000}}
+            tiles.append((info, list(np.concatenate([boxes, scores], axis=2))))
+
+        start = time.perf_counter()
+        error_class = ERRORS(classes, None, out_path, img_size=(800, 800))
+        for info, detection_result in tiles:
+            error_class.create_structure(info, detection_result)
+        n_rows = len(error_class.df)
+        result[n] = time.perf_counter() - start
+        logger.info("create_structure: %s errors in %.3f s\n" % (n_rows, result[n]))
+    return result
+
+
 def main():
     pass
 
@@ -9,28 +9,121 @@
 @function: parse Hic file, generate contact png
 """
 
+import io
 import json
 import os
 import uuid
 
+import cv2
 import hicstraw
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.colors import LinearSegmentedColormap
 
+from src.common.hic_band import DiagonalBand
+from src.common.hic_render import render_hic_map
 from src.utils.logger import logger
 
+# hicstraw handles of current process: {hic file: HiCFile, (hic file, resolution, norm): MatrixZoomData}
+_hic_handles = {}
+_avoided_opens = None  # multiprocessing.Value shared by pool workers
+_local_avoided_opens = 0  # avoided opens when no shared counter
+
+
+def init_hic_worker(hic_file, avoided_opens=None):
+    """
+        pool initializer, open hic file once for the worker lifetime
+    Args:
+        hic_file: hic file path
+        avoided_opens: shared counter of avoided opens (multiprocessing.Value)
+
+    Returns:
+        None
+    """
+    global _avoided_opens
+    # handles inherited by fork share the file offset with the parent, reopen them
+    _hic_handles.clear()
+    _avoided_opens = avoided_opens
+    get_hic_file(hic_file)
+
+
+def _count_avoided_open():
+    """
+        count one avoided hic file open
+    Returns:
+        None
+    """
+    global _local_avoided_opens
+    if _avoided_opens is None:
+        _local_avoided_opens += 1
+    else:
+        with _avoided_opens.get_lock():
+            _avoided_opens.value += 1
+
+
+def get_avoided_opens():
+    """
+        get the number of avoided hic file opens
+    Returns:
+        avoided opens number
+    """
+    if _avoided_opens is None:
+        return _local_avoided_opens
+    return _avoided_opens.value
+
+
+def get_hic_file(hic_file):
+    """
+        get cached hicstraw HiCFile of current process
+    Args:
+        hic_file: hic file path
+
+    Returns:
+        HiCFile object
+    """
+    hic = _hic_handles.get(hic_file)
+    if hic is None:
+        hic = hicstraw.HiCFile(hic_file)  # create hic object
+        _hic_handles[hic_file] = hic
+    else:
+        _count_avoided_open()
+    return hic
+
+
+def get_matrix_zoom_data(hic_file, resolution, norm="NONE"):
+    """
+        get cached MatrixZoomData of current process
+    Args:
+        hic_file: hic file path
+        resolution: hic resolution
+        norm: normalization method
+
+    Returns:
+        MatrixZoomData object
+    """
+    key = (hic_file, resolution, norm)
+    matrix_object = _hic_handles.get(key)
+    if matrix_object is None:
+        hic = get_hic_file(hic_file)
+        matrix_object = hic.getMatrixZoomData('assembly', 'assembly', "observed", norm, "BP", resolution)
+        _hic_handles[key] = matrix_object
+    else:
+        _count_avoided_open()
+    return matrix_object
+
 
 class GenBaseModel:
     """
         HiC Image Base Model
     """
 
-    def __init__(self, hic_file, genome_id, out_file):
+    def __init__(self, hic_file, genome_id, out_file, renderer="array"):
         logger.info("Base Model Initiating\n")
         self.hic_file = hic_file  # hic file path
         self.genome_id = genome_id  # genome id
         self.out_file = out_file  # output file path
+        # image renderer: array (antialiased like matplotlib, see hic_render.verify_render) or matplotlib
+        self.renderer = renderer
 
         # create genome folder
         # father folder
@@ -46,7 +139,7 @@ class GenBaseModel:
         Returns:
             resolutions: hic file resolutions
         """
-        hic = hicstraw.HiCFile(self.hic_file)  # create hic object
+        hic = get_hic_file(self.hic_file)  # create hic object
         return hic.getResolutions()
 
     def get_chr_len(self):
@@ -56,7 +149,7 @@ class GenBaseModel:
             hic_len: hic file length
         """
         hic_len = 0  # genome length
-        hic = hicstraw.HiCFile(self.hic_file)  # create hic object
+        hic = get_hic_file(self.hic_file)  # create hic object
         for chrom in hic.getChromosomes():
             if chrom.name == "assembly":
                 hic_len = chrom.length
@@ -81,12 +174,14 @@ class GenBaseModel:
             logger.error("Folder already exists")
 
     @staticmethod
-    def plot_hic_map(matrix, fig_save_path):
+    def plot_hic_map(matrix, fig_save_path, interpolation=None, img_format=None):
         """
             plot hic map
         Args:
             matrix: hic matrix
-            fig_save_path: figure save dir
+            fig_save_path: figure save dir or file object
+            interpolation: matplotlib interpolation (default: None)
+            img_format: image format (default: from fig_save_path)
 
         Returns:
 
@@ -101,7 +196,8 @@ class GenBaseModel:
             matrix,
             cmap=red_map,
             vmin=0,
-            vmax=v_max)
+            vmax=v_max,
+            interpolation=interpolation)
 
         plt.axis('off')  # remove axis
 
@@ -114,7 +210,8 @@ class GenBaseModel:
             fig_save_path,
             dpi=300,
             bbox_inches='tight',
-            pad_inches=0)
+            pad_inches=0,
+            format=img_format)
         plt.close()
 
     @staticmethod
@@ -127,7 +224,8 @@ class GenBaseModel:
             chr_a_e,
             chr_b,
             chr_b_s,
-            chr_b_e):
+            chr_b_e,
+            to_json=True):
         record = {
             img_path: {
                 "genome_id": genome_id,
@@ -141,9 +239,11 @@ class GenBaseModel:
             }
         }
 
+        if not to_json:
+            return record
         return json.dumps(record)
 
-    def gen_png(self, resolution, a_start, a_end, b_start, b_end, img_format="jpg"):
+    def gen_png(self, resolution, a_start, a_end, b_start, b_end, img_format="jpg", matrix=None):
         """
             generate png
         Args:
@@ -153,30 +253,34 @@ class GenBaseModel:
             b_start: chr B start
             b_end: chr B end
             img_format: image format
+            matrix: contact matrix already extracted (default: read from straw)
 
         Returns:
 
         """
 
-        hic = hicstraw.HiCFile(self.hic_file)  # create hic object
-
         # create resolutions folder
         resolution_folder = os.path.join(self.genome_folder, str(resolution))
 
-        # get matrix object by resolution
-        matrix_object_chr = hic.getMatrixZoomData('assembly', 'assembly', "observed", "NONE", "BP", resolution)
-
         img_name = uuid.uuid4().hex  # generate random string
 
         # png file name
         img_path = os.path.join(resolution_folder, str(img_name) + "." + img_format)
 
         # get contact matrix
-        numpy_matrix_chr = matrix_object_chr.getRecordsAsMatrix(a_start, a_end, b_start, b_end)
+        if matrix is None:
+            # get matrix object by resolution
+            matrix_object_chr = get_matrix_zoom_data(self.hic_file, resolution)
+            numpy_matrix_chr = matrix_object_chr.getRecordsAsMatrix(a_start, a_end, b_start, b_end)
+        else:
+            numpy_matrix_chr = matrix
         # numpy_matrix_chr = np.flipud(numpy_matrix_chr)
 
         # plot hic contact map
-        self.plot_hic_map(numpy_matrix_chr, img_path)
+        if self.renderer == "matplotlib":
+            self.plot_hic_map(numpy_matrix_chr, img_path)
+        else:
+            render_hic_map(numpy_matrix_chr, img_path)
 
         # create info record
         temp_field = self.info_records(
@@ -191,3 +295,96 @@ class GenBaseModel:
             b_end) + "\n"
 
         return temp_field
+
+    def gen_tile(self, resolution, a_start, a_end, b_start, b_end, img_format="jpg", matrix=None):
+        """
+            generate image array in memory, without writing image file
+        Args:
+            resolution: hic resolution
+            a_start: chr A start
+            a_end: chr A end
+            b_start: chr B start
+            b_end: chr B end
+            img_format: image format (used to name the image when it is saved later)
+            matrix: contact matrix already extracted (default: read from straw)
+
+        Returns:
+            (info record, BGR image array)
+        """
+        resolution_folder = os.path.join(self.genome_folder, str(resolution))
+
+        img_path = os.path.join(resolution_folder, uuid.uuid4().hex + "." + img_format)
+
+        # get contact matrix
+        if matrix is None:
+            # get matrix object by resolution
+            matrix_object_chr = get_matrix_zoom_data(self.hic_file, resolution)
+            numpy_matrix_chr = matrix_object_chr.getRecordsAsMatrix(a_start, a_end, b_start, b_end)
+        else:
+            numpy_matrix_chr = matrix
+
+        # encoded and decoded like the image file mmdet would read, mmdet loads images as BGR
+        buffer = io.BytesIO()
+        if self.renderer == "matplotlib":
+            self.plot_hic_map(numpy_matrix_chr, buffer, img_format=img_format)
+        else:
+            render_hic_map(numpy_matrix_chr, buffer, img_format=img_format)
+        img = cv2.imdecode(np.frombuffer(buffer.getvalue(), dtype=np.uint8), cv2.IMREAD_COLOR)
+
+        record = self.info_records(
+            img_path,
+            self.genome_id,
+            resolution,
+            "assembly",
+            a_start,
+            a_end,
+            "assembly",
+            b_start,
+            b_end,
+            to_json=False)
+
+        return record, img
+
+    def get_band(self, resolution, windows):
+        """
+            read the diagonal band covering windows once
+        Args:
+            resolution: hic resolution
+            windows: consecutive diagonal windows [(a_start, a_end, b_start, b_end), ...]
+
+        Returns:
+            DiagonalBand object
+        """
+        width = max(a_end // resolution - a_start // resolution + 1 for a_start, a_end, _, _ in windows)
+        return DiagonalBand(get_matrix_zoom_data(self.hic_file, resolution), resolution,
+                            min(window[0] for window in windows), max(window[1] for window in windows), width)
+
+    def gen_band_png(self, resolution, windows, img_format="jpg"):
+        """
+            generate png of diagonal windows from one band read
+        Args:
+            resolution: hic resolution
+            windows: consecutive diagonal windows
+            img_format: image format
+
+        Returns:
+            info records of windows
+        """
+        band = self.get_band(resolution, windows)
+        return "".join(self.gen_png(resolution, *window, img_format=img_format, matrix=band.tile(window[0], window[1]))
+                       for window in windows)
+
+    def gen_band_tiles(self, resolution, windows, img_format="jpg"):
+        """
+            generate image arrays of diagonal windows from one band read
+        Args:
+            resolution: hic resolution
+            windows: consecutive diagonal windows
+            img_format: image format
+
+        Returns:
+            [(info record, BGR image array), ...]
+        """
+        band = self.get_band(resolution, windows)
+        return [self.gen_tile(resolution, *window, img_format=img_format, matrix=band.tile(window[0], window[1]))
+                for window in windows]
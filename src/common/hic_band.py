@@ -0,0 +1,113 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: hic_band.py
+@time: 10/17/26 2:30 PM
+@function: read near diagonal band of hic contact map once, slice diagonal tiles from it
+"""
+
+import numpy as np
+
+
+class DiagonalBand:
+    """
+        Near diagonal band of assembly contact map, stored as sparse COO sorted by row (row <= col)
+    """
+    __slots__ = "resolution", "start_bin", "end_bin", "width", "rows", "cols", "counts", "reads"
+
+    def __init__(self, matrix_object, resolution, start, end, width, chunk_bins=None):
+        """
+            read band of [start, end] with width bins from straw
+        Args:
+            matrix_object: straw MatrixZoomData
+            resolution: hic resolution
+            start: band start (bp)
+            end: band end (bp)
+            width: band width (bins), must be >= tile length (bins)
+            chunk_bins: rows read by each straw call (default: width)
+        """
+        self.resolution = resolution
+        self.start_bin = start // resolution
+        self.end_bin = end // resolution
+        self.width = width
+        self.reads = 0  # straw read number
+
+        if chunk_bins is None:
+            chunk_bins = width
+
+        rows, cols, counts = [], [], []
+        for row in range(self.start_bin, self.end_bin + 1, chunk_bins):
+            row_end = min(row + chunk_bins - 1, self.end_bin)
+            col_end = min(row_end + width - 1, self.end_bin)
+
+            # rows [row, row_end] x cols [row, col_end] contain every contact of these rows in band
+            records = matrix_object.getRecords(row * resolution, row_end * resolution,
+                                               row * resolution, col_end * resolution)
+            self.reads += 1
+            if not records:
+                continue
+
+            bin_x = np.fromiter((record.binX for record in records), np.int64, len(records)) // resolution
+            bin_y = np.fromiter((record.binY for record in records), np.int64, len(records)) // resolution
+            value = np.fromiter((record.counts for record in records), np.float32, len(records))
+
+            # each contact belongs to the chunk of its smaller bin
+            low = np.minimum(bin_x, bin_y)
+            high = np.maximum(bin_x, bin_y)
+            keep = (low >= row) & (low <= row_end) & (high - low < width)
+            rows.append(low[keep])
+            cols.append(high[keep])
+            counts.append(value[keep])
+
+        if rows:
+            rows, cols, counts = np.concatenate(rows), np.concatenate(cols), np.concatenate(counts)
+        else:
+            rows, cols, counts = np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32)
+
+        # sort by row for binary search
+        order = np.argsort(rows, kind="stable")
+        self.rows = rows[order]
+        self.cols = cols[order]
+        self.counts = counts[order]
+
+    def tile(self, a_start, a_end):
+        """
+            slice diagonal tile, same as getRecordsAsMatrix(a_start, a_end, a_start, a_end)
+        Args:
+            a_start: tile start (bp)
+            a_end: tile end (bp)
+
+        Returns:
+            tile matrix (1 x 1 zero matrix when there is no contact, like straw)
+        """
+        bin_0 = a_start // self.resolution
+        bin_1 = a_end // self.resolution
+        if bin_0 < self.start_bin or bin_1 > self.end_bin or bin_1 - bin_0 + 1 > self.width:
+            raise ValueError("Tile %s - %s is out of band" % (a_start, a_end))
+
+        lo = np.searchsorted(self.rows, bin_0, side="left")
+        hi = np.searchsorted(self.rows, bin_1, side="right")
+        cols = self.cols[lo:hi]
+        keep = cols <= bin_1
+        if not keep.any():
+            return np.zeros((1, 1), dtype=np.float32)
+
+        rows = self.rows[lo:hi][keep] - bin_0
+        cols = cols[keep] - bin_0
+        counts = self.counts[lo:hi][keep]
+
+        matrix = np.zeros((bin_1 - bin_0 + 1, bin_1 - bin_0 + 1), dtype=np.float32)
+        matrix[rows, cols] = counts
+        matrix[cols, rows] = counts
+        return matrix
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: hic_block.py
+@time: 10/17/26 5:05 PM
+@function: assemble large contact matrix from straw blocks written in place into one preallocated array
+"""
+
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import hicstraw
+import numpy as np
+
+from src.common.hic_adv_model import get_matrix_zoom_data
+from src.utils.logger import logger
+
+
+def hic_matrix_opener(hic_file, resolution, norm="NONE"):
+    """
+        MatrixZoomData opener for build_block_matrix
+    Args:
+        hic_file: hic file path
+        resolution: hic resolution
+        norm: normalization method
+
+    Returns:
+        function returning MatrixZoomData of current thread
+    """
+    def open_matrix():
+        if threading.current_thread() is threading.main_thread():
+            return get_matrix_zoom_data(hic_file, resolution, norm)
+        # straw handles keep a file position, never share them between threads
+        hic = hicstraw.HiCFile(hic_file)
+        return hic.getMatrixZoomData('assembly', 'assembly', "observed", norm, "BP", resolution)
+
+    return open_matrix
+
+
+def build_block_matrix(open_matrix, resolution, x_start, x_end, y_start, y_end, block_bins=1400, threads=1):
+    """
+        same as getRecordsAsMatrix(x_start, x_end, y_start, y_end), read block by block
+    Args:
+        open_matrix: function returning MatrixZoomData, called once by each reading thread
+        resolution: hic resolution
+        x_start: row start (bp)
+        x_end: row end (bp)
+        y_start: column start (bp)
+        y_end: column end (bp)
+        block_bins: bins of each straw block read
+        threads: reading threads
+
+    Returns:
+        float32 matrix
+    """
+    x_bin, y_bin = max(x_start, 0) // resolution, max(y_start, 0) // resolution
+    x_bins, y_bins = x_end // resolution - x_bin + 1, y_end // resolution - y_bin + 1
+    matrix = np.zeros((x_bins, y_bins), dtype=np.float32)
+
+    blocks = [(row, min(row + block_bins, x_bins), col, min(col + block_bins, y_bins))
+              for row in range(0, x_bins, block_bins) for col in range(0, y_bins, block_bins)]
+
+    local = threading.local()
+
+    def read_block(block):
+        row, row_end, col, col_end = block
+        matrix_object = getattr(local, "matrix_object", None)
+        if matrix_object is None:
+            matrix_object = local.matrix_object = open_matrix()
+        data = matrix_object.getRecordsAsMatrix((x_bin + row) * resolution, (x_bin + row_end - 1) * resolution,
+                                                (y_bin + col) * resolution, (y_bin + col_end - 1) * resolution)
+        # straw returns 1 x 1 zero matrix for a block without contact, it is already zero in place
+        if data.shape == (1, 1) and (row_end - row, col_end - col) != (1, 1):
+            return
+        matrix[row:row_end, col:col_end] = data[:row_end - row, :col_end - col]
+
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(read_block, blocks))
+    else:
+        for block in blocks:
+            read_block(block)
+    return matrix
+
+
+class SyntheticZoomData:
+    """
+        MatrixZoomData stand-in serving getRecordsAsMatrix from a dense symmetric matrix
+    """
+
+    def __init__(self, matrix, resolution):
+        self.matrix = matrix
+        self.resolution = resolution
+
+    def getRecordsAsMatrix(self, x_start, x_end, y_start, y_end):
+        data = self.matrix[x_start // self.resolution: x_end // self.resolution + 1,
+                           y_start // self.resolution: y_end // self.resolution + 1]
+        if not data.any():
+            return np.zeros((1, 1), dtype=np.float32)
+        return np.array(data, dtype=np.float32)
+
+
+def stack_block_matrix(matrix_object, resolution, hic_len, block_bins=1400):
+    """
+        previous get_full_len_matrix stitching with repeated vstack / hstack, kept for benchmark
+    Args:
+        matrix_object: MatrixZoomData
+        resolution: hic resolution
+        hic_len: hic file length
+        block_bins: bins of each straw block read
+
+    Returns:
+        stitched matrix
+    """
+    len_block_num = -(-hic_len // (resolution * block_bins))
+    each_block_res_number = round(-(-hic_len // len_block_num) / resolution)
+    iter_len = [each_block_res_number * i * resolution for i in range(len_block_num)] + [hic_len]
+
+    full_len_matrix = None
+    for i in range(len(iter_len) - 1):
+        temp_matrix = None
+        for j in range(len(iter_len) - 1):
+            matrix_data = matrix_object.getRecordsAsMatrix(iter_len[j], iter_len[j + 1] - 1,
+                                                           iter_len[i], iter_len[i + 1] - 1)
+            temp_matrix = matrix_data if temp_matrix is None else np.vstack((temp_matrix, matrix_data))
+        full_len_matrix = temp_matrix if full_len_matrix is None else np.hstack((full_len_matrix, temp_matrix))
+    return full_len_matrix
+
+
+def benchmark_block_matrix(n_bins=5000, resolution=1000, block_bins=700, threads=4):
+    """
+        benchmark time and peak memory of vstack / hstack stitching and preallocated block assembly
+    Args:
+        n_bins: synthetic matrix size (bins)
+        resolution: synthetic resolution
+        block_bins: bins of each block read
+        threads: reading threads of threaded assembly
+
+    Returns:
+        {method: (seconds, peak MB, equal to source matrix)}
+    """
+    rng = np.random.default_rng(0)
+    distance = np.abs(np.subtract.outer(np.arange(n_bins), np.arange(n_bins)))
+    source = rng.poisson(0.05 + 50 / (1 + distance)).astype(np.float32)
+    del distance
+    matrix_object = SyntheticZoomData(source, resolution)
+    hic_len = n_bins * resolution
+
+    methods = {
+        "stack": lambda: stack_block_matrix(matrix_object, resolution, hic_len, block_bins),
+        "block": lambda: build_block_matrix(lambda: matrix_object, resolution, 0, hic_len - 1, 0, hic_len - 1,
+                                            block_bins),
+        "block_threads": lambda: build_block_matrix(lambda: matrix_object, resolution, 0, hic_len - 1,
+                                                    0, hic_len - 1, block_bins, threads)
+    }
+
+    result = {}
+    for name, method in methods.items():
+        tracemalloc.start()
+        start = time.perf_counter()
+        matrix = method()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        result[name] = (seconds, peak, matrix.shape == source.shape and bool(np.array_equal(matrix, source)))
+        logger.info("%s: %.3f s, peak %.1f MB, equal %s\n", name, *result[name])
+        del matrix
+    return result
+
+
+def main():
+    benchmark_block_matrix()
+
+
+if __name__ == "__main__":
+    main()
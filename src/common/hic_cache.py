@@ -0,0 +1,268 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: hic_cache.py
+@time: 10/17/26 4:40 PM
+@function: genome wide contact matrix cached on disk as memory-mapped .npy, shared by pipeline stages
+"""
+
+import fcntl
+import glob
+import hashlib
+import os
+import uuid
+
+import numpy as np
+
+from src.common.hic_adv_model import get_hic_file, get_matrix_zoom_data
+from src.utils.logger import logger
+
+# opened caches of current process: {(hic file, resolution, norm, cache dir): MatrixCache}
+_matrix_caches = {}
+
+# cache settings are environment variables, so pool workers (fork or spawn) share them
+CACHE_DIR_ENV = "AUTOHIC_MATRIX_CACHE_DIR"
+CACHE_BUDGET_ENV = "AUTOHIC_MATRIX_CACHE_BUDGET"
+DEFAULT_BUDGET = 4 * 1024 ** 3  # bytes of cache files in one cache folder
+
+
+def configure_matrix_cache(cache_dir=None, budget=None):
+    """
+        put matrix caches of a run in one folder with a size budget, caches of earlier epochs are removed first
+    Args:
+        cache_dir: cache folder shared by every hic file (default: .matrix_cache next to each hic file)
+        budget: max bytes of cache files in a cache folder (default: 4 GB)
+
+    Returns:
+        None
+    """
+    if cache_dir is not None:
+        os.environ[CACHE_DIR_ENV] = os.path.abspath(cache_dir)
+    if budget is not None:
+        os.environ[CACHE_BUDGET_ENV] = str(int(budget))
+
+
+def get_cache_budget():
+    return int(os.environ.get(CACHE_BUDGET_ENV, DEFAULT_BUDGET))
+
+
+def get_hic_length(hic_file):
+    """
+        get length of assembly chromosome of hic file
+    Args:
+        hic_file: hic file path
+
+    Returns:
+        hic file length
+    """
+    for chrom in get_hic_file(hic_file).getChromosomes():
+        if chrom.name == "assembly":
+            return chrom.length
+    raise ValueError("Hic file %s has no assembly chromosome" % hic_file)
+
+
+class MatrixCache:
+    """
+        Genome wide contact matrix of one (hic file, resolution, normalization), memory-mapped from disk
+    """
+
+    def __init__(self, hic_file, resolution, norm="NONE", cache_dir=None, chunk_bins=1400, budget=None):
+        """
+            open the cache, fill it from straw when it is missing or the hic file changed
+        Args:
+            hic_file: hic file path
+            resolution: hic resolution
+            norm: normalization method
+            cache_dir: cache folder (default: configure_matrix_cache folder, else .matrix_cache next to hic file)
+            chunk_bins: bins of each straw block read when filling the cache
+            budget: max bytes of cache files in cache folder (default: configure_matrix_cache budget)
+        """
+        self.hic_file = hic_file
+        self.resolution = resolution
+        self.norm = norm
+        self.hic_len = get_hic_length(hic_file)
+        self.n_bins = self.hic_len // resolution + 1
+
+        if cache_dir is None:
+            cache_dir = os.environ.get(CACHE_DIR_ENV) or \
+                        os.path.join(os.path.dirname(os.path.abspath(hic_file)), ".matrix_cache")
+        self.cache_dir = cache_dir
+        self.budget = get_cache_budget() if budget is None else budget
+
+        self.prefix = "%s.%s.%s" % (os.path.basename(hic_file), resolution, norm)
+        self.cache_file = os.path.join(cache_dir, "%s.%s.npy" % (self.prefix, self.file_key(hic_file)))
+
+        if not os.path.exists(self.cache_file):
+            self.fill(chunk_bins)
+        else:
+            os.utime(self.cache_file)  # recently used caches are removed last
+        self.matrix = np.load(self.cache_file, mmap_mode="r")
+
+    @property
+    def nbytes(self):
+        return self.n_bins * self.n_bins * np.dtype(np.float32).itemsize
+
+    @staticmethod
+    def file_key(hic_file):
+        """
+            key of hic file content: path, mtime and size
+        Args:
+            hic_file: hic file path
+
+        Returns:
+            hex digest
+        """
+        stat = os.stat(hic_file)
+        key = "%s:%s:%s" % (os.path.abspath(hic_file), stat.st_mtime_ns, stat.st_size)
+        return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    def fill(self, chunk_bins):
+        """
+            fill the cache file once: concurrent misses of the same cache wait for the first filler and use its file
+        Args:
+            chunk_bins: bins of each straw block read
+
+        Returns:
+            None
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        with open(os.path.join(self.cache_dir, self.prefix + ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(self.cache_file):  # filled by another process while waiting
+                    return
+                self.fill_locked(chunk_bins)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def fill_locked(self, chunk_bins):
+        """
+            read full contact matrix from straw block by block into the cache file, caller holds the fill lock
+        Args:
+            chunk_bins: bins of each straw block read
+
+        Returns:
+            None
+        """
+        # remove caches of older versions of the same hic file (and temporary files of interrupted fills, a fill of
+        # this prefix holds the lock)
+        for stale_file in glob.glob(os.path.join(self.cache_dir, glob.escape(self.prefix) + ".*.npy")):
+            logger.info("Remove stale matrix cache: %s\n" % stale_file)
+            try:
+                os.remove(stale_file)
+            except FileNotFoundError:  # removed over budget by another process
+                pass
+        self.make_room()
+
+        logger.info("Fill matrix cache: %s (%s x %s bins)\n" % (self.cache_file, self.n_bins, self.n_bins))
+
+        # write to a temporary file, readers never see a half filled cache
+        tmp_file = os.path.join(self.cache_dir, "%s.%s.tmp.npy" % (self.prefix, uuid.uuid4().hex))
+        matrix = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=np.float32, shape=(self.n_bins, self.n_bins))
+
+        matrix_object = get_matrix_zoom_data(self.hic_file, self.resolution, self.norm)
+        resolution = self.resolution
+        for row in range(0, self.n_bins, chunk_bins):
+            row_end = min(row + chunk_bins, self.n_bins) - 1
+            # straw stores upper triangle, read blocks on and above the diagonal only
+            for col in range(row, self.n_bins, chunk_bins):
+                col_end = min(col + chunk_bins, self.n_bins) - 1
+                records = matrix_object.getRecords(row * resolution, row_end * resolution,
+                                                   col * resolution, col_end * resolution)
+                if not records:
+                    continue
+
+                bin_x = np.fromiter((record.binX for record in records), np.int64, len(records)) // resolution
+                bin_y = np.fromiter((record.binY for record in records), np.int64, len(records)) // resolution
+                value = np.fromiter((record.counts for record in records), np.float32, len(records))
+                matrix[bin_x, bin_y] = value
+                matrix[bin_y, bin_x] = value
+
+        matrix.flush()
+        del matrix
+        os.replace(tmp_file, self.cache_file)
+
+    def make_room(self):
+        """
+            remove least recently used caches (eg: of superseded epoch hic files) until this cache fits the budget
+        Returns:
+            None
+        """
+        cache_files = []
+        for cache_file in glob.glob(os.path.join(self.cache_dir, "*.npy")):
+            if cache_file.endswith(".tmp.npy"):  # being filled by another process
+                continue
+            try:
+                stat = os.stat(cache_file)
+            except FileNotFoundError:  # removed by another process
+                continue
+            cache_files.append((stat.st_mtime, stat.st_size, cache_file))
+
+        used = sum(size for _, size, _ in cache_files)
+        for _, size, cache_file in sorted(cache_files):
+            if used + self.nbytes <= self.budget:
+                break
+            logger.info("Remove matrix cache over budget (%.1f GB): %s\n" % (self.budget / 1024 ** 3, cache_file))
+            try:
+                os.remove(cache_file)  # processes mapping it keep their pages
+            except FileNotFoundError:
+                pass
+            used -= size
+
+    def slice(self, x_start, x_end, y_start, y_end):
+        """
+            contact matrix of region, same layout as getRecordsAsMatrix(x_start, x_end, y_start, y_end)
+        Args:
+            x_start: row start (bp)
+            x_end: row end (bp)
+            y_start: column start (bp)
+            y_end: column end (bp)
+
+        Returns:
+            read-only memory-mapped matrix view
+        """
+        resolution = self.resolution
+        return self.matrix[max(x_start, 0) // resolution: x_end // resolution + 1,
+                           max(y_start, 0) // resolution: y_end // resolution + 1]
+
+
+def get_matrix_cache(hic_file, resolution, norm="NONE", cache_dir=None, max_bins=12000):
+    """
+        get matrix cache of current process
+    Args:
+        hic_file: hic file path
+        resolution: hic resolution
+        norm: normalization method
+        cache_dir: cache folder (default: configure_matrix_cache folder, else .matrix_cache next to hic file)
+        max_bins: largest matrix dimension worth caching (float32, 12000 bins is about 0.55 GB),
+            finer resolutions are read sparse by ContactSource
+
+    Returns:
+        MatrixCache object, None when the matrix of this resolution is too large to cache
+    """
+    key = (hic_file, resolution, norm, cache_dir)
+    cache = _matrix_caches.get(key)
+    if cache is not None and os.path.exists(cache.cache_file) \
+            and cache.cache_file.endswith(MatrixCache.file_key(hic_file) + ".npy"):
+        return cache
+
+    n_bins = get_hic_length(hic_file) // resolution + 1
+    if n_bins > max_bins or n_bins * n_bins * np.dtype(np.float32).itemsize > get_cache_budget():
+        logger.info("Resolution %s is too fine to cache full matrix, read from straw\n" % resolution)
+        return None
+
+    cache = MatrixCache(hic_file, resolution, norm, cache_dir)
+    _matrix_caches[key] = cache
+    return cache
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
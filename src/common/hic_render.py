@@ -0,0 +1,302 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: hic_render.py
+@time: 10/17/26 10:20 AM
+@function: render hic contact matrix to image without matplotlib figure
+"""
+
+import time
+
+import numpy as np
+from PIL import Image
+
+from src.utils.logger import logger
+
+# plt.matshow on a square matrix: figaspect(1) -> 4.8 inch figure, axes take 0.775 of it,
+# saved at 300 dpi with tight bbox -> 0.775 * 4.8 * 300 = 1116 pixels
+TILE_SIZE = (1116, 1116)
+TILE_DPI = 300
+
+# mean absolute pixel difference allowed between array and matplotlib tiles (verify_render)
+RENDER_TOLERANCE = 1.0
+
+
+def resample_stage():
+    """
+        stage of matplotlib "antialiased" resampling: data before colormap (matplotlib < 3.10, autohic.yaml pins
+        3.7.1), or rgba after colormap (matplotlib >= 3.10, upsampling less than 3 times)
+    Returns:
+        "data" or "rgba"
+    """
+    try:
+        from matplotlib import __version__
+    except ImportError:
+        return "data"
+    major, minor = (int(part) for part in __version__.split(".")[:2])
+    return "rgba" if (major, minor) >= (3, 10) else "data"
+
+
+RESAMPLE_STAGE = resample_stage()
+
+
+def red_lut(n=256):
+    """
+        white to red colormap lookup table (same as LinearSegmentedColormap "bright_red")
+    Args:
+        n: number of colors
+
+    Returns:
+        lut: (n, 3) uint8 lookup table
+    """
+    # matplotlib: lut = (colors * 255).astype(uint8), colors from (1, 1, 1) to (1, 0, 0)
+    fade = 1 - np.linspace(0, 1, n)
+    lut = np.empty((n, 3), dtype=np.uint8)
+    lut[:, 0] = 255
+    lut[:, 1] = (fade * 255).astype(np.uint8)
+    lut[:, 2] = lut[:, 1]
+    return lut
+
+
+RED_LUT = red_lut()
+
+
+def get_v_max(matrix, percentile=95):
+    """
+        get color max value of matrix
+    Args:
+        matrix: hic matrix
+        percentile: color percentile
+
+    Returns:
+        v_max
+    """
+    v_max = np.percentile(matrix, percentile)
+    if v_max == 0:
+        v_max = 1
+    return v_max
+
+
+def resample_axis(n, size, nearest):
+    """
+        source pixels and weights of each image pixel along one axis
+    Args:
+        n: matrix pixels
+        size: image pixels
+        nearest: nearest neighbour, else hanning filter of radius 1 (matplotlib "antialiased" interpolation)
+
+    Returns:
+        lower source index, upper source index, weight of upper source (None: nearest)
+    """
+    if nearest:  # sample at pixel centers like matplotlib
+        index = ((np.arange(size) + 0.5) * n / size).astype(np.intp)
+        return index, index, None
+    site = (np.arange(size) + 0.5) * n / size - 0.5
+    lower = np.floor(site)
+    weight = 0.5 - 0.5 * np.cos(np.pi * (site - lower))  # hanning weights of the two neighbours sum to 1
+    lower = lower.astype(np.intp)
+    return np.clip(lower, 0, n - 1), np.clip(lower + 1, 0, n - 1), weight.astype(np.float32)
+
+
+def resample(image, img_size):
+    """
+        resample matrix or rgb array to image size, same as matplotlib "antialiased" interpolation of matshow:
+        nearest when upsampling more than 3 times or by 1 or 2 times, else hanning filter
+    Args:
+        image: (h, w) or (h, w, 3) float32 array
+        img_size: output image size (width, height)
+
+    Returns:
+        resampled float32 array
+    """
+    width, height = img_size
+    n_rows, n_cols = image.shape[:2]
+    nearest = all(size > 3 * n or size in (n, 2 * n) for size, n in ((width, n_cols), (height, n_rows)))
+
+    lower, upper, weight = resample_axis(n_rows, height, nearest)
+    if weight is None:
+        image = image[lower]
+    else:
+        weight = weight.reshape((-1,) + (1,) * (image.ndim - 1))
+        image = image[lower] * (1 - weight) + image[upper] * weight
+
+    lower, upper, weight = resample_axis(n_cols, width, nearest)
+    if weight is None:
+        return image[:, lower]
+    weight = weight.reshape((1, -1) + (1,) * (image.ndim - 2))
+    return image[:, lower] * (1 - weight) + image[:, upper] * weight
+
+
+def color_index(matrix, v_max, n):
+    """
+        vectorized clip and lookup index, same index rule as matplotlib Colormap
+    Args:
+        matrix: hic matrix
+        v_max: color max value
+        n: number of colors
+
+    Returns:
+        index array
+    """
+    index = (np.clip(matrix / v_max, 0, 1) * n).astype(np.intp)
+    np.minimum(index, n - 1, out=index)
+    return index
+
+
+def matrix2rgb(matrix, img_size=TILE_SIZE, v_max=None, percentile=95, lut=RED_LUT, stage=None):
+    """
+        convert hic matrix to rgb image array
+    Args:
+        matrix: hic matrix
+        img_size: output image size (width, height)
+        v_max: color max value (default: percentile of matrix)
+        percentile: color percentile
+        lut: colormap lookup table
+        stage: resample matrix before colormap ("data") or rgb after it ("rgba") (default: RESAMPLE_STAGE)
+
+    Returns:
+        rgb image array (height, width, 3), uint8
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if v_max is None:
+        v_max = get_v_max(matrix, percentile)
+
+    if (stage or RESAMPLE_STAGE) == "data":
+        return lut[color_index(resample(matrix, img_size), v_max, len(lut))]
+    rgb = resample(lut[color_index(matrix, v_max, len(lut))].astype(np.float32), img_size)
+    return rgb.astype(np.uint8)  # truncated like agg
+
+
+def save_rgb(rgb, img_path, dpi=TILE_DPI, img_format=None):
+    """
+        encode rgb array to image file
+    Args:
+        rgb: rgb image array
+        img_path: image save path or file object
+        dpi: image dpi
+        img_format: image format, eg: jpg (default: from img_path)
+
+    Returns:
+        None
+    """
+    pil_format = Image.registered_extensions()["." + img_format.lower()] if img_format else None
+    Image.fromarray(rgb).save(img_path, format=pil_format, dpi=(dpi, dpi))
+
+
+def render_hic_map(matrix, img_path, img_size=TILE_SIZE, v_max=None, img_format=None):
+    """
+        render hic map and save it
+    Args:
+        matrix: hic matrix
+        img_path: image save path or file object
+        img_size: image size
+        v_max: color max value
+        img_format: image format (default: from img_path)
+
+    Returns:
+        rgb image array
+    """
+    rgb = matrix2rgb(matrix, img_size=img_size, v_max=v_max)
+    save_rgb(rgb, img_path, img_format=img_format)
+    return rgb
+
+
+def verify_tiles(tile_num=8, sizes=(701, 500, 350)):
+    """
+        fixed tile set of verify_render: seeded diagonal-decay contact matrices of diagonal window sizes
+    Args:
+        tile_num: tiles of each size
+        sizes: matrix sizes (bins), 701 is a full window of mul_process
+
+    Returns:
+        hic matrix list
+    """
+    rng = np.random.default_rng(0)
+    matrices = []
+    for size in sizes:
+        distance = np.abs(np.subtract.outer(np.arange(size), np.arange(size)))
+        for _ in range(tile_num):
+            decay = rng.uniform(0.8, 1.5)
+            matrices.append(rng.poisson(rng.uniform(20, 500) / (distance + 1) ** decay).astype(np.float32))
+    return matrices
+
+
+def verify_render(tmp_dir, matrices=None, tolerance=RENDER_TOLERANCE):
+    """
+        compare array renderer with matplotlib renderer (GenBaseModel.plot_hic_map) on saved jpg tiles
+    Args:
+        tmp_dir: temporary image dir
+        matrices: hic matrices (default: verify_tiles)
+        tolerance: max mean absolute pixel difference of each tile
+
+    Returns:
+        (pass or not, mean absolute difference of each tile)
+    """
+    import os
+    from src.common.hic_adv_model import GenBaseModel
+
+    if matrices is None:
+        matrices = verify_tiles()
+
+    plt_path = os.path.join(tmp_dir, "verify_plt.jpg")
+    array_path = os.path.join(tmp_dir, "verify_array.jpg")
+    diffs = []
+    for matrix in matrices:
+        GenBaseModel.plot_hic_map(matrix, plt_path)
+        render_hic_map(matrix, array_path)
+
+        plt_img = np.asarray(Image.open(plt_path).convert("RGB"), dtype=np.int16)
+        array_img = np.asarray(Image.open(array_path).convert("RGB"), dtype=np.int16)
+        if plt_img.shape != array_img.shape:
+            logger.error("Image size not match: %s != %s\n" % (plt_img.shape, array_img.shape))
+            return False, diffs
+        diffs.append(float(np.abs(plt_img - array_img).mean()))
+
+    logger.info("Mean absolute pixel difference: max %.3f, tolerance %s\n" % (max(diffs), tolerance))
+    return max(diffs) <= tolerance, diffs
+
+
+def benchmark_render(tmp_dir, tile_num=20, matrix_size=700):
+    """
+        benchmark tiles per second of matplotlib and array renderer
+    Args:
+        tmp_dir: temporary image dir
+        tile_num: tile number
+        matrix_size: matrix size (bins)
+
+    Returns:
+        {renderer: tiles per second}
+    """
+    import os
+    from src.common.hic_adv_model import GenBaseModel
+
+    rng = np.random.default_rng(0)
+    matrices = [rng.poisson(3, (matrix_size, matrix_size)).astype(np.float32) for _ in range(tile_num)]
+    renderers = {
+        "matplotlib": GenBaseModel.plot_hic_map,
+        "array": render_hic_map
+    }
+
+    speed = {}
+    for name, renderer in renderers.items():
+        start = time.perf_counter()
+        for index, matrix in enumerate(matrices):
+            renderer(matrix, os.path.join(tmp_dir, "%s_%s.jpg" % (name, index)))
+        speed[name] = tile_num / (time.perf_counter() - start)
+        logger.info("%s renderer: %.2f tiles/s\n", name, speed[name])
+    return speed
+
+
+def main():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        verify_render(tmp_dir)
+        benchmark_render(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: model_registry.py
+@time: 10/17/26 9:20 PM
+@function: detectors loaded once per run and shared by every detection call
+"""
+
+import gc
+import time
+
+import torch
+from mmdet.apis import init_detector
+
+from src.common.batch_infer import BatchDetector
+from src.common.cpu_infer import init_cpu_detector
+from src.common.detector_server import RemoteDetector
+from src.common.detector_runtime import RuntimeDetector
+from src.utils.logger import logger
+
+
+class DetectorRegistry:
+    """
+        Named detectors (BatchDetector or RuntimeDetector), built on first use and kept until released
+    """
+
+    def __init__(self, device="cpu", cpu_precision="fp32", batch_size=4, workers=4, lazy=True, server=None,
+                 cpu_channels_last=False):
+        """
+        Args:
+            device: GPU device or CPU
+            cpu_precision: CPU inference precision, fp32, bf16 or int8
+            batch_size: tiles of each forward pass
+            workers: preprocessing threads
+            lazy: load detector on first use (False: load when it is registered)
+            server: Unix socket of serve_model.py, detectors of server are used instead of loading models
+            cpu_channels_last: channels-last CPU detectors (opt-in, check it with cpu_infer.accuracy_regression)
+        """
+        self.device = device
+        self.cpu_precision = cpu_precision
+        self.cpu_channels_last = cpu_channels_last
+        self.batch_size = batch_size
+        self.workers = workers
+        self.lazy = lazy
+        self.server = server or None
+
+        self.specs = {}  # {name: (model config, pretrained model, runtime model)}
+        self.detectors = {}  # {name: loaded detector}
+
+    def register(self, name, model_cfg=None, pretrained_model=None, runtime_model=None):
+        """
+            add detector, runtime_model is used instead of model_cfg / pretrained_model when it is given
+        Args:
+            name: detector name
+            model_cfg: model config path
+            pretrained_model: pretrained model path
+            runtime_model: TorchScript runtime from export_model.py
+
+        Returns:
+            None
+        """
+        spec = (model_cfg, pretrained_model, runtime_model or None)
+        if self.specs.get(name) != spec:
+            self.release(name)
+        self.specs[name] = spec
+        if not self.lazy:
+            self.get(name)
+
+    def load(self, name):
+        """
+            build detector of name
+        Args:
+            name: detector name
+
+        Returns:
+            detector
+        """
+        model_cfg, pretrained_model, runtime_model = self.specs[name]
+        start = time.perf_counter()
+        if self.server:
+            detector = RemoteDetector(self.server, name, batch_size=self.batch_size)
+        elif runtime_model:
+            # tiles of another size than the exported one (e.g. chromosome images) fall back to the eager model
+            fallback = (lambda: self.eager(model_cfg, pretrained_model)) if model_cfg and pretrained_model else None
+            detector = RuntimeDetector(runtime_model, workers=self.workers, fallback=fallback)
+        else:
+            detector = self.eager(model_cfg, pretrained_model)
+        logger.info("Load %s detector in %.1f s\n" % (name, time.perf_counter() - start))
+        return detector
+
+    def eager(self, model_cfg, pretrained_model):
+        """
+            build mmdet detector on device
+        Args:
+            model_cfg: model config path
+            pretrained_model: pretrained model path
+
+        Returns:
+            BatchDetector
+        """
+        if self.device == "cpu":
+            model = init_cpu_detector(model_cfg, pretrained_model, precision=self.cpu_precision,
+                                      channels_last=self.cpu_channels_last)
+        else:
+            model = init_detector(model_cfg, pretrained_model, device=self.device)
+        return BatchDetector(model, batch_size=self.batch_size, workers=self.workers)
+
+    def get(self, name):
+        """
+            loaded detector of name
+        Args:
+            name: detector name
+
+        Returns:
+            detector
+        """
+        if name not in self.specs:
+            raise KeyError("Detector %s is not registered" % name)
+        if name not in self.detectors:
+            self.detectors[name] = self.load(name)
+        return self.detectors[name]
+
+    def release(self, name=None):
+        """
+            free detector memory, it is loaded again on next use
+        Args:
+            name: detector name (default: all detectors)
+
+        Returns:
+            None
+        """
+        names = list(self.detectors) if name is None else [name]
+        released = [self.detectors.pop(name) for name in names if name in self.detectors]
+        if not released:
+            return
+
+        for detector in released:
+            if isinstance(detector, RemoteDetector):
+                detector.close()
+
+        del released
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logger.info("Release detector: %s\n" % ", ".join(names))
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -9,21 +9,23 @@
 @function: multiprocessing generate hic image
 """
 
+import json
 import os
-from multiprocessing import Pool
+from collections import deque
+from functools import partial
+import multiprocessing
 
-from src.common.hic_adv_model import GenBaseModel
+from src.common.hic_adv_model import GenBaseModel, init_hic_worker
 from src.utils.get_cfg import increment
 from src.utils.logger import logger
 
-info_path = ""  # define
 
-
-def write_records(records):
+def write_records(records, info_path):
     """
         write records to info.txt
     Args:
         records: entries
+        info_path: info.txt path
 
     Returns:
          None
@@ -32,7 +34,107 @@ def write_records(records):
         f.writelines(records)
 
 
-def mul_process(hic_file, genome_id, out_file, methods, process_num, _resolution=None):
+def get_windows(start, end, methods, site_increase):
+    """
+        sliding window sites
+    Args:
+        start: hic start
+        end: hic end
+        methods: global or diagonal
+        site_increase: range and increment of resolution
+
+    Returns:
+        (a_start, a_end, b_start, b_end) generator
+    """
+    if methods == "global":  # sliding window method with global
+        flag = False  # flag to judge whether the end is reached
+        for site_1 in range(start, end, site_increase["increase"]):
+            if site_increase["range"] > end:
+                site_increase["range"] = end
+            if site_1 + site_increase["range"] > end:
+                site_1 = end - site_increase["range"]
+                flag = True
+            for site_2 in range(start, end, site_increase["increase"]):
+                if site_2 + site_increase["range"] > end:
+                    site_2 = end - site_increase["range"]
+                    yield site_1, site_1 + site_increase["range"], site_2, site_2 + site_increase["range"]
+                    break
+                yield site_1, site_1 + site_increase["range"], site_2, site_2 + site_increase["range"]
+            if flag:
+                break
+    else:  # sliding window method with diagonal
+        for site in range(start, end, site_increase["increase"]):
+            if site_increase["range"] > end:
+                site_increase["range"] = end
+            site_end = site + site_increase["range"]
+            if site_end > end:  # at the end
+                site = end - site_increase["range"]
+                site_end = end
+            if site < 0:  # solve white region padding bug
+                site = 0
+            yield site, site_end, site, site_end
+
+
+def uncached_windows(windows, resolution, cached_tile, cached_records):
+    """
+        windows without cached detections
+    Args:
+        windows: window generator
+        resolution: hic resolution
+        cached_tile: TileCache.lookup
+        cached_records: info records of cached windows are appended to it
+
+    Returns:
+        window generator
+    """
+    for window in windows:
+        record = cached_tile(resolution, window)
+        if record is None:
+            yield window
+        else:
+            cached_records.append(record)
+
+
+def group_windows(windows, group_size):
+    """
+        group consecutive overlapping windows
+    Args:
+        windows: window generator
+        group_size: window number of each group
+
+    Returns:
+        window list generator
+    """
+    group = []
+    for window in windows:
+        if group and window[0] >= group[-1][1]:  # gap left by cached windows, read another band
+            yield group
+            group = []
+        group.append(window)
+        if len(group) >= group_size:
+            yield group
+            group = []
+    if group:
+        yield group
+
+
+def log_worker_error(error, failed=None):
+    """
+        error_callback of pool tasks, a failed task is logged and recorded instead of dropped
+    Args:
+        error: exception raised in the worker
+        failed: errors of failed tasks (default: None, not recorded)
+
+    Returns:
+        None
+    """
+    logger.error("Hic image worker failed: %s: %s\n" % (type(error).__name__, error))
+    if failed is not None:
+        failed.append(error)
+
+
+def mul_process(hic_file, genome_id, out_file, methods, process_num, _resolution=None, renderer="array",
+                band_group=16, _resolutions=None, cached_tile=None, start_method=None):
     """
         multiprocessing generate hic image
     Args:
@@ -42,6 +144,12 @@ def mul_process(hic_file, genome_id, out_file, methods, process_num, _resolution
         methods: global or diagonal (default: diagonal)
         process_num: process number (default: 10)
         _resolution: specific resolution (default: None)
+        renderer: array or matplotlib, array is within hic_render.RENDER_TOLERANCE of matplotlib (default: array)
+        band_group: diagonal windows generated from one band read (default: 16, <= 1 read each window)
+        _resolutions: specific resolution list, eg: from plan_hic_resolutions (default: None)
+        cached_tile: TileCache.lookup, cached windows are written to info.txt with their detections (default: None)
+        start_method: worker start method, "spawn" when called from a thread, forking a threaded process may
+                      deadlock the workers (default: None, platform default)
 
     Returns:
         None
@@ -49,20 +157,28 @@ def mul_process(hic_file, genome_id, out_file, methods, process_num, _resolution
     logger.info("Multiple Process Initiating ...\n")
 
     # initialize hic process class
-    hic_class = GenBaseModel(hic_file, genome_id, out_file)
+    hic_class = GenBaseModel(hic_file, genome_id, out_file, renderer=renderer)
 
     resolutions = hic_class.get_resolutions()  # get resolution list
 
     logger.info("Number of processes is : %s\n" % process_num)
-    pool = Pool(process_num)  # process number
+    failed = []  # errors of windows whose tiles were not generated
+    log_error = partial(log_worker_error, failed=failed)
+    context = multiprocessing.get_context(start_method)
+    avoided_opens = context.Value("i", 0)  # hic file opens avoided by workers
+    pool = context.Pool(process_num, initializer=init_hic_worker, initargs=(hic_file, avoided_opens))  # process number
 
     start = 0
     end = hic_class.get_chr_len()  # get hic file length
 
-    global info_path  # info.txt file path
+    # info.txt of this call, hic files may be processed in threads at the same time
     info_path = os.path.join(hic_class.genome_folder, "info.txt")
+    write_info = partial(write_records, info_path=info_path)
     if _resolution is not None:
         resolutions = [_resolution]
+    elif _resolutions is not None:
+        resolutions = _resolutions
+    cached_records = []  # info records of cached windows
 
     # for resolution in resolutions[0:4]:
     for resolution in resolutions:
@@ -78,48 +194,120 @@ def mul_process(hic_file, genome_id, out_file, methods, process_num, _resolution
         # range and increment
         site_increase = increment(resolution)
 
-        if methods == "global":  # sliding window method with global
-            flag = False  # flag to judge whether the end is reached
-            for site_1 in range(start, end, site_increase["increase"]):
-                if site_increase["range"] > end:
-                    site_increase["range"] = end
-                if site_1 + site_increase["range"] > end:
-                    site_1 = end - site_increase["range"]
-                    flag = True
-                for site_2 in range(start, end, site_increase["increase"]):
-                    if site_2 + site_increase["range"] > end:
-                        site_2 = end - site_increase["range"]
-                        pool.apply_async(hic_class.gen_png, args=(
-                            resolution, site_1, site_1 + site_increase["range"], site_2,
-                            site_2 + site_increase["range"],),
-                                         callback=write_records)
-                        break
-                    pool.apply_async(hic_class.gen_png, args=(
-                        resolution, site_1, site_1 + site_increase["range"], site_2,
-                        site_2 + site_increase["range"],),
-                                     callback=write_records)
-                if flag:
-                    break
-        else:  # sliding window method with diagonal
-            for site in range(start, end, site_increase["increase"]):
-                if site_increase["range"] > end:
-                    site_increase["range"] = end
-                site_end = site + site_increase["range"]
-                if site_end > end:  # at the end
-                    site = end - site_increase["range"]
-                    site_end = end
-                if site < 0:  # solve white region padding bug
-                    site = 0
-                pool.apply_async(hic_class.gen_png, args=(
-                    resolution, site, site_end, site, site_end,),
-                                 callback=write_records)
+        windows = get_windows(start, end, methods, site_increase)
+        if cached_tile is not None:
+            windows = uncached_windows(windows, resolution, cached_tile, cached_records)
+        if methods == "global" or band_group <= 1:
+            for window in windows:
+                pool.apply_async(hic_class.gen_png, args=(resolution,) + window, callback=write_info,
+                                 error_callback=log_error)
+        else:
+            # diagonal windows overlap, read the band under a group of windows once
+            for group in group_windows(windows, band_group):
+                pool.apply_async(hic_class.gen_band_png, args=(resolution, group), callback=write_info,
+                                 error_callback=log_error)
 
     pool.close()  # close pool
     pool.join()  # wait for all subprocesses done
+    if failed:
+        raise RuntimeError("Hic image generation failed on %s tasks of %s, first error: %r"
+                           % (len(failed), hic_file, failed[0]))
+    if cached_records:
+        write_info([json.dumps(record) + "\n" for record in cached_records])
+        logger.info("Cached tiles: %s\n" % len(cached_records))
 
+    logger.info("Hic file opens avoided: %s\n" % avoided_opens.value)
     logger.info("Multiple process finished\n")
 
 
+def mul_stream(hic_file, genome_id, out_file, methods, process_num, _resolution=None, queue_size=None,
+               band_group=4, _resolutions=None, cached_tile=None, window_filter=None, renderer="array",
+               start_method=None):
+    """
+        multiprocessing generate hic image arrays, without writing image and info.txt
+    Args:
+        hic_file: hic file path
+        genome_id: genome id
+        out_file: output file path
+        methods: global or diagonal (default: diagonal)
+        process_num: process number (default: 10)
+        _resolution: specific resolution (default: None)
+        queue_size: max number of tiles in flight (default: 4 * process_num)
+        band_group: diagonal windows generated from one band read (default: 4, <= 1 read each window)
+        _resolutions: specific resolution list, eg: from plan_hic_resolutions (default: None)
+        cached_tile: TileCache.lookup, cached windows are yielded without image (default: None)
+        window_filter: (resolution, window) -> bool, only accepted windows are generated (default: all windows)
+        renderer: array or matplotlib, array is within hic_render.RENDER_TOLERANCE of matplotlib (default: array)
+        start_method: worker start method, "spawn" when called from a thread, forking a threaded process may
+                      deadlock the workers (default: None, platform default)
+
+    Returns:
+        (info record, BGR image array or None) generator
+    """
+    logger.info("Multiple Process Stream Initiating ...\n")
+
+    # initialize hic process class
+    hic_class = GenBaseModel(hic_file, genome_id, out_file, renderer=renderer)
+
+    resolutions = hic_class.get_resolutions()  # get resolution list
+    if _resolution is not None:
+        resolutions = [_resolution]
+    elif _resolutions is not None:
+        resolutions = _resolutions
+
+    if queue_size is None:
+        queue_size = process_num * 4
+
+    start = 0
+    end = hic_class.get_chr_len()  # get hic file length
+
+    band = methods != "global" and band_group > 1
+    group_size = band_group if band else 1
+
+    cached_records = []  # info records of cached windows
+    pending = deque()  # bounded queue of tile groups in flight
+    in_flight = 0  # tiles in flight
+    context = multiprocessing.get_context(start_method)
+    avoided_opens = context.Value("i", 0)  # hic file opens avoided by workers
+    with context.Pool(process_num, initializer=init_hic_worker, initargs=(hic_file, avoided_opens)) as pool:
+        for resolution in resolutions:
+            if resolution < 500:  # resolution < 500 is not for inference
+                continue
+
+            logger.info("Streaming resolution: %s\n" % resolution)
+
+            # range and increment
+            site_increase = increment(resolution)
+
+            windows = get_windows(start, end, methods, site_increase)
+            if window_filter is not None:
+                windows = (window for window in windows if window_filter(resolution, window))
+            if cached_tile is not None:
+                windows = uncached_windows(windows, resolution, cached_tile, cached_records)
+            for group in group_windows(windows, group_size):
+                if band:  # diagonal windows overlap, read the band under a group of windows once
+                    pending.append(pool.apply_async(hic_class.gen_band_tiles, args=(resolution, group),
+                                                    error_callback=log_worker_error))
+                else:
+                    pending.append(pool.apply_async(hic_class.gen_tile, args=(resolution,) + group[0],
+                                                    error_callback=log_worker_error))
+                in_flight += len(group)
+                while in_flight >= queue_size:
+                    tiles = pending.popleft().get()
+                    if not band:
+                        tiles = [tiles]
+                    in_flight -= len(tiles)
+                    yield from tiles
+
+        while pending:
+            tiles = pending.popleft().get()
+            yield from (tiles if band else [tiles])
+        yield from ((record, None) for record in cached_records)
+
+    logger.info("Hic file opens avoided: %s\n" % avoided_opens.value)
+    logger.info("Multiple process stream finished\n")
+
+
 def main():
     pass
 
@@ -0,0 +1,168 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: res_plan.py
+@time: 10/17/26 4:10 PM
+@function: plan the resolutions worth generating tiles for
+"""
+
+import math
+
+from src.common.hic_adv_model import get_hic_file
+from src.common.mul_gen_png import get_windows
+from src.utils.get_cfg import increment
+from src.utils.logger import logger
+
+
+def get_ctg_n50(asy_file) -> int:
+    """
+        get contig N50 of assembly file
+    Args:
+        asy_file: assembly file path
+
+    Returns:
+        contig N50
+    """
+    ctg_lens = []
+    with open(asy_file, "r") as f:
+        for line in f:
+            if line.startswith(">"):
+                ctg_lens.append(int(line.strip().split()[2]))
+
+    half_len = sum(ctg_lens) / 2
+    accumulate_len = 0
+    for ctg_len in sorted(ctg_lens, reverse=True):
+        accumulate_len += ctg_len
+        if accumulate_len >= half_len:
+            return ctg_len
+    return 0
+
+
+def error_len_range(resolution, genome_len, min_bins=10, max_fraction=0.5):
+    """
+        error length range can be detected on the tiles of one resolution
+    Args:
+        resolution: hic resolution
+        genome_len: hic file length
+        min_bins: min error size (bins) can be seen on tile
+        max_fraction: max error size (fraction of tile range)
+
+    Returns:
+        (min error length, max error length)
+    """
+    tile_range = min(increment(resolution)["range"], genome_len)
+    return min_bins * resolution, max_fraction * tile_range
+
+
+def count_tiles(resolutions, genome_len, methods="dia"):
+    """
+        count tiles of resolutions
+    Args:
+        resolutions: hic resolutions
+        genome_len: hic file length
+        methods: global or diagonal
+
+    Returns:
+        tile number
+    """
+    return sum(sum(1 for _ in get_windows(0, genome_len, methods, increment(resolution)))
+               for resolution in resolutions)
+
+
+def plan_resolutions(resolutions, genome_len, error_min_len, error_max_len, ctg_n50=None, min_bins=10,
+                     max_fraction=0.5):
+    """
+        select min resolution set covering detectable error length range
+    Args:
+        resolutions: hic resolutions
+        genome_len: hic file length
+        error_min_len: error min length
+        error_max_len: error max length
+        ctg_n50: contig N50 (hic coordinate), its best resolution is always kept
+        min_bins: min error size (bins) can be seen on tile
+        max_fraction: max error size (fraction of tile range)
+
+    Returns:
+        selected resolutions (same order as resolutions)
+    """
+    candidates = sorted(res for res in resolutions if res >= 500)  # resolution < 500 is not for inference
+    if not candidates:
+        return []
+
+    len_range = {res: error_len_range(res, genome_len, min_bins, max_fraction) for res in candidates}
+    target_max = min(error_max_len, genome_len)
+
+    # greedy interval cover: from min error length, the coarsest resolution reaching furthest
+    selected = set()
+    covered = error_min_len
+    while covered < target_max:
+        reach = [res for res in candidates if len_range[res][1] > covered]
+        if not reach:
+            break
+        usable = [res for res in reach if len_range[res][0] <= covered]
+        if usable:
+            res = max(usable, key=lambda x: (len_range[x][1], x))  # coarser one has fewer tiles
+        else:  # gap below every resolution, use the finest one
+            res = min(reach)
+        selected.add(res)
+        covered = len_range[res][1]
+
+    # keep the resolution where contig N50 size error is in the middle of detectable range
+    if ctg_n50 is not None and error_min_len <= ctg_n50 <= target_max:
+        n50_res = min(candidates, key=lambda x: abs(
+            math.log(ctg_n50) - (math.log(len_range[x][0]) + math.log(len_range[x][1])) / 2))
+        selected.add(n50_res)
+
+    return [res for res in resolutions if res in selected]
+
+
+def plan_hic_resolutions(hic_file, asy_file, error_min_len, error_max_len, methods="dia"):
+    """
+        plan resolutions of hic file and report the tiles saved
+    Args:
+        hic_file: hic file path
+        asy_file: assembly file path
+        error_min_len: error min length
+        error_max_len: error max length
+        methods: global or diagonal
+
+    Returns:
+        selected resolutions
+    """
+    hic = get_hic_file(hic_file)
+    resolutions = hic.getResolutions()
+
+    genome_len = 0  # hic file length
+    for chrom in hic.getChromosomes():
+        if chrom.name == "assembly":
+            genome_len = chrom.length
+
+    # contig N50 in hic coordinate
+    ctg_n50 = None
+    if asy_file is not None:
+        asy_len = 0
+        with open(asy_file, "r") as f:
+            for line in f:
+                if line.startswith(">"):
+                    asy_len += int(line.strip().split()[2])
+        ctg_n50 = get_ctg_n50(asy_file) * genome_len / asy_len
+
+    selected = plan_resolutions(resolutions, genome_len, error_min_len, error_max_len, ctg_n50=ctg_n50)
+
+    all_tiles = count_tiles([res for res in resolutions if res >= 500], genome_len, methods)
+    selected_tiles = count_tiles(selected, genome_len, methods)
+    logger.info("Planned resolutions: %s (contig N50 in hic: %s)\n", selected, ctg_n50)
+    logger.info("Tiles: %s of %s, saved %s\n", selected_tiles, all_tiles, all_tiles - selected_tiles)
+
+    return selected
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
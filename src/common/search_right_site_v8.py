@@ -9,7 +9,6 @@
 @function: 
 """
 
-import json
 import math
 from collections import defaultdict
 
@@ -19,7 +18,8 @@ from scipy.signal import find_peaks
 
 from src.assembly import get_max_peak
 from src.assembly.asy_operate import AssemblyOperate
-from src.utils.get_cfg import get_hic_real_len, get_max_hic_len
+from src.common.contact_source import ContactSource
+from src.utils.get_cfg import get_hic_real_len
 from src.utils.logger import logger
 
 
@@ -33,7 +33,7 @@ def get_full_len_matrix(hic_file, asy_file, fit_resolution: int, width_site: tup
         length_site:  length site
         fit_resolution:  fit resolution
     Returns:
-        full length matrix
+        full length contacts (ContactSource)
     """
 
     # get hic object
@@ -53,74 +53,22 @@ def get_full_len_matrix(hic_file, asy_file, fit_resolution: int, width_site: tup
         for chrom in hic_object.getChromosomes():
             if chrom.name == "assembly":
                 hic_len = get_hic_real_len(hic_file, asy_file)
-    else:
-        hic_len = length_site[1] - length_site[0]
-
-    # according to fit_resolution, get matrix_zoom_data
-    matrix_zoom_data = hic_object.getMatrixZoomData(
-        'assembly', 'assembly', "observed", "KR", "BP", fit_resolution)
-
-    # get fit_resolution max len
-    res_max_len = get_max_hic_len(fit_resolution)
-
-    # cut full length block number
-    len_block_num = math.ceil(hic_len / res_max_len)
-    # each block length
-    each_block_len = math.ceil(hic_len / len_block_num)
-    each_block_res_number = round(each_block_len / fit_resolution)
-    iter_len = []
-    for i in range(len_block_num):
-        iter_len.append(each_block_res_number * i * fit_resolution)
-    iter_len.append(hic_len)
-
-    # cut error site block number
-    error_len_block_num = math.ceil((width_site[1] - width_site[0]) / res_max_len)
-    # each block length
-    error_each_block_len = math.ceil((width_site[1] - width_site[0]) / error_len_block_num)
-    error_each_block_res_number = round(error_each_block_len / fit_resolution)
-    error_iter_len = []
-    for i in range(error_len_block_num):
-        error_iter_len.append(width_site[0] + error_each_block_res_number * i * fit_resolution)
-    error_iter_len.append(width_site[1])
-
-    full_len_matrix = None
-    for i in range(len(iter_len) - 1):  # loop full length each block
-        temp_error_matrix = None
-        for j in range(len(error_iter_len) - 1):
-            if length_site is None:
-                logger.info("%s %s %s %s", error_iter_len[j], error_iter_len[j + 1] - 1, iter_len[i],
-                            iter_len[i + 1] - 1)
-                matrix_data = matrix_zoom_data.getRecordsAsMatrix(error_iter_len[j], error_iter_len[j + 1] - 1,
-                                                                  iter_len[i], iter_len[i + 1] - 1)
-            else:
-                logger.info("%s %s %s %s", error_iter_len[j], error_iter_len[j + 1] - 1, length_site[0] + iter_len[i],
-                            length_site[0] + iter_len[i + 1])
-                matrix_data = matrix_zoom_data.getRecordsAsMatrix(error_iter_len[j], error_iter_len[j + 1] - 1,
-                                                                  length_site[0] + iter_len[i],
-                                                                  length_site[0] + iter_len[i + 1])
-            if temp_error_matrix is None:
-                # 稀疏矩阵
-                if matrix_data.shape == (1, 1):
-                    matrix_data = np.zeros((error_each_block_res_number, each_block_res_number))
-                temp_error_matrix = matrix_data
-            elif matrix_data.shape == (1, 1):
-                temp_error_matrix = np.zeros((error_each_block_res_number, each_block_res_number))
-            else:
-                temp_error_matrix = np.vstack((temp_error_matrix, matrix_data))
 
-        if full_len_matrix is None:
-            full_len_matrix = temp_error_matrix
-        else:
-            full_len_matrix = np.hstack((full_len_matrix, temp_error_matrix))
+        # error site rows x full length columns
+        y_start, y_end = 0, hic_len - 1
+    else:
+        # error site rows x length site columns
+        y_start, y_end = length_site
 
-    return full_len_matrix
+    # sparse contacts, sliced from genome wide matrix cache when the resolution fits in it
+    return ContactSource.from_hic(hic_file, fit_resolution, width_site[0], width_site[1] - 1, y_start, y_end, "KR")
 
 
 def get_insert_peak(peak_matrix, error_site: tuple, fit_resolution: int, remove_self: bool = True, peak_percentile=95):
     """
         get insert peak
     Args:
-        peak_matrix: peak matrix( full_len_matrix )
+        peak_matrix: peak matrix( full_len_matrix, ContactSource )
         error_site: error site
         fit_resolution: fit resolution
         remove_self: remove self error peaks
@@ -138,15 +86,14 @@ def get_insert_peak(peak_matrix, error_site: tuple, fit_resolution: int, remove_
 
     distance_threshold = len(bin_index)
 
-    numpy_matrix_num = len(peak_matrix)  # get matrix length
-    numpy_matrix_len = len(peak_matrix[0])  # get matrix width
+    numpy_matrix_num, numpy_matrix_len = peak_matrix.shape  # get matrix length and width
 
     peaks_dict = defaultdict()
 
     for i in range(numpy_matrix_num):
         x = np.arange(0, numpy_matrix_len)  # get matrix index
 
-        y = peak_matrix[i]  # get matrix value
+        y = peak_matrix.row(i)  # get matrix value
 
         # get peaks
         # peak_percentile 需要调整，95% 可能峰太多
@@ -189,21 +136,47 @@ def get_insert_peak(peak_matrix, error_site: tuple, fit_resolution: int, remove_
     return many_key_name
 
 
-def get_max_matrix_value(matrix: np.ndarray):
+def get_max_matrix_value(matrix: ContactSource):
     """
         get max matrix value
     Args:
-        matrix: matrix
+        matrix: matrix (ContactSource)
 
     Returns:
         max value
     """
-    return np.unravel_index(np.argmax(matrix, axis=None), matrix.shape)[1] + 1
+    return matrix.argmax()[1] + 1
 
 
-def search_right_site_v8(hic_file, assembly_file, ratio, error_site: tuple, modified_assembly_file):
-    # init assembly operate object
-    asy_operate = AssemblyOperate(assembly_file, ratio)
+def max_overlap_ctg(contain_ctg, insert_region):
+    """
+        ctg of the insert region with the max overlap, the first and last ctg overlap it partly and the middle ones
+        fully (their length). Lengths are int: the file-based search gave str lengths, so with 3 or more ctg max
+        raised TypeError and the error was black listed
+    Args:
+        contain_ctg: {ctg name: CtgSite} of the insert region in assembly order
+        insert_region: insert region (start, end)
+
+    Returns:
+        {ctg name: CtgSite} of one ctg
+    """
+    if len(contain_ctg) <= 1:
+        return contain_ctg
+
+    max_overlap = {}
+    contain_ctg_lists = list(contain_ctg.keys())
+    max_overlap[contain_ctg_lists[0]] = contain_ctg[contain_ctg_lists[0]].end - insert_region[0]
+    max_overlap[contain_ctg_lists[-1]] = insert_region[1] - contain_ctg[contain_ctg_lists[-1]].start
+
+    for contain_ctg_list in contain_ctg_lists[1:-1]:
+        max_overlap[contain_ctg_list] = contain_ctg[contain_ctg_list].length
+    return {max(max_overlap, key=max_overlap.get): contain_ctg[max(max_overlap, key=max_overlap.get)]}
+
+
+def search_right_site_v8(hic_file, assembly_file, ratio, error_site: tuple, modified_assembly_file, asy_operate=None):
+    # init assembly operate object (or use the one of the edit session)
+    if asy_operate is None:
+        asy_operate = AssemblyOperate(assembly_file, ratio)
 
     hic = hicstraw.HiCFile(hic_file)  # get hic object
     resolutions = hic.getResolutions()  # get fit_resolution list
@@ -243,18 +216,15 @@ def search_right_site_v8(hic_file, assembly_file, ratio, error_site: tuple, modi
     # search ctg in insert peak
     contain_ctg = asy_operate.find_site_ctg_s(assembly_file, final_insert_region[0], final_insert_region[0] + 1)
 
-    # json format
-    contain_ctg = json.loads(contain_ctg)
-
     # cut final insert location ctg left point
     contain_ctg_first = list(contain_ctg.keys())[0]
 
     first_cut_ctg = {contain_ctg_first: math.ceil(final_insert_region[0] * ratio)}
 
     # 如果刚好边界等，不需要切割
-    if contain_ctg[contain_ctg_first]["start"] != final_insert_region[0]:
+    if contain_ctg[contain_ctg_first].start != final_insert_region[0]:
         # cut a ctg to two ctg
-        if "fragment" in contain_ctg_first or "debris" in contain_ctg_first:  # check whether the ctg is already cut
+        if asy_operate.is_fragment(contain_ctg_first):  # check whether the ctg is already cut
             asy_operate.re_cut_ctg_s(modified_assembly_file, first_cut_ctg, modified_assembly_file)
         else:
             asy_operate.cut_ctg_s(modified_assembly_file, first_cut_ctg, modified_assembly_file)
@@ -263,18 +233,15 @@ def search_right_site_v8(hic_file, assembly_file, ratio, error_site: tuple, modi
     contain_ctg = asy_operate.find_site_ctg_s(modified_assembly_file, final_insert_region[1],
                                               final_insert_region[1] + 1)
 
-    # json format
-    contain_ctg = json.loads(contain_ctg)
-
     # cut final insert location ctg right point
     contain_ctg_second = list(contain_ctg.keys())[0]
 
     second_cut_ctg = {contain_ctg_second: math.ceil(final_insert_region[1] * ratio)}
 
     # if boundary equal, no need to cut
-    if contain_ctg[contain_ctg_second]["start"] != final_insert_region[1]:
+    if contain_ctg[contain_ctg_second].start != final_insert_region[1]:
         # cut a ctg to two ctg
-        if "fragment" in contain_ctg_second or "debris" in contain_ctg_second:  # check whether the ctg is already cut
+        if asy_operate.is_fragment(contain_ctg_second):  # check whether the ctg is already cut
             asy_operate.re_cut_ctg_s(modified_assembly_file, second_cut_ctg, modified_assembly_file)
         else:
             asy_operate.cut_ctg_s(modified_assembly_file, second_cut_ctg, modified_assembly_file)
@@ -282,30 +249,15 @@ def search_right_site_v8(hic_file, assembly_file, ratio, error_site: tuple, modi
     # search ctg in insert peak
     contain_ctg = asy_operate.find_site_ctg_s(modified_assembly_file, final_insert_region[0], final_insert_region[1])
 
-    # json format
-    contain_ctg = json.loads(contain_ctg)
-
     # return multiple ctg : ctg > 1
-    if len(contain_ctg) > 1:
-        max_overlap = {}
-        contain_ctg_lists = list(contain_ctg.keys())
-        max_overlap[contain_ctg_lists[0]] = contain_ctg[contain_ctg_lists[0]]["end"] - final_insert_region[0]
-        max_overlap[contain_ctg_lists[-1]] = final_insert_region[1] - contain_ctg[contain_ctg_lists[-1]][
-            "start"]
-
-        for contain_ctg_list in contain_ctg_lists[1:-1]:
-            max_overlap[contain_ctg_list] = contain_ctg[contain_ctg_list]["length"]
-        temp_contain_ctg = {
-            max(max_overlap, key=max_overlap.get): contain_ctg[max(max_overlap, key=max_overlap.get)]}
-
-        contain_ctg = temp_contain_ctg
+    contain_ctg = max_overlap_ctg(contain_ctg, final_insert_region)
 
     logger.info(f"Insert ctg: ： {contain_ctg}")
 
     # calculate insert direction
     only_ctg_name = list(contain_ctg.keys())[0]
-    left_distance = round(final_insert_region[0] * ratio) - contain_ctg[only_ctg_name]["start"]
-    right_distance = contain_ctg[only_ctg_name]["end"] - round(final_insert_region[1] * ratio)
+    left_distance = round(final_insert_region[0] * ratio) - contain_ctg[only_ctg_name].start
+    right_distance = contain_ctg[only_ctg_name].end - round(final_insert_region[1] * ratio)
 
     if left_distance < right_distance:
         logger.info("Insert direction is Left \n")
@@ -0,0 +1,180 @@
+#!/opt/conda/envs/autohic/bin/python
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: tile_cache.py
+@time: 10/17/26 10:40 PM
+@function: detections of diagonal tiles keyed by the contig segment under them, reused by the next adjust epoch
+"""
+
+import hashlib
+import json
+import os
+from bisect import bisect_right
+
+import numpy as np
+
+from src.utils.get_cfg import get_ratio
+from src.utils.logger import logger
+
+CACHE_FILE = "tile_cache.json"
+
+
+def read_fragments(asy_file):
+    """
+        fragments of assembly in hic order
+    Args:
+        asy_file: assembly file path
+
+    Returns:
+        [(fragment name, length, orientation), ...]
+    """
+    ctg_dict = {}  # {ctg number: (name, length)}
+    fragments = []
+    with open(asy_file, "r") as f:
+        for line in f:
+            if line.startswith(">"):
+                name, number, length = line[1:].split()
+                ctg_dict[int(number)] = (name, int(length))
+            else:
+                for ctg in line.split():
+                    name, length = ctg_dict[abs(int(ctg))]
+                    fragments.append((name, length, "-" if ctg.startswith("-") else "+"))
+    return fragments
+
+
+def cached_detections(info):
+    """
+        detections of a cached tile record
+    Args:
+        info: info record
+
+    Returns:
+        per class (n, 5) arrays, None when the tile is not cached
+    """
+    record = info[list(info.keys())[0]]
+    if "detections" not in record:
+        return None
+    return [np.array(boxes, dtype=np.float32).reshape(-1, 5) for boxes in record["detections"]]
+
+
+class TileCache:
+    """
+        A diagonal tile shows the contacts of the fragment segment under it, so a tile whose segment (fragments,
+        orientations and offsets relative to tile start) is unchanged after an adjustment has the same image and
+        the same detections at its new position.
+    """
+
+    def __init__(self, hic_file, asy_file, previous_cache=None, score=0.9):
+        """
+        Args:
+            hic_file: hic file path
+            asy_file: assembly file of hic file
+            previous_cache: tile_cache.json of the previous epoch (default: nothing to reuse)
+            score: tiles with detections above score are only reused while their image exists
+        """
+        self.ratio = get_ratio(hic_file, asy_file)  # assembly length / hic length
+        self.score = score
+        self.fragments = read_fragments(asy_file)
+        self.starts = np.cumsum([0] + [length for _, length, _ in self.fragments[:-1]]).tolist()
+
+        self.previous = {}
+        if previous_cache is not None and os.path.exists(previous_cache):
+            with open(previous_cache, "r") as f:
+                self.previous = json.load(f)
+        self.entries = {}  # {tile key: entry} of this hic file
+        self.reused = 0  # tiles with detections of the previous epoch
+
+    def tile_key(self, resolution, a_start, a_end):
+        """
+            content hash of the fragment segment under a diagonal tile
+        Args:
+            resolution: hic resolution
+            a_start: tile start (hic coordinate)
+            a_end: tile end (hic coordinate)
+
+        Returns:
+            key
+        """
+        bp_start, bp_end = a_start * self.ratio, a_end * self.ratio
+        pieces = []
+        index = max(bisect_right(self.starts, bp_start) - 1, 0)
+        while index < len(self.fragments) and self.starts[index] < bp_end:
+            name, length, orientation = self.fragments[index]
+            start = max(self.starts[index], bp_start)
+            end = min(self.starts[index] + length, bp_end)
+            if end > start:
+                # fragment offset of the piece, piece start / end relative to tile start
+                pieces.append((name, length, orientation, round(start - self.starts[index]),
+                               round(start - bp_start), round(end - bp_start)))
+            index += 1
+        content = json.dumps([resolution, a_end - a_start, round(self.ratio, 6), pieces])
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def lookup(self, resolution, window, genome_id="png"):
+        """
+            info record of a window with detections of the previous epoch
+        Args:
+            resolution: hic resolution
+            window: (a_start, a_end, b_start, b_end)
+            genome_id: genome id of info record
+
+        Returns:
+            info record with "detections" and "img_size", None when the tile must be detected again
+        """
+        entry = self.previous.get(self.tile_key(resolution, window[0], window[1]))
+        if entry is None:
+            return None
+        # visualization reads the image of tiles with errors
+        if any(box[4] > self.score for boxes in entry["detections"] for box in boxes) and \
+                not os.path.exists(entry["image_id"]):
+            return None
+
+        a_start, a_end, b_start, b_end = window
+        return {entry["image_id"]: {"genome_id": genome_id, "resolution": resolution,
+                                    "chr_A": "assembly", "chr_A_start": a_start, "chr_A_end": a_end,
+                                    "chr_B": "assembly", "chr_B_start": b_start, "chr_B_end": b_end,
+                                    "detections": entry["detections"], "img_size": entry["img_size"]}}
+
+    def add(self, info, detections, img_size, cached=False):
+        """
+            keep detections of a tile
+        Args:
+            info: info record
+            detections: per class (n, 5) arrays
+            img_size: (width, height) of tile image
+            cached: detections come from lookup
+
+        Returns:
+            None
+        """
+        self.reused += cached
+        image_id = list(info.keys())[0]
+        record = info[image_id]
+        key = self.tile_key(record["resolution"], record["chr_A_start"], record["chr_A_end"])
+        self.entries[key] = {"image_id": image_id, "img_size": list(img_size),
+                             "detections": [np.round(np.asarray(boxes, dtype=float), 3).tolist()
+                                            for boxes in detections]}
+
+    def save(self, out_path):
+        """
+            write tile_cache.json for the next epoch
+        Args:
+            out_path: detection output path
+
+        Returns:
+            None
+        """
+        with open(os.path.join(out_path, CACHE_FILE), "w") as f:
+            json.dump(self.entries, f)
+        logger.info("Tile cache: %s tiles, %s reused from previous epoch\n" % (len(self.entries), self.reused))
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
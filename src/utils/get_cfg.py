@@ -10,7 +10,6 @@
 """
 
 import json
-import math
 import os
 import subprocess
 
@@ -18,6 +17,9 @@ import hicstraw
 import numpy as np
 
 from src.assembly.asy_operate import AssemblyOperate
+from src.common.hic_block import build_block_matrix, hic_matrix_opener
+from src.common.contact_source import ContactSource
+from src.common.hic_cache import get_hic_length, get_matrix_cache
 from src.report.gen_report import image_to_base64
 from src.utils.logger import logger
 
@@ -147,11 +149,12 @@ def get_max_color(hic_file, resolution):
     Returns:
         max color
     """
-    full_len_matrix = get_full_len_matrix(hic_file, resolution)
-
     if resolution <= 1000:
         return 1
-    maxcolor = (np.percentile(full_len_matrix, 95))
+
+    # percentile of sparse contacts, zeros are counted without densify
+    hic_len = get_hic_length(hic_file)
+    maxcolor = ContactSource.from_hic(hic_file, resolution, 0, hic_len - 1, 0, hic_len - 1, "KR").percentile(95)
     if maxcolor < 1:
         maxcolor = 1
     return maxcolor
@@ -204,47 +207,14 @@ def get_full_len_matrix(hic_file, resolution, assembly_file=None):
     else:
         hic_len = get_hic_real_len(hic_file, assembly_file)
 
-    # get resolution max len
-    res_max_len = get_max_hic_len(resolution)
-
-    # cut full length block number
-    len_block_num = math.ceil(hic_len / res_max_len)
-    # each block length
-    each_block_len = math.ceil(hic_len / len_block_num)
-    each_block_res_number = round(each_block_len / resolution)
-    iter_len = []
-    for i in range(len_block_num):
-        iter_len.append(each_block_res_number * i * resolution)
-    iter_len.append(hic_len)
-
-    # according to fit_resolution, get matrix_zoom_data
-    matrix_zoom_data = hic_object.getMatrixZoomData(
-        'assembly', 'assembly', "observed", "KR", "BP", resolution)
-
-    full_len_matrix = None
-    for i in range(len(iter_len) - 1):  # loop full length each block
-        temp_matrix = None
-        for j in range(len(iter_len) - 1):
-            # logger.debug(
-            #     "Start_A: {}, End_A: {}, Start_B: {}, End_B: {}".format(iter_len[j], iter_len[j + 1] - 1, iter_len[i],
-            #                                                             iter_len[i + 1] - 1))
-            matrix_data = matrix_zoom_data.getRecordsAsMatrix(iter_len[j], iter_len[j + 1] - 1,
-                                                              iter_len[i], iter_len[i + 1] - 1)
-            if temp_matrix is None:
-                # 稀疏矩阵
-                if matrix_data.shape == (1, 1):
-                    matrix_data = np.zeros((each_block_res_number, each_block_res_number))
-                temp_matrix = matrix_data
-            elif matrix_data.shape == (1, 1):
-                temp_matrix = np.zeros((each_block_res_number, each_block_res_number))
-            else:
-                temp_matrix = np.vstack((temp_matrix, matrix_data))
+    # slice from genome wide matrix cache
+    matrix_cache = get_matrix_cache(hic_file, resolution, "KR")
+    if matrix_cache is not None:
+        return matrix_cache.slice(0, hic_len - 1, 0, hic_len - 1)
 
-        if full_len_matrix is None:
-            full_len_matrix = temp_matrix
-        else:
-            full_len_matrix = np.hstack((full_len_matrix, temp_matrix))
-    return full_len_matrix
+    # read straw blocks into one preallocated matrix
+    return build_block_matrix(hic_matrix_opener(hic_file, resolution, "KR"), resolution,
+                              0, hic_len - 1, 0, hic_len - 1, block_bins=get_max_hic_len(resolution) // resolution)
 
 
 def get_cfg(cfg_dir, cfg_key=None):
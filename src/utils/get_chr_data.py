@@ -8,15 +8,14 @@
 @time: 3/6/23 5:20 PM
 @function: 
 """
-import json
 import math
 import os
 from collections import OrderedDict
 
 from PIL import Image
-from mmdet.apis import init_detector, inference_detector
 
 from src.assembly.asy_operate import AssemblyOperate
+from src.common.model_registry import DetectorRegistry
 from src.utils.get_cfg import get_cfg, get_hic_real_len, get_ratio
 from src.utils.logger import logger
 
@@ -200,10 +199,7 @@ def divide_chr(chr_len_txt, hic_file, assembly_file, modified_assembly_file):
             assembly_file = modified_assembly_file
 
         # find ctg
-        error_contains_ctg = asy_operate.find_site_ctg_s(assembly_file, chr_len, chr_len + 2)
-
-        # json format
-        contain_ctg = json.loads(error_contains_ctg)
+        contain_ctg = asy_operate.find_site_ctg_s(assembly_file, chr_len, chr_len + 2)
 
         # cut final insert location ctg right point
         contain_ctg_second = list(contain_ctg.keys())[0]
@@ -211,9 +207,9 @@ def divide_chr(chr_len_txt, hic_file, assembly_file, modified_assembly_file):
         second_cut_ctg = {contain_ctg_second: math.ceil(chr_len * ratio) + 1}
 
         # if boundary equal, no need to cut
-        if contain_ctg[contain_ctg_second]["start"] != chr_len:
-            # check whether the ctg is already cut
-            if "fragment" in contain_ctg_second or "debris" in contain_ctg_second:
+        if contain_ctg[contain_ctg_second].start != chr_len:
+            # cut a ctg to two ctg
+            if asy_operate.is_fragment(contain_ctg_second):  # check whether the ctg is already cut
                 asy_operate.re_cut_ctg_s(assembly_file, second_cut_ctg, modified_assembly_file)
             else:
                 asy_operate.cut_ctg_s(assembly_file, second_cut_ctg, modified_assembly_file)
@@ -223,10 +219,7 @@ def divide_chr(chr_len_txt, hic_file, assembly_file, modified_assembly_file):
     chr_cut_ctg_order = []
     for chr_len in chr_len_list:
         # find ctg
-        error_contains_ctg = asy_operate.find_site_ctg_s(modified_assembly_file, chr_len, chr_len + 2)
-
-        # json format
-        contain_ctg = json.loads(error_contains_ctg)
+        contain_ctg = asy_operate.find_site_ctg_s(modified_assembly_file, chr_len, chr_len + 2)
 
         # cut final insert location ctg right point
         contain_ctg_second = list(contain_ctg.keys())[0]
@@ -288,7 +281,7 @@ def divide_chr(chr_len_txt, hic_file, assembly_file, modified_assembly_file):
     logger.info("Get ctg_s information done \n")
 
 
-def split_chr(img_file, asy_file, hic_file, cfg_file, device='cpu'):
+def split_chr(img_file, asy_file, hic_file, cfg_file, device='cpu', detector=None):
     """
     Split chromosome from image
     Args:
@@ -297,6 +290,7 @@ def split_chr(img_file, asy_file, hic_file, cfg_file, device='cpu'):
         hic_file: hic file
         cfg_file: config file
         device: device GPU or CPU
+        detector: loaded chromosome detector from DetectorRegistry
 
     Returns:
 
@@ -305,10 +299,16 @@ def split_chr(img_file, asy_file, hic_file, cfg_file, device='cpu'):
     cfg_data = get_cfg(cfg_file)
 
     # infer png
-    config_file = os.path.join(cfg_data["AutoHiC_DIR"], "src/models/cfgs/chr_model.py")
-    checkpoint_file = cfg_data["CHR_PRETRAINED_MODEL"]
-    model = init_detector(config_file, checkpoint_file, device=device)
-    result = inference_detector(model, img_file)
+    if detector is None:
+        config_file = os.path.join(cfg_data["AutoHiC_DIR"], "src/models/cfgs/chr_model.py")
+        registry = DetectorRegistry(device, cfg_data.get("CPU_PRECISION", "fp32"),
+                                    server=cfg_data.get("DETECTOR_SERVER"),
+                                    cpu_channels_last=cfg_data.get("CPU_CHANNELS_LAST", "False") == "True")
+        # TorchScript runtime from export_model.py is used when it is given
+        registry.register("chromosome", config_file, cfg_data["CHR_PRETRAINED_MODEL"],
+                          cfg_data.get("CHR_RUNTIME_MODEL"))
+        detector = registry.get("chromosome")
+    [(_, result)] = list(detector.detect([(img_file, img_file)]))
 
     hic_len = get_hic_real_len(hic_file, asy_file)
 
@@ -14,11 +14,74 @@ import hicstraw
 import numpy as np
 from matplotlib import pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap
+from scipy import sparse
 
-from src.utils.get_cfg import get_max_hic_len, get_hic_real_len
+from src.common.contact_source import ContactSource
+from src.common.hic_adv_model import get_hic_file
+from src.utils.get_cfg import get_hic_real_len
 from src.utils.logger import logger
 
 
+def sum_bins(matrix, factor):
+    """
+        downsample sparse matrix by summing factor x factor blocks
+    Args:
+        matrix: scipy sparse matrix
+        factor: bins summed in each direction
+
+    Returns:
+        scipy CSR matrix
+    """
+    if factor <= 1:
+        return sparse.csr_matrix(matrix)
+
+    def block_sum(size):
+        index = np.arange(size)
+        return sparse.csr_matrix((np.ones(size, dtype=np.float32), (index // factor, index)),
+                                 shape=(-(-size // factor), size))
+
+    return block_sum(matrix.shape[0]) @ matrix @ block_sum(matrix.shape[1]).T
+
+
+def get_overview_matrix(hic_file, hic_len, resolution=None, norm="NONE", max_pixels=1400):
+    """
+        whole genome contact matrix no larger than max_pixels x max_pixels
+    Args:
+        hic_file: hic file path
+        hic_len: hic visualize length
+        resolution: hic resolution (default: choose from hic file)
+        norm: normalization method
+        max_pixels: max matrix size (bins)
+
+    Returns:
+        (dense matrix, resolution)
+    """
+    resolutions = get_hic_file(hic_file).getResolutions()
+
+    # finest resolution whose whole matrix fits, no empty bin removal
+    fit_resolutions = [res for res in resolutions if res * max_pixels > hic_len]
+    if fit_resolutions and (resolution is None or resolution * max_pixels > hic_len):
+        resolution = min(fit_resolutions)
+        logger.info("Get contact matrix use resolution is %s\n" % resolution)
+        return ContactSource.from_hic(hic_file, resolution, 0, hic_len, 0, hic_len, norm).toarray(), resolution
+
+    if resolution is None:
+        resolution = max(resolutions)
+    logger.info("Resolution max length less than hic length, use resolution %s\n" % resolution)
+
+    # sparse contacts, sliced from genome wide matrix cache when the resolution fits in it
+    contacts = ContactSource.from_hic(hic_file, resolution, 0, hic_len, 0, hic_len, norm)
+
+    # remove all zero row and column
+    matrix = contacts.select(contacts.nonempty_rows(), contacts.nonempty_cols())
+
+    # sum bins down to max_pixels, densify only the overview
+    factor = -(-max(matrix.shape) // max_pixels)
+    if factor > 1:
+        logger.info("Sum %s x %s bins of each overview pixel\n" % (factor, factor))
+    return sum_bins(matrix, factor).toarray(), resolution
+
+
 def plot_chr_inter(hic_file, asy_file=None, out_path=None, maxcolor=None, color_percent=95, figure_size=(10, 10),
                    dpi=300,
                    fig_format="png"):
@@ -40,52 +103,8 @@ def plot_chr_inter(hic_file, asy_file=None, out_path=None, maxcolor=None, color_
             hic_len = chrom.length
     logger.info("hic file full length is %s \n" % hic_len)
 
-    resolution = hic.getResolutions()[0]
-    # get interaction matrix object
-    matrix_object_chr = hic.getMatrixZoomData('assembly', 'assembly', "observed", "NONE", "BP", resolution)
-
-    # resolution max length and width
-    res_max_len = get_max_hic_len(resolution)
-
-    # check if you need to cut matrix
-    if res_max_len > hic_len:
-        logger.info("Resolution max length bigger than hic length \n")
-        for res in hic.getResolutions():
-            if get_max_hic_len(res) > hic_len:
-                resolution = res
-                continue
-        logger.info("Get contact matrix use resolution is %s\n" % resolution)
-        # get new interaction matrix object
-        matrix_object_chr = hic.getMatrixZoomData('assembly', 'assembly', "observed", "NONE", "BP", resolution)
-        numpy_matrix_chr = matrix_object_chr.getRecordsAsMatrix(0, hic_len, 0, hic_len)
-    else:
-        logger.info("Resolution max length less than hic length, use max resolution")
-
-        # cut matrix
-        block_num = int(hic_len / res_max_len) + 1
-        iter_len = np.linspace(0, hic_len, block_num + 1)
-        incr_distance = iter_len[1]
-        final_matrix = None
-        for i in iter_len[1:]:
-            temp_matrix = None
-            for j in iter_len[1:]:
-
-                numpy_matrix_chr = matrix_object_chr.getRecordsAsMatrix(int(i - incr_distance), int(i),
-                                                                        int(j - incr_distance), int(j))
-                if not np.any(temp_matrix):
-                    temp_matrix = numpy_matrix_chr
-                else:
-                    temp_matrix = np.hstack((temp_matrix, numpy_matrix_chr))
-
-            if not np.any(final_matrix):
-                final_matrix = temp_matrix
-            else:
-                final_matrix = np.vstack((final_matrix, temp_matrix))
-
-        # remove all zero row
-        not_row = final_matrix[[not np.all(final_matrix[i] == 0) for i in range(final_matrix.shape[0])], :]
-        # remove all zero column
-        numpy_matrix_chr = not_row[:, [not np.all(not_row[:, i] == 0) for i in range(not_row.shape[1])]]
+    # whole genome overview, at most 1400 x 1400 bins
+    numpy_matrix_chr, resolution = get_overview_matrix(hic_file, hic_len, norm="NONE")
 
     if maxcolor is None:
         maxcolor = (np.percentile(numpy_matrix_chr, color_percent))
@@ -144,51 +163,8 @@ def plot_chr(hic_file, genome_name=None, chr_len_file=None, hic_len=None, maxcol
             hic_len = chr_len_list[-1]
             logger.info("hic file full length is %s \n" % hic_len)
 
-    # get interaction matrix object
-    matrix_object_chr = hic.getMatrixZoomData('assembly', 'assembly', "observed", nor_method, "BP", resolution)
-
-    # resolution max length and width
-    res_max_len = get_max_hic_len(resolution)
-
-    # check if you need to cut matrix
-    if res_max_len > hic_len:
-        logger.info("Resolution max length bigger than hic length \n")
-        for res in hic.getResolutions():
-            if get_max_hic_len(res) > hic_len:
-                resolution = res
-                continue
-        logger.info("Get contact matrix use resolution is %s\n" % resolution)
-        # get new interaction matrix object
-        matrix_object_chr = hic.getMatrixZoomData('assembly', 'assembly', "observed", nor_method, "BP", resolution)
-        numpy_matrix_chr = matrix_object_chr.getRecordsAsMatrix(0, hic_len, 0, hic_len)
-    else:
-        logger.info("Resolution max length less than hic length, use max resolution")
-
-        # cut matrix
-        block_num = int(hic_len / res_max_len) + 1
-        iter_len = np.linspace(0, hic_len, block_num + 1)
-        incr_distance = iter_len[1]
-        final_matrix = None
-        for i in iter_len[1:]:
-            temp_matrix = None
-            for j in iter_len[1:]:
-
-                numpy_matrix_chr = matrix_object_chr.getRecordsAsMatrix(int(i - incr_distance), int(i),
-                                                                        int(j - incr_distance), int(j))
-                if not np.any(temp_matrix):
-                    temp_matrix = numpy_matrix_chr
-                else:
-                    temp_matrix = np.hstack((temp_matrix, numpy_matrix_chr))
-
-            if not np.any(final_matrix):
-                final_matrix = temp_matrix
-            else:
-                final_matrix = np.vstack((final_matrix, temp_matrix))
-
-        # remove all zero row
-        not_row = final_matrix[[not np.all(final_matrix[i] == 0) for i in range(final_matrix.shape[0])], :]
-        # remove all zero column
-        numpy_matrix_chr = not_row[:, [not np.all(not_row[:, i] == 0) for i in range(not_row.shape[1])]]
+    # whole genome overview, at most 1400 x 1400 bins
+    numpy_matrix_chr, resolution = get_overview_matrix(hic_file, hic_len, resolution, nor_method)
 
     # matrix flip
     dense_matrix = np.flipud(numpy_matrix_chr)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+"""
+@author: jzj
+@contact: jzjlab@163.com
+@file: stage_runner.py
+@time: 10/17/26 6:10 PM
+@function: run pipeline stages in order, skip stages recorded as complete in a content hash manifest
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from src.utils.logger import logger
+
+MANIFEST_NAME = "autohic_stages.json"
+FOLDER_CONTENT_FILES = ("info.txt",)  # files of a folder fingerprinted by content, the others by size and mtime
+
+
+class StageRunner:
+    """
+        Pipeline stages with declared inputs and outputs. A stage is skipped when its params, input hashes and
+        output hashes match the manifest; once one stage runs, every later stage runs too. Independent stages may
+        run in threads, the manifest is only accessed under a lock.
+    """
+
+    def __init__(self, work_dir, resume=True):
+        """
+        Args:
+            work_dir: folder of manifest file
+            resume: skip completed stages (False: run every stage again)
+        """
+        os.makedirs(work_dir, exist_ok=True)
+        self.manifest_path = os.path.join(work_dir, MANIFEST_NAME)
+        self.invalid = not resume  # a stage already ran in this run
+        self.lock = threading.RLock()
+
+        # stages: {name: record}, files: {path: [size, mtime, sha1]} to skip hashing unchanged files (not in folders)
+        self.manifest = {"stages": {}, "files": {}}
+        if resume and os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                self.manifest = json.load(f)
+            logger.info("Resume from stage manifest: %s\n" % self.manifest_path)
+
+    def save(self):
+        """
+            write manifest, replace the old one atomically
+        Returns:
+            None
+        """
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, separators=(",", ":"))
+        os.replace(tmp_path, self.manifest_path)
+
+    def file_hash(self, path):
+        """
+            sha1 of file content, or fingerprint of a folder, None when path does not exist
+        Args:
+            path: file or folder path
+
+        Returns:
+            hex digest
+        """
+        if os.path.isdir(path):
+            return self.folder_hash(path)
+
+        if not os.path.exists(path):
+            return None
+
+        stat = os.stat(path)
+        cached = self.manifest["files"].get(path)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha1.update(chunk)
+        self.manifest["files"][path] = [stat.st_size, stat.st_mtime_ns, sha1.hexdigest()]
+        return sha1.hexdigest()
+
+    def folder_hash(self, path):
+        """
+            fingerprint of a folder (eg: thousands of tiles): names, sizes and mtimes of its files,
+            content of FOLDER_CONTENT_FILES
+        Args:
+            path: folder path
+
+        Returns:
+            hex digest
+        """
+        sha1 = hashlib.sha1()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                sha1.update(os.path.relpath(file_path, path).encode())
+                if name in FOLDER_CONTENT_FILES:
+                    sha1.update(str(self.file_hash(file_path)).encode())
+                    continue
+                self.manifest["files"].pop(file_path, None)  # per-file record of older manifests
+                stat = os.stat(file_path)
+                sha1.update(("%s:%s" % (stat.st_size, stat.st_mtime_ns)).encode())
+        return sha1.hexdigest()
+
+    def digest(self, paths):
+        """
+            hashes of paths
+        Args:
+            paths: file or folder paths
+
+        Returns:
+            {path: hex digest}
+        """
+        return {path: self.file_hash(path) for path in paths}
+
+    def is_complete(self, name, inputs, outputs, params):
+        """
+            check whether stage is recorded with the same params, inputs and outputs
+        Args:
+            name: stage name
+            inputs: input paths
+            outputs: output paths
+            params: stage params
+
+        Returns:
+            True or False
+        """
+        record = self.manifest["stages"].get(name)
+        if record is None or record["params"] != params:
+            return False
+        if record["inputs"] != self.digest(inputs):
+            return False
+        output_hashes = self.digest(outputs)
+        return None not in output_hashes.values() and record["outputs"] == output_hashes
+
+    def run(self, name, func, inputs=(), outputs=(), params=None, clean=(), invalidate=True):
+        """
+            run stage, or return the recorded result when it is complete
+        Args:
+            name: stage name
+            func: stage function without arguments, returns a json serializable result
+            inputs: input file or folder paths
+            outputs: output file or folder paths
+            params: json serializable params of the stage
+            clean: paths removed before the stage runs again
+            invalidate: a rerun of this stage reruns every later stage (False: later stages only use its outputs
+                through their declared inputs, eg: stages run ahead in threads)
+
+        Returns:
+            stage result
+        """
+        params = json.loads(json.dumps(params or {}))
+
+        with self.lock:
+            if not self.invalid and self.is_complete(name, inputs, outputs, params):
+                logger.info("Stage %s is complete, skip\n" % name)
+                return self.manifest["stages"][name]["result"]
+
+            # this stage and every later stage run again
+            self.invalid = self.invalid or invalidate
+            self.manifest["stages"].pop(name, None)
+            self.save()
+
+        for path in clean:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            elif os.path.lexists(path):
+                os.remove(path)
+
+        logger.info("Stage %s start\n" % name)
+        result = func()
+
+        result = json.loads(json.dumps(result))  # same result type when the stage is skipped
+
+        with self.lock:
+            output_hashes = self.digest(outputs)
+            missing = [path for path, value in output_hashes.items() if value is None]
+            if missing:
+                logger.warning("Stage %s did not create %s, it will run again next time\n" % (name, missing))
+            else:
+                self.manifest["stages"][name] = {
+                    "params": params,
+                    "inputs": self.digest(inputs),
+                    "outputs": output_hashes,
+                    "result": result
+                }
+            self.save()
+        logger.info("Stage %s finished\n" % name)
+        return result
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()